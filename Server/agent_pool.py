@@ -0,0 +1,163 @@
+# agent_pool.py
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable
+
+from ..lib.agent_session import AgentSession
+from .session_checkpoints import SessionCheckpointStore
+
+
+class AgentSessionPool:
+    """
+    A fixed set of pre-constructed Agent instances plus a table of conversation sessions.
+
+    Each request leases one idle agent, binds its session (memory + plan state) to it, and returns
+    the agent when done, so no two requests ever share an agent's mutable state. Requests that name
+    the same session are serialized by a per-session lock; requests without a session id get a
+    throwaway session. Idle sessions are dropped after `session_ttl_seconds` or once more than
+    `max_sessions` exist (least recently used first).
+
+    With a `checkpoint_store`, sessions are suspendable: a session released with a pending resume
+    (a long wait_seconds) is checkpointed and dropped from memory, and is loaded back by the next
+    request that names it.
+    """
+
+    def __init__(self, agent_factory: Callable[[], Any], size: int,
+                 session_ttl_seconds: float = 3600, max_sessions: int = 1000,
+                 checkpoint_store: SessionCheckpointStore | None = None):
+        if size < 1:
+            raise ValueError("Agent pool size must be at least 1.")
+        self.size = size
+        self.session_ttl_seconds = session_ttl_seconds
+        self.max_sessions = max_sessions
+        print(f"Pre-constructing {size} agent instance(s)...")
+        self._agents = [agent_factory() for _ in range(size)]
+        self._idle: asyncio.Queue | None = None
+        self._sessions: OrderedDict[str, AgentSession] = OrderedDict()
+        self._session_locks: dict[str, asyncio.Lock] = {}
+        self._last_used: dict[str, float] = {}
+        self.checkpoint_store = checkpoint_store
+        # Requests waiting for a session's lock; a suspended session is only evicted when there are none.
+        self._waiting: dict[str, int] = {}
+        # Sessions whose checkpoint is on disk, so it is deleted once they no longer wait for a resume.
+        self._checkpointed: set[str] = set()
+        self.suspended = 0
+
+    def warm(self):
+        """Runs the lazy one-time setup (LlamaIndex settings, embedding client) before the first request."""
+        for agent in self._agents:
+            try:
+                agent._ensure_pdf_settings_configured()
+            except Exception as e:
+                print(f"Agent pool: warm-up of '{agent.name}' skipped: {e}")
+
+    def _idle_queue(self) -> asyncio.Queue:
+        # Created lazily so it binds to the server's running event loop.
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for agent in self._agents:
+                self._idle.put_nowait(agent)
+        return self._idle
+
+    def _expire_sessions(self):
+        now = time.monotonic()
+        for session_id in list(self._sessions.keys()):
+            lock = self._session_locks.get(session_id)
+            if lock is not None and lock.locked():
+                continue
+            expired = now - self._last_used.get(session_id, now) > self.session_ttl_seconds
+            if expired or len(self._sessions) > self.max_sessions:
+                self.close_session(session_id)
+
+    def _get_or_create_session(self, session_id: str) -> AgentSession:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = AgentSession(session_id)
+            self._sessions[session_id] = session
+            self._session_locks[session_id] = asyncio.Lock()
+        self._sessions.move_to_end(session_id)
+        self._last_used[session_id] = time.monotonic()
+        return session
+
+    def close_session(self, session_id: str) -> bool:
+        """Forgets a session's memory and plan. Returns False if the session did not exist."""
+        self._session_locks.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+        return self._sessions.pop(session_id, None) is not None
+
+    async def _restore_session(self, session_id: str):
+        """Loads a suspended session from its checkpoint, if it is not in memory already."""
+        if self.checkpoint_store is None or session_id in self._sessions:
+            return
+        restored = await asyncio.to_thread(self.checkpoint_store.load, session_id)
+        if restored is not None and session_id not in self._sessions:
+            self._sessions[session_id] = restored
+            self._session_locks[session_id] = asyncio.Lock()
+            self._checkpointed.add(session_id)
+            print(f"Agent pool: session '{session_id}' restored from its checkpoint.")
+
+    async def _checkpoint_on_release(self, session: AgentSession, named: bool):
+        """Checkpoints a session that waits for a resume (evicting it when idle); forgets obsolete checkpoints."""
+        session_id = session.session_id
+        if self.checkpoint_store is None:
+            return
+        if session.resume_at is not None:
+            try:
+                await asyncio.to_thread(self.checkpoint_store.save, session)
+            except Exception as e:
+                # Kept in memory instead; the resume still finds it unless the process restarts.
+                print(f"Agent pool: could not checkpoint session '{session_id}': {e}")
+                return
+            self._checkpointed.add(session_id)
+            if named and not self._waiting.get(session_id):
+                self.close_session(session_id)
+                self.suspended += 1
+        elif session_id in self._checkpointed:
+            self._checkpointed.discard(session_id)
+            await asyncio.to_thread(self.checkpoint_store.delete, session_id)
+
+    @asynccontextmanager
+    async def acquire(self, session_id: str | None = None) -> AsyncIterator[Any]:
+        """Leases an idle agent bound to the given session (or to a fresh ephemeral one)."""
+        self._expire_sessions()
+        if session_id is None:
+            session, session_lock = AgentSession(), None
+        else:
+            await self._restore_session(session_id)
+            session = self._get_or_create_session(session_id)
+            session_lock = self._session_locks[session_id]
+        session.suspendable = self.checkpoint_store is not None
+
+        if session_lock is not None:
+            self._waiting[session_id] = self._waiting.get(session_id, 0) + 1
+            try:
+                await session_lock.acquire()
+            finally:
+                self._waiting[session_id] -= 1
+                if not self._waiting[session_id]:
+                    del self._waiting[session_id]
+        try:
+            agent = await self._idle_queue().get()
+            agent.session = session
+            try:
+                yield agent
+            finally:
+                agent.session = AgentSession()
+                self._idle_queue().put_nowait(agent)
+                await self._checkpoint_on_release(session, named=session_lock is not None)
+        finally:
+            if session_lock is not None:
+                session_lock.release()
+                if session_id in self._sessions:
+                    self._last_used[session_id] = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "agents": self.size,
+            "idle_agents": self._idle.qsize() if self._idle is not None else self.size,
+            "sessions": len(self._sessions),
+            "suspended_sessions": self.suspended,
+        }
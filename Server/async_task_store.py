@@ -0,0 +1,176 @@
+# async_task_store.py
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable
+
+from .task_store import TaskStore
+
+
+class AsyncTaskStore:
+    """
+    Async facade over a synchronous TaskStore.
+
+    Every call runs on a single dedicated I/O thread, so the event loop never blocks on disk.
+    Writes are not executed one by one: they are queued, coalesced (a later status update for the
+    same task replaces an earlier one still waiting) and flushed as one batch per `commit_delay`
+    window, which lets SqliteTaskStore commit the whole batch in one transaction (group commit).
+    Awaiting a write returns only once its batch is committed, so a caller always reads its own writes.
+    """
+
+    DEFAULT_COMMIT_DELAY_SECONDS = 0.005
+    DEFAULT_MAX_BATCH_SIZE = 256
+
+    def __init__(self, store: TaskStore, commit_delay: float = DEFAULT_COMMIT_DELAY_SECONDS,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
+        self.store = store
+        self.commit_delay = commit_delay
+        self.max_batch_size = max_batch_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-store-io")
+        # Pending writes in arrival order: (coalesce_key, method_name, args, kwargs, futures).
+        self._pending: list[list] = []
+        self._pending_by_key: dict[str, list] = {}
+        self._flush_handle: asyncio.Task | None = None
+        # True while the scheduled flush is still sleeping out its delay (it can then be cancelled safely).
+        self._flush_waiting = False
+        self._flush_lock: asyncio.Lock | None = None
+        self.batches_committed = 0
+        self.writes_committed = 0
+
+    async def run_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs an arbitrary blocking store call on the I/O thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    # --- Writes (batched) ---
+    def _enqueue_write(self, coalesce_key: str | None, method_name: str, args: tuple, kwargs: dict) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        existing = self._pending_by_key.get(coalesce_key) if coalesce_key else None
+        if existing is not None:
+            # Last write wins; earlier waiters are released together with it.
+            existing[1], existing[2], existing[3] = method_name, args, kwargs
+            existing[4].append(future)
+        else:
+            entry = [coalesce_key, method_name, args, kwargs, [future]]
+            self._pending.append(entry)
+            if coalesce_key:
+                self._pending_by_key[coalesce_key] = entry
+        if len(self._pending) >= self.max_batch_size:
+            self._schedule_flush(delay=0)
+        else:
+            self._schedule_flush(delay=self.commit_delay)
+        return future
+
+    def _schedule_flush(self, delay: float):
+        if self._flush_handle is not None and not self._flush_handle.done():
+            if delay > 0 or not self._flush_waiting:
+                return
+            # A full batch must not wait out the delay of the flush already scheduled.
+            self._flush_handle.cancel()
+        self._flush_waiting = delay > 0
+        self._flush_handle = asyncio.create_task(self._delayed_flush(delay))
+
+    async def _delayed_flush(self, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._flush_waiting = False
+        await self.flush()
+
+    async def flush(self):
+        """Commits every pending write now."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:len(batch)]
+                for entry in batch:
+                    if entry[0]:
+                        self._pending_by_key.pop(entry[0], None)
+                await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: list[list]):
+        writes = [(method_name, args, kwargs) for _, method_name, args, kwargs, _ in batch]
+        try:
+            await self.run_sync(self.store.apply_writes, writes)
+            outcomes = [None] * len(batch)
+        except Exception as batch_error:
+            if len(batch) == 1:
+                outcomes = [batch_error]
+            else:
+                # One bad write must not fail its neighbours: retry them individually.
+                outcomes = []
+                for write in writes:
+                    try:
+                        await self.run_sync(self.store.apply_writes, [write])
+                        outcomes.append(None)
+                    except Exception as e:
+                        outcomes.append(e)
+        self.batches_committed += 1
+        self.writes_committed += sum(1 for outcome in outcomes if outcome is None)
+        for entry, outcome in zip(batch, outcomes):
+            for future in entry[4]:
+                if future.done():
+                    continue
+                if outcome is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(outcome)
+
+    async def add_task(self, task_id: str, prompt: str, scheduled_time: datetime, session_id: str = ""):
+        await self._enqueue_write(None, "add_task", (task_id, prompt, scheduled_time), {"session_id": session_id})
+
+    async def update_final_status(self, task_id: str, final_status: str, result: str = "", error_message: str = "",
+                                  worker_id: str | None = None, result_hash: str = "", result_size: int = 0):
+        await self._enqueue_write(f"status:{task_id}", "update_final_status", (task_id, final_status),
+                                  {"result": result, "error_message": error_message, "worker_id": worker_id,
+                                   "result_hash": result_hash, "result_size": result_size})
+
+    # --- Reads and claims ---
+    async def initialize(self):
+        await self.run_sync(self.store.initialize)
+
+    async def get_task(self, task_id: str) -> dict | None:
+        return await self.run_sync(self.store.get_task, task_id)
+
+    async def list_tasks(self) -> list[dict]:
+        return await self.run_sync(self.store.list_tasks)
+
+    async def claim_due_tasks(self, now: datetime, limit: int | None = None, **lease_kwargs) -> list[dict]:
+        return await self.run_sync(self.store.claim_due_tasks, now, limit, **lease_kwargs)
+
+    async def renew_leases(self, worker_id: str, task_ids: list[str], now: datetime, **lease_kwargs) -> list[str]:
+        return await self.run_sync(self.store.renew_leases, worker_id, task_ids, now, **lease_kwargs)
+
+    async def next_scheduled_time(self, worker_id: str = "") -> datetime | None:
+        return await self.run_sync(self.store.next_scheduled_time, worker_id)
+
+    async def query_tasks(self, **kwargs) -> tuple[list[dict], str | None]:
+        return await self.run_sync(lambda: self.store.query_tasks(**kwargs))
+
+    async def add_schedule(self, schedule_id: str, prompt: str, first_fire: datetime,
+                           cron_expression: str | None = None, interval_seconds: int | None = None):
+        await self.run_sync(self.store.add_schedule, schedule_id, prompt, first_fire,
+                            cron_expression=cron_expression, interval_seconds=interval_seconds)
+
+    async def list_schedules(self) -> list[dict]:
+        return await self.run_sync(self.store.list_schedules)
+
+    async def delete_schedule(self, schedule_id: str) -> bool:
+        return await self.run_sync(self.store.delete_schedule, schedule_id)
+
+    async def materialize_due_schedules(self, now: datetime) -> list[dict]:
+        return await self.run_sync(self.store.materialize_due_schedules, now)
+
+    async def close(self):
+        await self.flush()
+        await self.run_sync(self.store.close)
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending_writes": len(self._pending),
+            "batches_committed": self.batches_committed,
+            "writes_committed": self.writes_committed,
+        }
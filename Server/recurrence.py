@@ -0,0 +1,108 @@
+# recurrence.py
+
+from datetime import datetime, timedelta, timezone
+
+# (name, minimum, maximum) for the five standard cron fields.
+_CRON_FIELDS = [
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day of month", 1, 31),
+    ("month", 1, 12),
+    ("day of week", 0, 7),  # 0 and 7 are both Sunday
+]
+# Searching further than this means the expression can never fire (e.g. "0 0 31 2 *").
+_MAX_SEARCH = timedelta(days=366 * 5)
+
+
+def _parse_cron_field(text: str, name: str, minimum: int, maximum: int) -> set[int]:
+    values: set[int] = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid step in cron {name} field: '{text}'.")
+        if part == "*":
+            start, end = minimum, maximum
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = maximum if step > 1 else start
+        if start < minimum or end > maximum or start > end:
+            raise ValueError(f"Cron {name} field '{text}' is outside {minimum}-{maximum}.")
+        values.update(range(start, end + 1, step))
+    if name == "day of week":
+        values = {0 if value == 7 else value for value in values}
+    return values
+
+
+class CronExpression:
+    """
+    Standard five-field cron expression ("minute hour day-of-month month day-of-week"), evaluated in UTC.
+    Supports '*', lists, ranges and steps. As in cron, when both day fields are restricted a day matches
+    if either of them does.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' must have exactly 5 fields.")
+        self.expression = expression
+        try:
+            parsed = [_parse_cron_field(text, *spec) for text, spec in zip(fields, _CRON_FIELDS)]
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression '{expression}': {e}")
+        self.minutes, self.hours, self.days_of_month, self.months, self.days_of_week = parsed
+        # As in cron, a day field starting with '*' (e.g. "*/2") does not count as restricted.
+        self._dom_restricted = not fields[2].startswith("*")
+        self._dow_restricted = not fields[4].startswith("*")
+
+    def _day_matches(self, moment: datetime) -> bool:
+        dom_ok = moment.day in self.days_of_month
+        dow_ok = (moment.isoweekday() % 7) in self.days_of_week
+        if self._dom_restricted and self._dow_restricted:
+            return dom_ok or dow_ok
+        return dom_ok and dow_ok
+
+    def next_after(self, after: datetime) -> datetime:
+        """First matching minute strictly after `after`."""
+        moment = after.astimezone(timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + _MAX_SEARCH
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression '{self.expression}' never fires.")
+
+
+def validate_recurrence(cron_expression: str | None, interval_seconds: int | None):
+    """Raises ValueError unless exactly one valid recurrence rule is given."""
+    if bool(cron_expression) == bool(interval_seconds):
+        raise ValueError("Provide exactly one of a cron expression or an interval in seconds.")
+    if cron_expression:
+        CronExpression(cron_expression)
+    elif interval_seconds < 1:
+        raise ValueError("interval_seconds must be a positive number of seconds.")
+
+
+def next_fire_time(cron_expression: str | None, interval_seconds: int | None,
+                   previous_fire: datetime, now: datetime) -> datetime:
+    """
+    Next firing strictly after `now`, anchored on `previous_fire` so interval schedules don't drift
+    with execution time. Occurrences missed while the server was down are skipped, not replayed.
+    """
+    if cron_expression:
+        return CronExpression(cron_expression).next_after(max(previous_fire, now))
+    interval = timedelta(seconds=interval_seconds)
+    missed = max(0, int((now - previous_fire) / interval))
+    return previous_fire + interval * (missed + 1)
@@ -0,0 +1,142 @@
+# result_store.py
+
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Iterator
+
+DEFAULT_MAX_TOTAL_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class ResultStore:
+    """
+    Content-addressed, gzip-compressed blob store for task results.
+
+    A result is stored once under the SHA-256 of its text (identical outputs share one blob), so the
+    task table only has to keep the hash and the uncompressed size. Blobs are evicted once they are
+    older than `max_age_seconds` or, oldest first, while the compressed total exceeds `max_total_bytes`.
+    Storing an existing blob again refreshes its age.
+    """
+
+    def __init__(self, directory: str, max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        self.directory = directory
+        self.max_total_bytes = max_total_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._total_bytes: int | None = None
+        self.evicted = 0
+
+    def _path(self, result_hash: str) -> str:
+        if len(result_hash) != 64 or any(c not in "0123456789abcdef" for c in result_hash):
+            raise ValueError(f"Invalid result hash '{result_hash}'.")
+        return os.path.join(self.directory, result_hash[:2], f"{result_hash}.gz")
+
+    def _blobs(self) -> list[tuple[float, int, str]]:
+        """(mtime, compressed size, path) of every stored blob."""
+        blobs = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".gz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, path))
+        return blobs
+
+    def put(self, text: str) -> tuple[str, int]:
+        """Stores `text` and returns (hash, uncompressed size in bytes)."""
+        data = text.encode("utf-8")
+        result_hash = hashlib.sha256(data).hexdigest()
+        path = self._path(result_hash)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._blobs())
+            if os.path.exists(path):
+                os.utime(path)
+                return result_hash, len(data)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so readers never see a partial blob.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(gzip.compress(data, compresslevel=6))
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._total_bytes += os.path.getsize(path)
+            over_budget = self._total_bytes > self.max_total_bytes
+        if over_budget:
+            self.evict()
+        return result_hash, len(data)
+
+    def exists(self, result_hash: str) -> bool:
+        return os.path.exists(self._path(result_hash))
+
+    def get(self, result_hash: str) -> str | None:
+        """Returns the whole result, or None if it was never stored or has been evicted."""
+        try:
+            with gzip.open(self._path(result_hash), "rb") as f:
+                return f.read().decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def fill_results(self, tasks: list[dict]) -> list[dict]:
+        """
+        Puts the stored text back into the 'result' field of task rows that only carry a result_hash.
+        Rows whose result has been evicted keep an empty result. Returns `tasks`.
+        """
+        for task in tasks:
+            if task.get('result_hash') and not task.get('result'):
+                task['result'] = self.get(task['result_hash']) or ""
+        return tasks
+
+    def iter_chunks(self, result_hash: str, chunk_size: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+        """Yields the decompressed result piece by piece, so large results are never held in memory."""
+        with gzip.open(self._path(result_hash), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def evict(self) -> int:
+        """Removes expired blobs, then the oldest ones until the size budget is met. Returns the number removed."""
+        with self._lock:
+            blobs = sorted(self._blobs())
+            cutoff = time.time() - self.max_age_seconds
+            total = sum(size for _, size, _ in blobs)
+            removed = 0
+            for mtime, size, path in blobs:
+                if mtime >= cutoff and total <= self.max_total_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self._total_bytes = total
+            self.evicted += removed
+        if removed:
+            print(f"Result store: evicted {removed} result(s); {total} compressed bytes remain.")
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "total_compressed_bytes": self._total_bytes,
+            "max_total_bytes": self.max_total_bytes,
+            "max_age_seconds": self.max_age_seconds,
+            "evicted": self.evicted,
+        }
@@ -1,11 +1,13 @@
 # server.py
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field  # Keep Pydantic models top-level
 import uvicorn
 import asyncio
-import csv
+import json
 import os
+import socket
 from datetime import datetime, timezone, timedelta
 import uuid
 from contextlib import asynccontextmanager
@@ -15,11 +17,16 @@ from typing import Any, Dict, Callable, Awaitable  # For type hints
 # --- Pydantic Models (remain top-level) ---
 class TaskRequest(BaseModel):
     prompt: str
+    session_id: str | None = Field(None, description="Conversation to continue. Omit for a one-off request.")
 
 
 class ScheduleTaskRequest(BaseModel):
     prompt: str
-    scheduled_time: datetime = Field(..., description="Scheduled execution time in ISO 8601 format.")
+    scheduled_time: datetime | None = Field(
+        None, description="Scheduled execution time in ISO 8601 format. For recurring schedules, the first firing "
+                          "(defaults to the first occurrence after now).")
+    cron: str | None = Field(None, description="Five-field cron expression (UTC) for a recurring schedule.")
+    interval_seconds: int | None = Field(None, description="Fixed interval for a recurring schedule.")
 
 
 class AgentResponse(BaseModel):
@@ -27,29 +34,99 @@ class AgentResponse(BaseModel):
     message: str
     agent_output: str | None = None
     task_id: str | None = None
+    session_id: str | None = None
+    schedule_id: str | None = None
+
+
+class TaskPage(BaseModel):
+    tasks: list[dict]
+    next_cursor: str | None = Field(None, description="Pass as 'cursor' to fetch the next page; null on the last page.")
 
 
 # --- Agent Import ---
 # Attempt to import the real Agent, provide a more functional dummy if it fails.
 from ..lib.agent import Agent as ActualAgent
+from ..lib.rate_limiter import rate_limiter_stats
+from ..lib.llm_cache import llm_cache_stats
+from ..lib.context_cache import context_cache_stats
+from ..lib.query_engine_cache import QueryEngineCache
+from ..lib.api_wrappers import deadline_scope, stream_stats, hedging_stats
+from .task_store import TaskStore, SqliteTaskStore, to_utc_iso, DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS
+from .recurrence import validate_recurrence, next_fire_time
+from .async_task_store import AsyncTaskStore
+from .result_store import ResultStore, DEFAULT_MAX_TOTAL_BYTES, DEFAULT_MAX_AGE_SECONDS
+from ..lib.metrics import LatencyRecorder
+from .worker_pool import AgentWorkerPool, PoolSaturatedError
+from .agent_pool import AgentSessionPool
+from .session_checkpoints import SessionCheckpointStore, DEFAULT_CHECKPOINT_DIR
 AgentType = ActualAgent  # Use this type hint
 
 
 class ApiServer:
     # --- Default Configurations ---
     DEFAULT_CSV_FILE_PATH = "scheduled_tasks.csv"
-    CSV_HEADERS = ["id", "prompt", "scheduled_time_iso", "status", "created_at_iso", "result", "error_message"]
+    DEFAULT_DB_FILE_PATH = "scheduled_tasks.db"
     DEFAULT_SCHEDULER_INTERVAL_SECONDS = 30
+    DEFAULT_MAX_CONCURRENT_TASKS = 4
+    DEFAULT_MAX_QUEUED_TASKS = 32
+    DEFAULT_SESSION_TTL_SECONDS = 3600
+    DEFAULT_TASK_LEASE_SECONDS = DEFAULT_LEASE_SECONDS
+    DEFAULT_TASK_MAX_ATTEMPTS = DEFAULT_MAX_ATTEMPTS
+    DEFAULT_REQUEST_TIMEOUT_SECONDS = 600
+    DEFAULT_RESULT_STORE_DIR = "task_results"
+    DEFAULT_RESULT_EVICTION_INTERVAL_SECONDS = 600
+    DEFAULT_SESSION_CHECKPOINT_DIR = DEFAULT_CHECKPOINT_DIR
+    # Prompt of the task that resumes a session suspended by a long wait_seconds call.
+    RESUME_PROMPT = ("[Automatic resume] The wait of {seconds} seconds you requested with wait_seconds is over. "
+                     "Continue the task you were working on.")
 
     def __init__(self,
                  agent_class: type[AgentType] = ActualAgent,
                  agent_verbose: bool = True,
                  csv_file_path: str = DEFAULT_CSV_FILE_PATH,
-                 scheduler_interval: int = DEFAULT_SCHEDULER_INTERVAL_SECONDS
+                 scheduler_interval: int = DEFAULT_SCHEDULER_INTERVAL_SECONDS,
+                 db_file_path: str = DEFAULT_DB_FILE_PATH,
+                 task_store: TaskStore | None = None,
+                 max_concurrent_tasks: int = DEFAULT_MAX_CONCURRENT_TASKS,
+                 max_queued_tasks: int = DEFAULT_MAX_QUEUED_TASKS,
+                 session_ttl_seconds: int = DEFAULT_SESSION_TTL_SECONDS,
+                 task_lease_seconds: float = DEFAULT_TASK_LEASE_SECONDS,
+                 task_max_attempts: int = DEFAULT_TASK_MAX_ATTEMPTS,
+                 request_timeout_seconds: float | None = DEFAULT_REQUEST_TIMEOUT_SECONDS,
+                 result_store_dir: str = DEFAULT_RESULT_STORE_DIR,
+                 result_store_max_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
+                 result_store_max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+                 session_checkpoint_dir: str = DEFAULT_SESSION_CHECKPOINT_DIR
                  ):
+        # csv_file_path is the legacy task file; when present it is imported once into the SQLite store.
         self.csv_file_path = csv_file_path
+        # All persistence goes through the async facade: blocking I/O runs on its own thread with group commit.
+        self.task_store = AsyncTaskStore(task_store or SqliteTaskStore(db_file_path))
+        # Task outputs are kept out of the task table; rows only reference them by hash.
+        self.result_store = ResultStore(result_store_dir, max_total_bytes=result_store_max_bytes,
+                                        max_age_seconds=result_store_max_age_seconds)
         self.scheduler_interval = scheduler_interval
         self.scheduler_task_handle: asyncio.Task | None = None
+        self.heartbeat_task_handle: asyncio.Task | None = None
+        self.result_eviction_task_handle: asyncio.Task | None = None
+        # Identifies this process when claiming tasks, so several workers/nodes can share one task store.
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.task_lease_seconds = task_lease_seconds
+        # Time budget of one agent run; LLM calls and their retries inside it give up once it is spent.
+        self.request_timeout_seconds = request_timeout_seconds
+        self.task_max_attempts = task_max_attempts
+        # Tasks this worker has claimed and not yet finished; their leases are renewed by the heartbeat.
+        self._leased_task_ids: set[str] = set()
+        self._scheduler_wakeup = asyncio.Event()
+        self._next_deadline: datetime | None = None
+        # Actual start time minus scheduled time for every task the scheduler dispatches.
+        self.scheduling_lag = LatencyRecorder()
+        # Every agent run (HTTP or scheduled) goes through this pool; a freed slot may let the scheduler claim more.
+        self.worker_pool = AgentWorkerPool(
+            max_concurrency=max_concurrent_tasks,
+            max_queue_size=max_queued_tasks,
+            on_slot_freed=self._scheduler_wakeup.set,
+        )
 
         # Tool registry for the agent: maps tool names to server methods
         self.tool_registry: Dict[str, Callable[..., Awaitable[Any]]] = {
@@ -57,13 +134,22 @@ class ApiServer:
             "schedule_future_prompt": self._schedule_new_prompt_tool  # New tool added here
         }
 
-        print("Initializing agent...")
-        self.agent: AgentType = agent_class(
+        # Long waits suspend the session to disk and resume it from a task, which needs a session-aware store.
+        self.session_checkpoints = (SessionCheckpointStore(session_checkpoint_dir)
+                                    if self.task_store.store.supports_session_tasks else None)
+
+        print("Initializing agent pool...")
+        # One agent per worker slot; all of them share a single bounded cache of loaded indexes.
+        self.query_engines = QueryEngineCache()
+        self.agent_pool = AgentSessionPool(
             # Ensure your ActualAgent's __init__ accepts these named arguments
-            self,
-            verbose=agent_verbose,
+            agent_factory=lambda: agent_class(self, verbose=agent_verbose, shared_query_engines=self.query_engines),
+            size=max_concurrent_tasks,
+            session_ttl_seconds=session_ttl_seconds,
+            checkpoint_store=self.session_checkpoints,
         )
-        print("Agent initialized.")
+        self.agent_pool.warm()
+        print("Agent pool initialized.")
 
         self.app = FastAPI(
             title="Agent Processing API with Scheduling (Class-based)",
@@ -78,17 +164,32 @@ class ApiServer:
         await asyncio.sleep(0.1)
         return "User responded: 'Blue is my favorite color'. (Placeholder from server)"
 
-    async def _schedule_new_prompt_tool(self, prompt: str, scheduled_time_iso: str) -> str:
+    async def _schedule_new_prompt_tool(self, prompt: str, scheduled_time_iso: str, cron_expression: str = "",
+                                        interval_seconds: int = 0) -> str:
         """
         Tool for the AI Agent to schedule a new prompt for future execution.
         Args:
             prompt: The prompt string for the new task.
             scheduled_time_iso: The scheduled time in ISO 8601 format (e.g., "2024-03-15T10:00:00Z").
+                For a recurring schedule this is the first firing and may be empty.
+            cron_expression: Optional five-field cron expression (UTC) to repeat the prompt.
+            interval_seconds: Optional fixed interval to repeat the prompt.
         Returns:
-            A dictionary with status, message, and task_id if successful.
+            A dictionary with status, message, and task_id (or schedule_id) if successful.
         """
         print(f"[Server Tool - _schedule_new_prompt_tool] Agent wants to schedule: '{prompt}' at {scheduled_time_iso}")
         try:
+            if cron_expression or interval_seconds:
+                first_fire = None
+                if scheduled_time_iso:
+                    first_fire = datetime.fromisoformat(scheduled_time_iso)
+                schedule_id, first_fire_utc = await self._add_schedule(
+                    prompt, first_fire, cron_expression or None, interval_seconds or None)
+                return str({
+                    "status": "success",
+                    "message": f"Recurring prompt scheduled; first run at {first_fire_utc.isoformat()}.",
+                    "schedule_id": schedule_id
+                })
             # Parse and validate scheduled_time
             scheduled_time = datetime.fromisoformat(scheduled_time_iso)
             if scheduled_time.tzinfo is None:  # Ensure timezone aware, assume UTC if naive
@@ -97,10 +198,10 @@ class ApiServer:
                 scheduled_time_utc = scheduled_time.astimezone(timezone.utc)
 
             if scheduled_time_utc <= datetime.now(timezone.utc):
-                return {"status": "error", "message": "Scheduled time must be in the future."}
+                return str({"status": "error", "message": "Scheduled time must be in the future."})
 
             task_id = str(uuid.uuid4())
-            self._add_task_to_csv(task_id, prompt, scheduled_time_utc)  # Use existing CSV logic
+            await self._add_task(task_id, prompt, scheduled_time_utc)
             return str({
                 "status": "success",
                 "message": f"New prompt successfully scheduled for {scheduled_time_utc.isoformat()}.",
@@ -113,184 +214,337 @@ class ApiServer:
             print(f"[Server Tool Error] Failed to schedule new prompt: {e}")
             return str({"status": "error", "message": f"Failed to schedule new prompt: {str(e)}"})
 
-    # --- CSV Helper Methods (identical to before) ---
-    def _initialize_csv(self):
-        if not os.path.exists(self.csv_file_path):
-            with open(self.csv_file_path, mode='w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(self.CSV_HEADERS)
-            print(f"Initialized {self.csv_file_path}")
-
-    def _add_task_to_csv(self, task_id: str, prompt: str, scheduled_time: datetime):
-        created_at = datetime.now(timezone.utc)
-        if scheduled_time.tzinfo is None:
-            scheduled_time_utc = scheduled_time.replace(tzinfo=timezone.utc)
+    # --- Task Store Helper Methods ---
+    async def _initialize_task_store(self):
+        await self.task_store.initialize()
+        if isinstance(self.task_store.store, SqliteTaskStore) and self.csv_file_path:
+            await self.task_store.run_sync(self.task_store.store.migrate_from_csv, self.csv_file_path)
+
+    async def _add_task(self, task_id: str, prompt: str, scheduled_time: datetime):
+        await self.task_store.add_task(task_id, prompt, scheduled_time)
+        print(f"Task {task_id} added to task store for {to_utc_iso(scheduled_time)}")
+        self._notify_scheduler(scheduled_time)
+
+    async def _add_schedule(self, prompt: str, first_fire: datetime | None, cron_expression: str | None,
+                            interval_seconds: int | None) -> tuple[str, datetime]:
+        """Validates and stores a recurring schedule. Raises ValueError for invalid input."""
+        validate_recurrence(cron_expression, interval_seconds)
+        now = datetime.now(timezone.utc)
+        if first_fire is None:
+            first_fire = next_fire_time(cron_expression, interval_seconds, now, now)
+        elif first_fire.tzinfo is None:
+            first_fire = first_fire.replace(tzinfo=timezone.utc)
         else:
-            scheduled_time_utc = scheduled_time.astimezone(timezone.utc)
-
-        with open(self.csv_file_path, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                task_id, prompt, scheduled_time_utc.isoformat(), "PENDING", created_at.isoformat(), "", ""
-            ])
-        print(f"Task {task_id} added to CSV for {scheduled_time_utc.isoformat()}")
-
-    def _read_all_tasks_from_csv(self) -> list[dict]:
-        if not os.path.exists(self.csv_file_path):
-            return []
-        tasks = []
-        with open(self.csv_file_path, mode='r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                tasks.append(row)
-        return tasks
-
-    def _write_all_tasks_to_csv(self, tasks_data: list[dict]):
-        with open(self.csv_file_path, mode='w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=self.CSV_HEADERS)
-            writer.writeheader()
-            writer.writerows(tasks_data)
-
-    def _get_and_mark_due_tasks_as_running(self) -> list[dict]:
-        all_tasks = self._read_all_tasks_from_csv()
-        due_tasks_to_run = []
-        now_utc = datetime.now(timezone.utc)
-        modified = False
-
-        for task in all_tasks:
-            if task['status'] == "PENDING":
-                try:
-                    scheduled_time_utc = datetime.fromisoformat(task['scheduled_time_iso'])
-                    if scheduled_time_utc.tzinfo is None:
-                        scheduled_time_utc = scheduled_time_utc.replace(tzinfo=timezone.utc)
-                    if scheduled_time_utc <= now_utc:
-                        task['status'] = "RUNNING"
-                        due_tasks_to_run.append(dict(task))
-                        modified = True
-                        print(f"Scheduler: Marking task {task['id']} as RUNNING.")
-                except ValueError as e:
-                    print(f"Error parsing scheduled_time for task {task['id']}: {e}. Marking as FAILED.")
-                    task['status'] = "FAILED"
-                    task['error_message'] = f"Invalid scheduled_time format: {e}"
-                    modified = True
-        if modified:
-            self._write_all_tasks_to_csv(all_tasks)
+            first_fire = first_fire.astimezone(timezone.utc)
+        if first_fire <= now:
+            raise ValueError("The first run of a recurring schedule must be in the future.")
+        schedule_id = str(uuid.uuid4())
+        await self.task_store.add_schedule(schedule_id, prompt, first_fire,
+                                           cron_expression=cron_expression, interval_seconds=interval_seconds)
+        print(f"Schedule {schedule_id} added; first run at {to_utc_iso(first_fire)}")
+        self._notify_scheduler(first_fire)
+        return schedule_id, first_fire
+
+    async def _get_and_mark_due_tasks_as_running(self, limit: int | None = None) -> list[dict]:
+        due_tasks_to_run = await self.task_store.claim_due_tasks(
+            datetime.now(timezone.utc), limit=limit, worker_id=self.worker_id,
+            lease_seconds=self.task_lease_seconds, max_attempts=self.task_max_attempts,
+        )
+        for task in due_tasks_to_run:
+            self._leased_task_ids.add(task['id'])
+            print(f"Scheduler: Marking task {task['id']} as RUNNING (lease held by {self.worker_id}).")
         return due_tasks_to_run
 
-    def _update_task_final_status_in_csv(self, task_id: str, final_status: str, result: str = "",
-                                         error_message: str = ""):
-        all_tasks = self._read_all_tasks_from_csv()
-        modified = False
-        for task in all_tasks:
-            if task['id'] == task_id:
-                task['status'] = final_status
-                task['result'] = result
-                task['error_message'] = error_message
-                modified = True
-                print(f"Scheduler: Updated task {task_id} to {final_status} in CSV.")
-                break
-        if modified:
-            self._write_all_tasks_to_csv(all_tasks)
-
-    async def _run_agent_task_async(self, task_prompt: str, task_id: str | None = None) -> tuple[str, str | None]:
+    async def _update_task_final_status(self, task_id: str, final_status: str, result: str = "",
+                                        error_message: str = ""):
+        self._leased_task_ids.discard(task_id)
+        result_ref = {}
+        if result and self.task_store.store.supports_result_refs:
+            result_hash, result_size = await asyncio.to_thread(self.result_store.put, result)
+            result, result_ref = "", {"result_hash": result_hash, "result_size": result_size}
+        await self.task_store.update_final_status(task_id, final_status, result=result, error_message=error_message,
+                                                  worker_id=self.worker_id, **result_ref)
+        print(f"Scheduler: Updated task {task_id} to {final_status} in task store.")
+
+    async def _heartbeat_loop(self):
+        """Renews the leases of claimed tasks well before they expire, so other workers don't reclaim them."""
+        interval = max(1.0, self.task_lease_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            if not self._leased_task_ids:
+                continue
+            try:
+                task_ids = list(self._leased_task_ids)
+                still_owned = set(await self.task_store.renew_leases(
+                    self.worker_id, task_ids, datetime.now(timezone.utc), lease_seconds=self.task_lease_seconds,
+                ))
+                for lost_task_id in set(task_ids) - still_owned:
+                    print(f"Heartbeat: lease on task {lost_task_id} was lost; its result will be discarded.")
+                    self._leased_task_ids.discard(lost_task_id)
+            except Exception as e:
+                print(f"HEARTBEAT LOOP ERROR: {e}")
+
+    async def _result_eviction_loop(self):
+        """Applies the result store's age and size budget in the background."""
+        while True:
+            await asyncio.sleep(self.DEFAULT_RESULT_EVICTION_INTERVAL_SECONDS)
+            try:
+                await asyncio.to_thread(self.result_store.evict)
+            except Exception as e:
+                print(f"RESULT EVICTION LOOP ERROR: {e}")
+
+    async def _schedule_resume(self, session) -> dict:
+        """Queues the task that resumes a session suspended by wait_seconds, in that session."""
+        resume_task_id = str(uuid.uuid4())
+        try:
+            await self.task_store.add_task(resume_task_id, self.RESUME_PROMPT.format(seconds=session.resume_after_seconds),
+                                           session.resume_at, session_id=session.session_id)
+        except Exception:
+            # Nothing will resume it, so don't keep the session suspended.
+            session.resume_at = None
+            raise
+        print(f"Session {session.session_id} suspended; resume task {resume_task_id} at {to_utc_iso(session.resume_at)}.")
+        self._notify_scheduler(session.resume_at)
+        return {"task_id": resume_task_id, "session_id": session.session_id, "resume_at_iso": to_utc_iso(session.resume_at)}
+
+    async def _run_agent_task_async(self, task_prompt: str, task_id: str | None = None,
+                                    session_id: str | None = None,
+                                    resuming: bool = False) -> tuple[str, str | None, dict | None]:
+        """
+        Runs the prompt on a pooled agent. Returns (response, error, resume), where `resume` describes the
+        task scheduled to continue the session when the run ended with a long wait (else None).
+        """
         prefix = f"[Agent Task ID: {task_id}]" if task_id else "[Agent Task]"
         print(f"\n--- {prefix} Executing: {task_prompt} ---")
         try:
-            response = await self.agent.run(task_prompt)
+            resume = None
+            async with self.agent_pool.acquire(session_id) as agent:
+                if resuming:
+                    agent.session.resume_at = None
+                pending_resume_at = agent.session.resume_at
+                with deadline_scope(self.request_timeout_seconds):
+                    response = await agent.run(task_prompt)
+                if agent.session.resume_at is not None and agent.session.resume_at != pending_resume_at:
+                    resume = await self._schedule_resume(agent.session)
             print(f"\n--- {prefix} Finished. Response: {response} ---")
-            return response, None
+            return response, None, resume
         except Exception as e:
             error_msg = f"Error processing task: {str(e)}"
             print(f"\n--- {prefix} Error during execution: {e} ---")
-            return "", error_msg
+            return "", error_msg, None
+
+    def _notify_scheduler(self, scheduled_time: datetime):
+        """Wakes the scheduler early if a task was inserted ahead of the deadline it is sleeping towards."""
+        if self._next_deadline is None or scheduled_time < self._next_deadline:
+            self._scheduler_wakeup.set()
+
+    async def _execute_scheduled_task(self, task_id: str, prompt: str, scheduled_time_iso: str, session_id: str = ""):
+        lag_seconds = (datetime.now(timezone.utc) - datetime.fromisoformat(scheduled_time_iso)).total_seconds()
+        self.scheduling_lag.record(lag_seconds)
+        print(f"Scheduler: Task {task_id} started {lag_seconds:.3f}s after its scheduled time.")
+        # Tasks with a session resume a suspended conversation.
+        agent_response_str, error_str, _ = await self._run_agent_task_async(
+            prompt, task_id, session_id or None, resuming=bool(session_id))
+        if error_str:
+            await self._update_task_final_status(task_id, "FAILED", error_message=error_str)
+        else:
+            await self._update_task_final_status(task_id, "COMPLETED", result=agent_response_str)
+
+    async def _stream_agent_task_async(self, task_prompt: str, session_id: str | None, events: asyncio.Queue):
+        """Pool job for streaming requests: relays the agent's event stream into `events`, then a None sentinel."""
+        try:
+            async with self.agent_pool.acquire(session_id) as agent:
+                await events.put({"type": "started"})
+                pending_resume_at = agent.session.resume_at
+                with deadline_scope(self.request_timeout_seconds):
+                    async for event in agent.run_stream(task_prompt):
+                        await events.put(event)
+                if agent.session.resume_at is not None and agent.session.resume_at != pending_resume_at:
+                    await events.put({"type": "waiting", **await self._schedule_resume(agent.session)})
+        except Exception as e:
+            await events.put({"type": "error", "message": f"Error processing task: {str(e)}"})
+        finally:
+            await events.put(None)
 
     async def _scheduler_loop(self):
-        print(f"Scheduler loop started. Will check for tasks every {self.scheduler_interval} seconds.")
+        print(f"Scheduler loop started. Sleeping until the next due task (at most {self.scheduler_interval} seconds).")
         while True:
+            # Clear before reading the store, so an insert racing with this iteration still wakes the next sleep.
+            self._scheduler_wakeup.clear()
+            next_deadline = None
+            capacity = self.worker_pool.idle_capacity()
             try:
-                print(f"Scheduler: Woke up at {datetime.now(timezone.utc).isoformat()}. Checking for due tasks...")
-                due_tasks = self._get_and_mark_due_tasks_as_running()
-
-                if not due_tasks:
-                    print("Scheduler: No due tasks found this cycle.")
+                # Turn due recurring schedules into ordinary PENDING execution records first.
+                for execution in await self.task_store.materialize_due_schedules(datetime.now(timezone.utc)):
+                    print(f"Scheduler: Schedule {execution['schedule_id']} fired as task {execution['id']}; "
+                          f"next run at {execution['next_fire_iso']}.")
+                # Only claim what idle workers can start now; the rest stays PENDING (and claimable by other
+                # workers) until a worker frees up.
+                due_tasks = await self._get_and_mark_due_tasks_as_running(limit=capacity) if capacity > 0 else []
 
                 for task_data in due_tasks:
                     task_id = task_data['id']
                     prompt = task_data['prompt']
                     print(f"Scheduler: Processing due task ID {task_id}: \"{prompt[:50]}...\"")
-
-                    async def execute_and_update_scheduled_task(current_task_id, current_prompt):
-                        agent_response_str, error_str = await self._run_agent_task_async(current_prompt,
-                                                                                         current_task_id)
-                        if error_str:
-                            self._update_task_final_status_in_csv(current_task_id, "FAILED", error_message=error_str)
-                        else:
-                            self._update_task_final_status_in_csv(current_task_id, "COMPLETED",
-                                                                  result=agent_response_str)
-
-                    asyncio.create_task(execute_and_update_scheduled_task(task_id, prompt))
+                    self.worker_pool.submit(
+                        lambda t=task_data: self._execute_scheduled_task(t['id'], t['prompt'], t['scheduled_time_iso'],
+                                                                         t.get('session_id') or ""),
+                        label=task_id,
+                    )
+                next_deadline = await self.task_store.next_scheduled_time(worker_id=self.worker_id)
             except Exception as e:
                 print(f"SCHEDULER LOOP ERROR: {e}")
-            await asyncio.sleep(self.scheduler_interval)
+
+            # scheduler_interval only bounds the idle sleep, as a fallback for tasks written by other processes.
+            self._next_deadline = next_deadline
+            timeout = self.scheduler_interval
+            if next_deadline is not None and self.worker_pool.idle_capacity() > 0:
+                until_due = (next_deadline - datetime.now(timezone.utc)).total_seconds()
+                timeout = min(max(until_due, 0.0), self.scheduler_interval)
+            try:
+                await asyncio.wait_for(self._scheduler_wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
 
     @asynccontextmanager
     async def _lifespan_manager(self, app: FastAPI):
-        print("Application startup: Initializing CSV and starting scheduler...")
-        self._initialize_csv()
+        print("Application startup: Initializing task store and starting scheduler...")
+        await self._initialize_task_store()
+        await self.worker_pool.start()
         self.scheduler_task_handle = asyncio.create_task(self._scheduler_loop())
-        print("Scheduler started.")
+        self.heartbeat_task_handle = asyncio.create_task(self._heartbeat_loop())
+        self.result_eviction_task_handle = asyncio.create_task(self._result_eviction_loop())
+        print(f"Scheduler started (worker id {self.worker_id}).")
         yield
         print("Application shutdown: Stopping scheduler...")
-        if self.scheduler_task_handle:
-            self.scheduler_task_handle.cancel()
+        for handle in (self.scheduler_task_handle, self.heartbeat_task_handle, self.result_eviction_task_handle):
+            if not handle:
+                continue
+            handle.cancel()
             try:
-                await self.scheduler_task_handle
+                await handle
             except asyncio.CancelledError:
                 print("Scheduler task cancelled successfully.")
             except Exception as e:
                 print(f"Error during scheduler task cancellation: {e}")
         print("Scheduler stopped.")
+        await self.worker_pool.stop()
+        await self.task_store.close()
 
     def wait_for_input(self, prompt: str) -> str:  # This method is defined but not currently in tool_registry
         print(f"[ApiServer - wait_for_input] Received prompt: {prompt}")
         return "I have no idea. Generate some default values (from wait_for_input)"
 
+    def _submit_or_reject(self, job_factory: Callable[[], Awaitable[Any]], label: str = "") -> asyncio.Future:
+        """Submits a job to the worker pool, turning saturation into a 429 with a Retry-After hint."""
+        try:
+            return self.worker_pool.submit(job_factory, label=label)
+        except PoolSaturatedError as e:
+            print(f"[Server] Rejecting request: {e}")
+            raise HTTPException(
+                status_code=429,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after_seconds)},
+            )
+
     def _register_routes(self):
         @self.app.post("/process_task", response_model=AgentResponse)
         async def process_task_endpoint(task_request: TaskRequest):
             print(f"\n--- [Server] Received request for immediate processing: {task_request.prompt} ---")
-            agent_output_str, error_str = await self._run_agent_task_async(task_request.prompt)
+            future = self._submit_or_reject(
+                lambda: self._run_agent_task_async(task_request.prompt, session_id=task_request.session_id)
+            )
+            agent_output_str, error_str, resume = await future
             if error_str:
                 raise HTTPException(status_code=500, detail=error_str)
+            if resume:
+                return AgentResponse(
+                    status="waiting",
+                    message=f"The agent is waiting; the conversation resumes as task {resume['task_id']} "
+                            f"at {resume['resume_at_iso']}.",
+                    agent_output=agent_output_str,
+                    task_id=resume['task_id'],
+                    session_id=resume['session_id']
+                )
             return AgentResponse(
                 status="completed",
                 message="Agent processing finished.",
-                agent_output=agent_output_str
+                agent_output=agent_output_str,
+                session_id=task_request.session_id
+            )
+
+        @self.app.post("/process_task_stream")
+        async def process_task_stream_endpoint(task_request: TaskRequest):
+            """Server-Sent Events: one 'event: <type>' frame per tool call, tool result, token delta and final answer."""
+            print(f"\n--- [Server] Received streaming request: {task_request.prompt} ---")
+            events: asyncio.Queue = asyncio.Queue()
+            self._submit_or_reject(
+                lambda: self._stream_agent_task_async(task_request.prompt, task_request.session_id, events)
             )
 
+            async def sse_frames():
+                # Sent before the job is picked up so clients get their first byte immediately.
+                yield "event: queued\ndata: {}\n\n"
+                while True:
+                    event = await events.get()
+                    if event is None:
+                        break
+                    yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+            return StreamingResponse(sse_frames(), media_type="text/event-stream",
+                                     headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
         @self.app.post("/process_task_fire_and_forget", response_model=AgentResponse)
-        async def process_task_fire_and_forget_endpoint(task_request: TaskRequest, background_tasks: BackgroundTasks):
+        async def process_task_fire_and_forget_endpoint(task_request: TaskRequest):
             task_id = str(uuid.uuid4())
             print(f"\n--- [Server] Received fire-and-forget request (ID: {task_id}): {task_request.prompt} ---")
 
             async def background_wrapper(prompt, t_id):
-                agent_response, error = await self._run_agent_task_async(prompt, t_id)
+                agent_response, error, resume = await self._run_agent_task_async(prompt, t_id, task_request.session_id)
                 if error:
                     print(f"Background task {t_id} failed: {error}")
+                elif resume:
+                    print(f"Background task {t_id} is waiting; it resumes as task {resume['task_id']}.")
                 else:
                     print(f"Background task {t_id} completed. Result: {agent_response[:50]}...")
 
-            background_tasks.add_task(background_wrapper, task_request.prompt, task_id)
+            self._submit_or_reject(lambda: background_wrapper(task_request.prompt, task_id), label=task_id)
             return AgentResponse(
                 status="submitted",
                 message="Task submitted for background processing. Check server logs for completion.",
-                task_id=task_id
+                task_id=task_id,
+                session_id=task_request.session_id
             )
 
+        @self.app.delete("/sessions/{session_id}", response_model=AgentResponse)
+        async def close_session_endpoint(session_id: str):
+            closed = self.agent_pool.close_session(session_id)
+            if self.session_checkpoints is not None:
+                # A suspended session only exists as a checkpoint; its pending resume then starts a fresh session.
+                closed = await asyncio.to_thread(self.session_checkpoints.delete, session_id) or closed
+            if not closed:
+                raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found.")
+            return AgentResponse(status="closed", message="Session memory and plan discarded.", session_id=session_id)
+
         @self.app.post("/schedule_task", response_model=AgentResponse)  # This is for external clients
         async def schedule_task_endpoint(schedule_request: ScheduleTaskRequest):
             prompt = schedule_request.prompt
             scheduled_time = schedule_request.scheduled_time
+            if schedule_request.cron or schedule_request.interval_seconds:
+                try:
+                    schedule_id, first_fire = await self._add_schedule(
+                        prompt, scheduled_time, schedule_request.cron, schedule_request.interval_seconds)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                except NotImplementedError as e:
+                    raise HTTPException(status_code=501, detail=str(e))
+                return AgentResponse(
+                    status="scheduled",
+                    message=f"Recurring task scheduled; first run at {first_fire.isoformat()}.",
+                    schedule_id=schedule_id
+                )
+            if scheduled_time is None:
+                raise HTTPException(status_code=400, detail="scheduled_time is required for a one-off task.")
             if scheduled_time.tzinfo is None:
                 scheduled_time_utc = scheduled_time.replace(tzinfo=timezone.utc)
             else:
@@ -301,7 +555,7 @@ class ApiServer:
 
             task_id = str(uuid.uuid4())
             try:
-                self._add_task_to_csv(task_id, prompt, scheduled_time_utc)
+                await self._add_task(task_id, prompt, scheduled_time_utc)
                 return AgentResponse(
                     status="scheduled",
                     message=f"Task scheduled successfully for {scheduled_time_utc.isoformat()}.",
@@ -311,32 +565,120 @@ class ApiServer:
                 print(f"Error scheduling task: {e}")
                 raise HTTPException(status_code=500, detail=f"Failed to schedule task: {str(e)}")
 
+        @self.app.get("/schedules", response_model=list[dict])
+        async def list_schedules_endpoint():
+            return await self.task_store.list_schedules()
+
+        @self.app.delete("/schedules/{schedule_id}", response_model=AgentResponse)
+        async def delete_schedule_endpoint(schedule_id: str):
+            if not await self.task_store.delete_schedule(schedule_id):
+                raise HTTPException(status_code=404, detail=f"Schedule '{schedule_id}' not found.")
+            return AgentResponse(status="deleted", message="Schedule removed; past runs are kept.",
+                                 schedule_id=schedule_id)
+
+        @self.app.get("/scheduler_metrics", response_model=dict)
+        async def scheduler_metrics_endpoint():
+            return {
+                "scheduling_lag": self.scheduling_lag.snapshot(),
+                "worker_pool": self.worker_pool.stats(),
+                "agent_pool": self.agent_pool.stats(),
+                "task_store": self.task_store.stats(),
+                "result_store": self.result_store.stats(),
+                "rate_limits": rate_limiter_stats(),
+                "llm_cache": llm_cache_stats(),
+                "context_cache": context_cache_stats(),
+                "llm_streams": stream_stats.snapshot(),
+                "llm_hedging": hedging_stats(),
+                "query_engines": self.query_engines.stats(),
+                "session_checkpoints": self.session_checkpoints.stats() if self.session_checkpoints else {},
+                "next_deadline_iso": self._next_deadline.isoformat() if self._next_deadline else None,
+                "worker_id": self.worker_id,
+                "leased_tasks": len(self._leased_task_ids),
+            }
+
+        @self.app.get("/tasks", response_model=TaskPage)
+        async def list_tasks_endpoint(
+                status: str | None = Query(None, description="Only tasks with this status (e.g. PENDING, COMPLETED)."),
+                scheduled_after: datetime | None = Query(None, description="Inclusive lower bound on scheduled time."),
+                scheduled_before: datetime | None = Query(None, description="Exclusive upper bound on scheduled time."),
+                cursor: str | None = Query(None, description="next_cursor from the previous page."),
+                limit: int = Query(50, ge=1, le=500),
+                include_result: bool = Query(False, description="Include the (potentially large) result column."),
+        ):
+            try:
+                tasks, next_cursor = await self.task_store.query_tasks(
+                    status=status, scheduled_after=scheduled_after, scheduled_before=scheduled_before,
+                    cursor=cursor, limit=limit, include_result=include_result,
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if include_result:
+                tasks = await asyncio.to_thread(self.result_store.fill_results, tasks)
+            return TaskPage(tasks=tasks, next_cursor=next_cursor)
+
+        @self.app.get("/tasks/{task_id}", response_model=dict)
+        async def get_task_endpoint(task_id: str, include_result: bool = True):
+            task = await self.task_store.get_task(task_id)
+            if task is None:
+                raise HTTPException(status_code=404, detail=f"Task '{task_id}' not found.")
+            if not include_result:
+                task.pop('result', None)
+            else:
+                await asyncio.to_thread(self.result_store.fill_results, [task])
+            return task
+
+        @self.app.get("/tasks/{task_id}/result")
+        async def get_task_result_endpoint(task_id: str):
+            task = await self.task_store.get_task(task_id)
+            if task is None:
+                raise HTTPException(status_code=404, detail=f"Task '{task_id}' not found.")
+            result_hash = task.get('result_hash')
+            if not result_hash:
+                # Results recorded before out-of-line storage (or by a backend without it) are still inline.
+                return StreamingResponse(iter([(task.get('result') or "").encode("utf-8")]),
+                                         media_type="text/plain; charset=utf-8")
+            if not await asyncio.to_thread(self.result_store.exists, result_hash):
+                raise HTTPException(status_code=410, detail=f"The result of task '{task_id}' has been evicted.")
+            # A plain generator is iterated in Starlette's threadpool, so decompression stays off the event loop.
+            return StreamingResponse(self.result_store.iter_chunks(result_hash), media_type="text/plain; charset=utf-8",
+                                     headers={"X-Result-Size": str(task.get('result_size') or 0)})
+
         @self.app.get("/view_tasks", response_model=list[dict])
         async def view_tasks_endpoint():
-            tasks = self._read_all_tasks_from_csv()
-            if not tasks and not os.path.exists(self.csv_file_path):
-                return [{"message": "No CSV file found, or no tasks scheduled yet."}]
-            return tasks
+            tasks = await self.task_store.list_tasks()
+            if not tasks:
+                return [{"message": "No tasks scheduled yet."}]
+            return await asyncio.to_thread(self.result_store.fill_results, tasks)
 
     def run_server(self, host: str = "127.0.0.1", port: int = 8001, reload: bool = False,
                    uvicorn_log_level: str = "info"):
         print(f"Starting Uvicorn server on http://{host}:{port}")
-        print(f"Scheduler will check for tasks every {self.scheduler_interval} seconds.")
+        print(f"Scheduler sleeps until the next due task, re-checking at least every {self.scheduler_interval} seconds.")
         print(f"Access OpenAPI docs at http://{host}:{port}/docs")
 
         if reload:
-            uvicorn.run("server:api_server_instance.app", host=host, port=port, reload=True,
+            uvicorn.run("server:create_app", factory=True, host=host, port=port, reload=True,
                         log_level=uvicorn_log_level)
         else:
             uvicorn.run(self.app, host=host, port=port, reload=False, log_level=uvicorn_log_level)
 
 
-api_server_instance = ApiServer(
-    agent_class=ActualAgent,
-    agent_verbose=True,
-    csv_file_path="class_based_scheduled_tasks.csv",
-    scheduler_interval=ApiServer.DEFAULT_SCHEDULER_INTERVAL_SECONDS
-)
+def create_api_server() -> ApiServer:
+    return ApiServer(
+        agent_class=ActualAgent,
+        agent_verbose=True,
+        csv_file_path="class_based_scheduled_tasks.csv",
+        db_file_path="class_based_scheduled_tasks.db",
+        scheduler_interval=ApiServer.DEFAULT_SCHEDULER_INTERVAL_SECONDS
+    )
+
+
+def create_app():
+    """App factory for `uvicorn server:create_app --factory` (also what reload=True runs)."""
+    return create_api_server().app
+
 
+# The server is built on demand, never at import: worker processes (e.g. FileDecoder's extraction
+# pool) re-import the main module, and must not each construct a server of their own.
 if __name__ == "__main__":
-    api_server_instance.run_server(reload=False, port=8001)
\ No newline at end of file
+    create_api_server().run_server(reload=False, port=8001)
@@ -0,0 +1,75 @@
+# session_checkpoints.py
+
+import json
+import os
+import tempfile
+import threading
+
+from ..lib.agent_session import AgentSession
+
+DEFAULT_CHECKPOINT_DIR = "session_checkpoints"
+
+
+class SessionCheckpointStore:
+    """
+    One JSON file per suspended agent session: its messages, running summary and plan.
+
+    A session waiting for a scheduled resume is written here and dropped from memory; the next
+    request for it (normally the resume task) loads it back. Blocking I/O; callers run it on a thread.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CHECKPOINT_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.saved = 0
+        self.loaded = 0
+
+    def _path(self, session_id: str) -> str:
+        # Session ids come from clients; keep the file name inside the directory.
+        safe_id = "".join(c if c.isalnum() or c in "_-" else "_" for c in session_id)
+        return os.path.join(self.directory, f"{safe_id}.json")
+
+    def save(self, session: AgentSession):
+        data = json.dumps(session.to_checkpoint(), ensure_ascii=False)
+        path = self._path(session.session_id)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temporary file first so a crash never leaves a truncated checkpoint.
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+            self.saved += 1
+
+    def load(self, session_id: str) -> AgentSession | None:
+        with self._lock:
+            try:
+                with open(self._path(session_id), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                return None
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"Warning: could not read checkpoint of session '{session_id}': {e}. Starting it empty.")
+                return None
+            self.loaded += 1
+        return AgentSession.from_checkpoint(data)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            try:
+                os.remove(self._path(session_id))
+                return True
+            except FileNotFoundError:
+                return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            try:
+                stored = sum(1 for name in os.listdir(self.directory) if name.endswith(".json"))
+            except FileNotFoundError:
+                stored = 0
+            return {"stored": stored, "saved": self.saved, "loaded": self.loaded}
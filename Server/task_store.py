@@ -0,0 +1,651 @@
+# task_store.py
+
+import base64
+import csv
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from .recurrence import next_fire_time
+
+# Column layout shared by every backend (and by the legacy CSV file format).
+TASK_FIELDS = ["id", "prompt", "scheduled_time_iso", "status", "created_at_iso", "result", "error_message"]
+# Extra columns used by backends that support lease-based claiming across processes.
+LEASE_FIELDS = ["worker_id", "lease_expires_at_iso", "attempts"]
+
+# Execution records created by a recurring schedule point back at it.
+RECURRENCE_FIELDS = ["schedule_id"]
+# Results kept out of line (see ResultStore): the row only carries the blob's hash and size.
+RESULT_REF_FIELDS = ["result_hash", "result_size"]
+# Tasks that continue a conversation (e.g. resuming after a long wait) run in that agent session.
+SESSION_FIELDS = ["session_id"]
+SCHEDULE_FIELDS = ["id", "prompt", "cron_expression", "interval_seconds", "next_fire_iso", "enabled",
+                   "created_at_iso", "last_fired_iso"]
+
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def to_utc_iso(value: datetime) -> str:
+    """
+    Normalizes a datetime to a fixed-width UTC ISO 8601 string.
+    Naive datetimes are assumed to be UTC. Using a fixed width (always with microseconds)
+    makes lexicographic order equal to chronological order, which the SQLite indexes rely on.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def encode_task_cursor(task: dict) -> str:
+    """Opaque pagination cursor pointing just after `task` in (scheduled_time_iso, id) order."""
+    raw = json.dumps([task['scheduled_time_iso'], task['id']]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_task_cursor(cursor: str) -> tuple[str, str]:
+    """Inverse of encode_task_cursor. Raises ValueError for malformed cursors."""
+    try:
+        scheduled_time_iso, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(scheduled_time_iso), str(task_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+class TaskStore:
+    """
+    Interface for scheduled-task persistence used by ApiServer.
+    Backends store rows with the keys listed in TASK_FIELDS.
+    """
+
+    def initialize(self):
+        raise NotImplementedError
+
+    # Whether add_task can record the agent session a task continues (session_id).
+    supports_session_tasks = False
+
+    def add_task(self, task_id: str, prompt: str, scheduled_time: datetime, session_id: str = ""):
+        raise NotImplementedError
+
+    def get_task(self, task_id: str) -> dict | None:
+        raise NotImplementedError
+
+    def list_tasks(self) -> list[dict]:
+        raise NotImplementedError
+
+    def claim_due_tasks(self, now: datetime, limit: int | None = None, worker_id: str = "",
+                        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                        max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> list[dict]:
+        """
+        Marks PENDING tasks scheduled at or before `now` as RUNNING (earliest first, at most `limit`
+        of them when given) and returns them. Backends with lease support record `worker_id` and a
+        lease of `lease_seconds`, and also reclaim RUNNING tasks whose lease has expired as long as
+        they have been attempted fewer than `max_attempts` times.
+        """
+        raise NotImplementedError
+
+    def renew_leases(self, worker_id: str, task_ids: list[str], now: datetime,
+                     lease_seconds: float = DEFAULT_LEASE_SECONDS) -> list[str]:
+        """Heartbeat: extends the leases `worker_id` still holds and returns the ids it still owns."""
+        return list(task_ids)
+
+    # Whether update_final_status can record a result by reference (result_hash/result_size)
+    # instead of inline text.
+    supports_result_refs = False
+
+    def update_final_status(self, task_id: str, final_status: str, result: str = "", error_message: str = "",
+                            worker_id: str | None = None, result_hash: str = "", result_size: int = 0):
+        """Records the outcome. With `worker_id`, only applies if that worker still holds the task's lease."""
+        raise NotImplementedError
+
+    def next_scheduled_time(self, worker_id: str = "") -> datetime | None:
+        """
+        Returns the earliest scheduled time among PENDING tasks, or None if nothing is pending.
+        Backends with leases also count lease expiries, except those of `worker_id`, which renews its own.
+        """
+        raise NotImplementedError
+
+    def query_tasks(self, status: str | None = None, scheduled_after: datetime | None = None,
+                    scheduled_before: datetime | None = None, cursor: str | None = None,
+                    limit: int = 50, include_result: bool = False) -> tuple[list[dict], str | None]:
+        """
+        Returns one page of tasks ordered by (scheduled_time_iso, id) plus the cursor for the next page
+        (None on the last page). `scheduled_after` is inclusive, `scheduled_before` exclusive.
+        The `result` column is left out unless `include_result` is True.
+        """
+        raise NotImplementedError
+
+    # --- Recurring schedules (optional capability) ---
+    def add_schedule(self, schedule_id: str, prompt: str, first_fire: datetime,
+                     cron_expression: str | None = None, interval_seconds: int | None = None):
+        raise NotImplementedError(f"{type(self).__name__} does not support recurring schedules.")
+
+    def list_schedules(self) -> list[dict]:
+        return []
+
+    def delete_schedule(self, schedule_id: str) -> bool:
+        return False
+
+    def materialize_due_schedules(self, now: datetime) -> list[dict]:
+        """
+        For every enabled schedule whose next fire time is at or before `now`, inserts a PENDING
+        execution record into the task table and advances the schedule. Returns the new records.
+        """
+        return []
+
+    def apply_writes(self, writes: list[tuple[str, tuple, dict]]):
+        """
+        Applies a batch of ("add_task" | "update_final_status", args, kwargs) writes.
+        Backends that support transactions override this to commit the whole batch at once.
+        """
+        for method_name, args, kwargs in writes:
+            getattr(self, method_name)(*args, **kwargs)
+
+    def close(self):
+        pass
+
+
+class CsvTaskStore(TaskStore):
+    """
+    The original flat-file backend. Every claim and status update rewrites the whole file,
+    so it is only kept for small deployments and as the migration source for SqliteTaskStore.
+    """
+
+    def __init__(self, csv_file_path: str):
+        self.csv_file_path = csv_file_path
+
+    def initialize(self):
+        if not os.path.exists(self.csv_file_path):
+            with open(self.csv_file_path, mode='w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(TASK_FIELDS)
+            print(f"Initialized {self.csv_file_path}")
+
+    def add_task(self, task_id: str, prompt: str, scheduled_time: datetime, session_id: str = ""):
+        # The CSV layout has no session column (supports_session_tasks is False), so session_id is not kept.
+        created_at = datetime.now(timezone.utc)
+        with open(self.csv_file_path, mode='a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow([
+                task_id, prompt, to_utc_iso(scheduled_time), "PENDING", created_at.isoformat(), "", ""
+            ])
+
+    def get_task(self, task_id: str) -> dict | None:
+        for task in self.list_tasks():
+            if task['id'] == task_id:
+                return task
+        return None
+
+    def list_tasks(self) -> list[dict]:
+        if not os.path.exists(self.csv_file_path):
+            return []
+        with open(self.csv_file_path, mode='r', newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+    def _write_all(self, tasks_data: list[dict]):
+        with open(self.csv_file_path, mode='w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=TASK_FIELDS)
+            writer.writeheader()
+            writer.writerows(tasks_data)
+
+    def claim_due_tasks(self, now: datetime, limit: int | None = None, worker_id: str = "",
+                        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                        max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> list[dict]:
+        # Single-process backend: leases are not tracked, so crashed RUNNING tasks are never reclaimed.
+        all_tasks = self.list_tasks()
+        due_tasks = []
+        modified = False
+        for task in all_tasks:
+            if task['status'] != "PENDING":
+                continue
+            try:
+                scheduled_time_utc = datetime.fromisoformat(task['scheduled_time_iso'])
+                if scheduled_time_utc.tzinfo is None:
+                    scheduled_time_utc = scheduled_time_utc.replace(tzinfo=timezone.utc)
+                if scheduled_time_utc <= now and (limit is None or len(due_tasks) < limit):
+                    task['status'] = "RUNNING"
+                    due_tasks.append(dict(task))
+                    modified = True
+            except ValueError as e:
+                print(f"Error parsing scheduled_time for task {task['id']}: {e}. Marking as FAILED.")
+                task['status'] = "FAILED"
+                task['error_message'] = f"Invalid scheduled_time format: {e}"
+                modified = True
+        if modified:
+            self._write_all(all_tasks)
+        return due_tasks
+
+    def update_final_status(self, task_id: str, final_status: str, result: str = "", error_message: str = "",
+                            worker_id: str | None = None, result_hash: str = "", result_size: int = 0):
+        all_tasks = self.list_tasks()
+        for task in all_tasks:
+            if task['id'] == task_id:
+                task['status'] = final_status
+                task['result'] = result
+                task['error_message'] = error_message
+                self._write_all(all_tasks)
+                return
+
+    def next_scheduled_time(self, worker_id: str = "") -> datetime | None:
+        earliest = None
+        for task in self.list_tasks():
+            if task['status'] != "PENDING":
+                continue
+            try:
+                scheduled_time_utc = datetime.fromisoformat(task['scheduled_time_iso'])
+            except ValueError:
+                continue
+            if scheduled_time_utc.tzinfo is None:
+                scheduled_time_utc = scheduled_time_utc.replace(tzinfo=timezone.utc)
+            if earliest is None or scheduled_time_utc < earliest:
+                earliest = scheduled_time_utc
+        return earliest
+
+    def query_tasks(self, status: str | None = None, scheduled_after: datetime | None = None,
+                    scheduled_before: datetime | None = None, cursor: str | None = None,
+                    limit: int = 50, include_result: bool = False) -> tuple[list[dict], str | None]:
+        after_key = decode_task_cursor(cursor) if cursor else None
+        after_iso = to_utc_iso(scheduled_after) if scheduled_after else None
+        before_iso = to_utc_iso(scheduled_before) if scheduled_before else None
+        matching = []
+        for task in self.list_tasks():
+            key = (task['scheduled_time_iso'], task['id'])
+            if status and task['status'] != status:
+                continue
+            if after_iso and task['scheduled_time_iso'] < after_iso:
+                continue
+            if before_iso and task['scheduled_time_iso'] >= before_iso:
+                continue
+            if after_key and key <= after_key:
+                continue
+            if not include_result:
+                task.pop('result', None)
+            matching.append(task)
+        matching.sort(key=lambda t: (t['scheduled_time_iso'], t['id']))
+        page = matching[:limit]
+        next_cursor = encode_task_cursor(page[-1]) if len(matching) > limit else None
+        return page, next_cursor
+
+
+class SqliteTaskStore(TaskStore):
+    """
+    SQLite backend running in WAL mode. Due-task lookups go through the (status, scheduled_time_iso)
+    index and status changes are single-row UPDATEs, so the cost of a scheduler tick no longer
+    grows with the size of the task history.
+
+    Claims take a lease inside a BEGIN IMMEDIATE transaction, which SQLite serializes across
+    processes, so several uvicorn workers (or nodes sharing the file) can run schedulers against
+    the same database without executing a task twice.
+    """
+
+    COLUMNS = TASK_FIELDS + LEASE_FIELDS + RECURRENCE_FIELDS + RESULT_REF_FIELDS + SESSION_FIELDS
+    supports_result_refs = True
+    supports_session_tasks = True
+
+    def __init__(self, db_file_path: str):
+        self.db_file_path = db_file_path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # isolation_level=None: transactions are managed explicitly with BEGIN/COMMIT.
+            self._conn = sqlite3.connect(self.db_file_path, check_same_thread=False, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+        return self._conn
+
+    def initialize(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    prompt TEXT NOT NULL,
+                    scheduled_time_iso TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at_iso TEXT NOT NULL,
+                    result TEXT NOT NULL DEFAULT '',
+                    error_message TEXT NOT NULL DEFAULT ''
+                )
+                """
+            )
+            # Lookups by id use the PRIMARY KEY index. Due-task scans and status-filtered pages use the
+            # (status, scheduled_time_iso, id) index; unfiltered pages walk (scheduled_time_iso, id).
+            conn.execute("DROP INDEX IF EXISTS idx_tasks_status_scheduled")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tasks_status_scheduled_id ON tasks (status, scheduled_time_iso, id)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_scheduled_id ON tasks (scheduled_time_iso, id)")
+            existing_columns = {row['name'] for row in conn.execute("PRAGMA table_info(tasks)").fetchall()}
+            for column_sql in ("worker_id TEXT NOT NULL DEFAULT ''",
+                               "lease_expires_at_iso TEXT NOT NULL DEFAULT ''",
+                               "attempts INTEGER NOT NULL DEFAULT 0",
+                               "schedule_id TEXT NOT NULL DEFAULT ''",
+                               "result_hash TEXT NOT NULL DEFAULT ''",
+                               "result_size INTEGER NOT NULL DEFAULT 0",
+                               "session_id TEXT NOT NULL DEFAULT ''"):
+                if column_sql.split()[0] not in existing_columns:
+                    conn.execute(f"ALTER TABLE tasks ADD COLUMN {column_sql}")
+            # Finds RUNNING tasks whose worker stopped heartbeating.
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tasks_status_lease ON tasks (status, lease_expires_at_iso)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schedules (
+                    id TEXT PRIMARY KEY,
+                    prompt TEXT NOT NULL,
+                    cron_expression TEXT NOT NULL DEFAULT '',
+                    interval_seconds INTEGER NOT NULL DEFAULT 0,
+                    next_fire_iso TEXT NOT NULL,
+                    enabled INTEGER NOT NULL DEFAULT 1,
+                    created_at_iso TEXT NOT NULL,
+                    last_fired_iso TEXT NOT NULL DEFAULT ''
+                )
+                """
+            )
+            # The next-fire index: the scheduler only ever looks at its head.
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_schedules_enabled_next ON schedules (enabled, next_fire_iso)")
+        print(f"Initialized task store at {self.db_file_path}")
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> dict:
+        return {key: row[key] for key in row.keys()}
+
+    def add_task(self, task_id: str, prompt: str, scheduled_time: datetime, session_id: str = ""):
+        self.apply_writes([("add_task", (task_id, prompt, scheduled_time), {"session_id": session_id})])
+
+    @staticmethod
+    def _add_task_in_txn(conn: sqlite3.Connection, task_id: str, prompt: str, scheduled_time: datetime,
+                         session_id: str = ""):
+        created_at = datetime.now(timezone.utc)
+        conn.execute(
+            "INSERT INTO tasks (id, prompt, scheduled_time_iso, status, created_at_iso, session_id) "
+            "VALUES (?, ?, ?, 'PENDING', ?, ?)",
+            (task_id, prompt, to_utc_iso(scheduled_time), created_at.isoformat(), session_id),
+        )
+
+    def get_task(self, task_id: str) -> dict | None:
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM tasks WHERE id = ?", (task_id,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list_tasks(self) -> list[dict]:
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM tasks ORDER BY scheduled_time_iso, id"
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def claim_due_tasks(self, now: datetime, limit: int | None = None, worker_id: str = "",
+                        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                        max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> list[dict]:
+        now_iso = to_utc_iso(now)
+        lease_expires_iso = to_utc_iso(now + timedelta(seconds=lease_seconds))
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases that used up their retry budget are failed rather than reclaimed.
+                conn.execute(
+                    "UPDATE tasks SET status = 'FAILED', "
+                    "error_message = 'Lease expired after ' || attempts || ' attempt(s); worker ' || worker_id || ' stopped responding.' "
+                    "WHERE status = 'RUNNING' AND lease_expires_at_iso < ? AND attempts >= ?",
+                    (now_iso, max_attempts),
+                )
+                rows = conn.execute(
+                    f"SELECT {', '.join(self.COLUMNS)} FROM ("
+                    "  SELECT * FROM tasks WHERE status = 'PENDING' AND scheduled_time_iso <= ?"
+                    "  UNION ALL"
+                    "  SELECT * FROM tasks WHERE status = 'RUNNING' AND lease_expires_at_iso < ?"
+                    ") ORDER BY scheduled_time_iso LIMIT ?",
+                    (now_iso, now_iso, -1 if limit is None else limit),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE tasks SET status = 'RUNNING', worker_id = ?, lease_expires_at_iso = ?, attempts = attempts + 1 "
+                    "WHERE id = ? AND (status = 'PENDING' OR (status = 'RUNNING' AND lease_expires_at_iso < ?))",
+                    [(worker_id, lease_expires_iso, row['id'], now_iso) for row in rows],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        due_tasks = []
+        for row in rows:
+            task = self._row_to_dict(row)
+            if task['status'] == "RUNNING":
+                print(f"Task {task['id']}: lease of worker '{task['worker_id']}' expired, reclaiming "
+                      f"(attempt {task['attempts'] + 1}/{max_attempts}).")
+            task.update(status="RUNNING", worker_id=worker_id, lease_expires_at_iso=lease_expires_iso,
+                        attempts=task['attempts'] + 1)
+            due_tasks.append(task)
+        return due_tasks
+
+    def renew_leases(self, worker_id: str, task_ids: list[str], now: datetime,
+                     lease_seconds: float = DEFAULT_LEASE_SECONDS) -> list[str]:
+        if not task_ids:
+            return []
+        lease_expires_iso = to_utc_iso(now + timedelta(seconds=lease_seconds))
+        placeholders = ", ".join("?" for _ in task_ids)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    f"UPDATE tasks SET lease_expires_at_iso = ? "
+                    f"WHERE worker_id = ? AND status = 'RUNNING' AND id IN ({placeholders})",
+                    (lease_expires_iso, worker_id, *task_ids),
+                )
+                rows = conn.execute(
+                    f"SELECT id FROM tasks WHERE worker_id = ? AND status = 'RUNNING' AND id IN ({placeholders})",
+                    (worker_id, *task_ids),
+                ).fetchall()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [row['id'] for row in rows]
+
+    def update_final_status(self, task_id: str, final_status: str, result: str = "", error_message: str = "",
+                            worker_id: str | None = None, result_hash: str = "", result_size: int = 0):
+        self.apply_writes([("update_final_status", (task_id, final_status), {
+            "result": result, "error_message": error_message, "worker_id": worker_id,
+            "result_hash": result_hash, "result_size": result_size,
+        })])
+
+    @staticmethod
+    def _update_final_status_in_txn(conn: sqlite3.Connection, task_id: str, final_status: str,
+                                    result: str = "", error_message: str = "", worker_id: str | None = None,
+                                    result_hash: str = "", result_size: int = 0):
+        assignments = ("status = ?, result = ?, error_message = ?, result_hash = ?, result_size = ?, "
+                       "lease_expires_at_iso = ''")
+        values = (final_status, result, error_message, result_hash, result_size)
+        if worker_id is None:
+            conn.execute(f"UPDATE tasks SET {assignments} WHERE id = ?", (*values, task_id))
+            return
+        # A worker whose lease was taken over by someone else must not overwrite the new owner's outcome.
+        cursor = conn.execute(
+            f"UPDATE tasks SET {assignments} WHERE id = ? AND worker_id = ? AND status = 'RUNNING'",
+            (*values, task_id, worker_id),
+        )
+        if cursor.rowcount == 0:
+            print(f"Task {task_id}: worker '{worker_id}' no longer holds the lease; discarding its {final_status} result.")
+
+    def apply_writes(self, writes: list[tuple[str, tuple, dict]]):
+        # Group commit: the whole batch shares one transaction, hence one WAL sync.
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for method_name, args, kwargs in writes:
+                    getattr(self, f"_{method_name}_in_txn")(conn, *args, **kwargs)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def next_scheduled_time(self, worker_id: str = "") -> datetime | None:
+        # MIN over the leading index columns is a single index seek, so this acts as the scheduler's heap top.
+        # Another worker's lease expiry is a deadline too: that is when its task becomes reclaimable. The
+        # caller's own leases are left out, since it keeps renewing them and would otherwise wake up for nothing.
+        with self._lock:
+            conn = self._connection()
+            next_due = conn.execute(
+                "SELECT MIN(scheduled_time_iso) FROM tasks WHERE status = 'PENDING'"
+            ).fetchone()[0]
+            next_expiry = conn.execute(
+                "SELECT MIN(lease_expires_at_iso) FROM tasks "
+                "WHERE status = 'RUNNING' AND lease_expires_at_iso != '' AND worker_id != ?",
+                (worker_id,),
+            ).fetchone()[0]
+            next_fire = conn.execute(
+                "SELECT MIN(next_fire_iso) FROM schedules WHERE enabled = 1"
+            ).fetchone()[0]
+        candidates = [value for value in (next_due, next_expiry, next_fire) if value]
+        if not candidates:
+            return None
+        return datetime.fromisoformat(min(candidates))
+
+    def query_tasks(self, status: str | None = None, scheduled_after: datetime | None = None,
+                    scheduled_before: datetime | None = None, cursor: str | None = None,
+                    limit: int = 50, include_result: bool = False) -> tuple[list[dict], str | None]:
+        columns = self.COLUMNS if include_result else [field for field in self.COLUMNS if field != 'result']
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if scheduled_after:
+            clauses.append("scheduled_time_iso >= ?")
+            params.append(to_utc_iso(scheduled_after))
+        if scheduled_before:
+            clauses.append("scheduled_time_iso < ?")
+            params.append(to_utc_iso(scheduled_before))
+        if cursor:
+            # Row-value comparison keeps keyset pagination on the index instead of using OFFSET.
+            clauses.append("(scheduled_time_iso, id) > (?, ?)")
+            params.extend(decode_task_cursor(cursor))
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        # One extra row tells us whether another page exists.
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {', '.join(columns)} FROM tasks {where}ORDER BY scheduled_time_iso, id LIMIT ?",
+                params,
+            ).fetchall()
+        page = [self._row_to_dict(row) for row in rows[:limit]]
+        next_cursor = encode_task_cursor(page[-1]) if len(rows) > limit else None
+        return page, next_cursor
+
+    def add_schedule(self, schedule_id: str, prompt: str, first_fire: datetime,
+                     cron_expression: str | None = None, interval_seconds: int | None = None):
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO schedules (id, prompt, cron_expression, interval_seconds, next_fire_iso, created_at_iso) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (schedule_id, prompt, cron_expression or "", interval_seconds or 0, to_utc_iso(first_fire),
+                 datetime.now(timezone.utc).isoformat()),
+            )
+
+    def list_schedules(self) -> list[dict]:
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {', '.join(SCHEDULE_FIELDS)} FROM schedules ORDER BY next_fire_iso, id"
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def delete_schedule(self, schedule_id: str) -> bool:
+        # Execution records already created keep their schedule_id for history.
+        with self._lock:
+            cursor = self._connection().execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
+        return cursor.rowcount > 0
+
+    def materialize_due_schedules(self, now: datetime) -> list[dict]:
+        now_iso = to_utc_iso(now)
+        created = []
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                due_schedules = conn.execute(
+                    f"SELECT {', '.join(SCHEDULE_FIELDS)} FROM schedules WHERE enabled = 1 AND next_fire_iso <= ?",
+                    (now_iso,),
+                ).fetchall()
+                for schedule in due_schedules:
+                    fire_time = datetime.fromisoformat(schedule['next_fire_iso'])
+                    following = next_fire_time(schedule['cron_expression'] or None,
+                                               schedule['interval_seconds'] or None, fire_time, now)
+                    task_id = str(uuid.uuid4())
+                    conn.execute(
+                        "INSERT INTO tasks (id, prompt, scheduled_time_iso, status, created_at_iso, schedule_id) "
+                        "VALUES (?, ?, ?, 'PENDING', ?, ?)",
+                        (task_id, schedule['prompt'], schedule['next_fire_iso'], now.isoformat(), schedule['id']),
+                    )
+                    conn.execute(
+                        "UPDATE schedules SET next_fire_iso = ?, last_fired_iso = ? WHERE id = ?",
+                        (to_utc_iso(following), schedule['next_fire_iso'], schedule['id']),
+                    )
+                    created.append({"id": task_id, "schedule_id": schedule['id'],
+                                    "scheduled_time_iso": schedule['next_fire_iso'],
+                                    "next_fire_iso": to_utc_iso(following)})
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return created
+
+    def migrate_from_csv(self, csv_file_path: str) -> int:
+        """
+        One-shot import of a legacy CSV task file. Rows are inserted with INSERT OR IGNORE, so running
+        the migration twice is harmless. On success the CSV is renamed to '<name>.migrated' so that
+        later startups skip it. Returns the number of rows imported.
+        """
+        if not os.path.exists(csv_file_path):
+            return 0
+        rows_to_insert = []
+        for task in CsvTaskStore(csv_file_path).list_tasks():
+            status = task.get('status') or "PENDING"
+            error_message = task.get('error_message') or ""
+            try:
+                scheduled_iso = to_utc_iso(datetime.fromisoformat(task['scheduled_time_iso']))
+            except (TypeError, ValueError) as e:
+                scheduled_iso = task.get('scheduled_time_iso') or ""
+                if status == "PENDING":
+                    status = "FAILED"
+                    error_message = f"Invalid scheduled_time format: {e}"
+            rows_to_insert.append((
+                task['id'], task.get('prompt') or "", scheduled_iso, status,
+                task.get('created_at_iso') or datetime.now(timezone.utc).isoformat(),
+                task.get('result') or "", error_message,
+            ))
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = conn.total_changes
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO tasks ({', '.join(TASK_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows_to_insert,
+                )
+                imported = conn.total_changes - before
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        os.replace(csv_file_path, csv_file_path + ".migrated")
+        print(f"Migrated {imported} task(s) from {csv_file_path} into {self.db_file_path}")
+        return imported
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
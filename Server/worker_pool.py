@@ -0,0 +1,126 @@
+# worker_pool.py
+
+import asyncio
+import math
+import time
+from typing import Any, Awaitable, Callable
+
+from ..lib.metrics import LatencyRecorder
+
+
+class PoolSaturatedError(Exception):
+    """Raised by AgentWorkerPool.submit when the admission queue is full."""
+
+    def __init__(self, retry_after_seconds: int):
+        super().__init__(f"Agent worker pool is saturated. Retry after {retry_after_seconds} seconds.")
+        self.retry_after_seconds = retry_after_seconds
+
+
+class AgentWorkerPool:
+    """
+    Fixed number of asyncio workers fed by a bounded queue.
+    At most `max_concurrency` agent runs execute at once and at most `max_queue_size` wait for a worker;
+    anything beyond that is rejected up front with PoolSaturatedError instead of piling up on the LLM quota.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue_size: int,
+                 on_slot_freed: Callable[[], None] | None = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self._on_slot_freed = on_slot_freed
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._active = 0
+        self._rejected = 0
+        self.job_durations = LatencyRecorder()
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.max_concurrency)]
+        print(f"Worker pool started: {self.max_concurrency} worker(s), queue size {self.max_queue_size}.")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        print("Worker pool stopped.")
+
+    def available_capacity(self) -> int:
+        """Number of jobs that can currently be submitted without being rejected."""
+        if self._queue is None:
+            return 0
+        return self.max_queue_size - self._queue.qsize()
+
+    def idle_capacity(self) -> int:
+        """
+        Number of jobs that would start right away: idle workers not already spoken for by queued jobs.
+        The scheduler claims at most this many tasks, so leased tasks never wait in the queue (where
+        no other worker could take them over) and the queue's headroom stays free for HTTP requests.
+        """
+        if self._queue is None:
+            return 0
+        return max(0, self.max_concurrency - self._active - self._queue.qsize())
+
+    def retry_after_seconds(self) -> int:
+        """Rough time until a queue slot frees up, based on recent job durations."""
+        mean_duration = self.job_durations.snapshot().get("mean_seconds", 1.0)
+        waiting = self._queue.qsize() if self._queue else 0
+        return max(1, math.ceil(mean_duration * (waiting + 1) / self.max_concurrency))
+
+    def submit(self, job_factory: Callable[[], Awaitable[Any]], label: str = "") -> asyncio.Future:
+        """
+        Queues `job_factory()` for execution and returns a future for its result.
+        The coroutine is only created when a worker picks the job up.
+        Raises PoolSaturatedError if the queue is full.
+        """
+        if self._queue is None:
+            raise RuntimeError("Worker pool has not been started.")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((job_factory, future, label))
+        except asyncio.QueueFull:
+            self._rejected += 1
+            raise PoolSaturatedError(self.retry_after_seconds())
+        return future
+
+    async def _worker(self, worker_index: int):
+        while True:
+            job_factory, future, label = await self._queue.get()
+            try:
+                if future.cancelled():
+                    # The submitter gave up (e.g. the HTTP client disconnected) before the job started.
+                    continue
+                self._active += 1
+                started = time.monotonic()
+                try:
+                    result = await job_factory()
+                    if not future.done():
+                        future.set_result(result)
+                except asyncio.CancelledError:
+                    if not future.done():
+                        future.cancel()
+                    raise
+                except Exception as e:
+                    print(f"Worker pool: job {label or '<unnamed>'} on worker {worker_index} failed: {e}")
+                    if not future.done():
+                        future.set_exception(e)
+                finally:
+                    self._active -= 1
+                    self.job_durations.record(time.monotonic() - started)
+            finally:
+                self._queue.task_done()
+                if self._on_slot_freed:
+                    self._on_slot_freed()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue_size": self.max_queue_size,
+            "active": self._active,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "rejected": self._rejected,
+            "job_durations": self.job_durations.snapshot(),
+        }
@@ -1,5 +1,10 @@
+import asyncio
+import multiprocessing
 import os
 import pathlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import magic
 
 import pypdfium2 as pdfium
@@ -16,6 +21,8 @@ load_dotenv()
 MAX_CONTENT_CHARS = 50000
 # Max rows to read from an Excel sheet
 EXCEL_MAX_ROWS_TO_READ = 200
+# Worker processes for aget_file_content; 0 extracts on a thread instead.
+EXTRACTION_PROCESSES = int(os.getenv("AGENT_EXTRACTION_PROCESSES", str(min(4, os.cpu_count() or 1))))
 
 
 def extract_text_from_txt(file_path: pathlib.Path) -> str:
@@ -31,21 +38,27 @@ def extract_text_from_txt(file_path: pathlib.Path) -> str:
         return f"[Error extracting TXT: {e}]"
 
 
-def extract_text_from_pdf(file_path: pathlib.Path) -> str:
-    """Extracts text from PDF files."""
-    text = ""
+def _extract_pdf_pages(file_path: pathlib.Path) -> list[str]:
+    pdf = pdfium.PdfDocument(file_path)
     try:
-        pdf = pdfium.PdfDocument(file_path)
+        pages = []
         for i in range(len(pdf)):
             page = pdf.get_page(i)
             textpage = page.get_textpage()
-            text += textpage.get_text_range() + "\n"
+            pages.append(textpage.get_text_range())
             textpage.close()
             page.close()
+        return pages
+    finally:
         pdf.close()
+
+
+def extract_text_from_pdf(file_path: pathlib.Path) -> str:
+    """Extracts text from PDF files."""
+    try:
+        return "".join(page + "\n" for page in _extract_pdf_pages(file_path))
     except Exception as e:
         return f"[Error extracting PDF: {e}]"
-    return text
 
 
 def extract_text_from_docx(file_path: pathlib.Path) -> str:
@@ -282,6 +295,91 @@ def get_file_content(file_path_str: str) -> tuple[str, str]:
 
     return content, ""
 
+def get_file_pages(file_path_str: str) -> tuple[list[str], str]:
+    """
+    Like get_file_content, but a PDF comes back as one string per page, so an index can keep
+    unchanged pages' chunks when a document is edited. Other formats are returned as a single page.
+    Returns (pages, error_message_string)
+    """
+    file_path = pathlib.Path(file_path_str)
+    if not (file_path.is_file() and file_path.suffix.lower() == ".pdf"):
+        content, error_msg = get_file_content(file_path_str)
+        return ([content] if content else []), error_msg
+
+    print("Processing as PDF pages based on extension...")
+    try:
+        pages = _extract_pdf_pages(file_path)
+    except Exception as e:
+        return [], f"[Error extracting PDF: {e}]"
+    if not any(page.strip() for page in pages):
+        return [], "Could not extract text content from the file (ext: .pdf). It might be a scanned document without a text layer."
+
+    # Same total budget as get_file_content.
+    kept, total = [], 0
+    for page in pages:
+        if total + len(page) > MAX_CONTENT_CHARS:
+            print(f"Warning: Content is very long. Truncating to {MAX_CONTENT_CHARS} characters for AI.")
+            kept.append(page[:MAX_CONTENT_CHARS - total] + "\n[...content truncated...]")
+            break
+        kept.append(page)
+        total += len(page)
+    return kept, ""
+
+
+_extraction_pool: ProcessPoolExecutor | None = None
+_extraction_pool_lock = threading.Lock()
+
+
+def _get_extraction_pool() -> ProcessPoolExecutor | None:
+    global _extraction_pool
+    if EXTRACTION_PROCESSES <= 0:
+        return None
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            # Never "fork": the server has event-loop, gRPC and lock-holding threads by the time this
+            # runs, and a forked child can inherit a held lock. "forkserver" (or "spawn" where it is
+            # unavailable) starts workers from a fresh interpreter. The fork server preloads only this
+            # module, not the main one; each worker still re-imports the main module, so entry points
+            # must not build anything at import time (the server only builds its ApiServer in
+            # create_api_server, called under its `if __name__ == "__main__":` guard).
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            context = multiprocessing.get_context(method)
+            if method == "forkserver":
+                context.set_forkserver_preload([__name__])
+            _extraction_pool = ProcessPoolExecutor(max_workers=EXTRACTION_PROCESSES, mp_context=context)
+        return _extraction_pool
+
+
+def _reset_extraction_pool():
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is not None:
+            _extraction_pool.shutdown(wait=False, cancel_futures=True)
+        _extraction_pool = None
+
+
+async def _extract_off_loop(extract, file_path_str: str):
+    """Runs a CPU-bound extractor in a worker process, or on a thread when the pool is disabled or a worker died."""
+    pool = _get_extraction_pool()
+    if pool is not None:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, extract, file_path_str)
+        except BrokenProcessPool:
+            print("Warning: extraction worker process died; extracting on a thread instead.")
+            _reset_extraction_pool()
+    return await asyncio.to_thread(extract, file_path_str)
+
+
+async def aget_file_content(file_path_str: str) -> tuple[str, str]:
+    """get_file_content without blocking the event loop."""
+    return await _extract_off_loop(get_file_content, file_path_str)
+
+
+async def aget_file_pages(file_path_str: str) -> tuple[list[str], str]:
+    """get_file_pages without blocking the event loop."""
+    return await _extract_off_loop(get_file_pages, file_path_str)
+
+
 def _read_file(file_path:str) -> str:
     try:
         # Remove leading/trailing quotes if present (common from drag-and-drop)
@@ -1,20 +1,31 @@
+import asyncio
+import inspect
 import time
 from email import encoders
-from llama_index.core.agent.workflow import FunctionAgent
+from llama_index.core.agent.workflow import FunctionAgent, AgentStream, ToolCall, ToolCallResult
 import shutil
 from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
 from llama_index.embeddings.gemini import GeminiEmbedding
 from llama_index.readers.web import SimpleWebPageReader
 import datetime
 from .QueryTypes import QueryTypes
-from .rate_limited_gemini import RateLimitedGemini
-from .FileDecoder import get_file_content
+from .agent_session import AgentSession
+from .rate_limited_gemini import RateLimitedGemini, RateLimitedGeminiEmbedding
+from .api_wrappers import StreamInterruptedError
+from .FileDecoder import get_file_pages, aget_file_pages
+from .embedding_service import get_embedding_service
+from .index_manifest import ItemManifest, file_sha256, chunk_sha256, diff_chunks
+from .numpy_vector_store import load_storage_context, new_storage_context
+from .shared_index import SharedItemIndex, get_shared_item_index, USE_SHARED_VECTOR_STORE, SHARED_INDEX_DIR_NAME
+from .query_engine_cache import QueryEngineCache
+from .sub_agent_store import get_sub_agent_store
 from dotenv import load_dotenv
 import os
 from .FileEncoder import write_file_content
-from llama_index.core.tools import FunctionTool
-from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.tools import FunctionTool, ToolMetadata
 from pathlib import Path
+from typing import AsyncIterator
 from llama_index.core import (
     VectorStoreIndex,
     StorageContext,
@@ -26,7 +37,7 @@ from .firebase import get_user_google_access_token
 from llama_index.readers.file import PyMuPDFReader
 import re
 import json
-from datetime import datetime
+from datetime import datetime, timezone, timedelta
 import base64
 from email.message import EmailMessage
 from email.mime.multipart import MIMEMultipart
@@ -91,6 +102,7 @@ autonomous_system_prompt = (
     "1.  **Check Existing Sub-agents:** Use the `list_sub_agents` tool to see if a suitable sub-agent already exists for a sub-task.\n"
     "2.  **Create Sub-agent (if needed):** If no suitable sub-agent exists, use the `create_new_sub_agent` tool. Provide a descriptive name and a clear `system_prompt_for_subagent` defining its specific role and expertise for the sub-task.\n"
     "3.  **Call Sub-agent:** Use the `call_specific_sub_agent` tool, providing the sub-agent's name and the specific `task_for_subagent`. Await its completion and result as per 'TURN EXECUTION AND FINAL RESPONSE PROTOCOL'.\n"
+    "    When several sub-tasks are independent of each other, delegate them in one `call_sub_agents_parallel` call instead of calling sub-agents one at a time; it returns every result in the order given.\n"
     "4.  **Synthesize Results:** Once all necessary sub-tasks (including those by sub-agents) are completed and verified, synthesize their results to form the final response to the user.\n\n"
 
     "**RESPONSE VERIFICATION AND QUALITY CONTROL:**\n"
@@ -120,32 +132,99 @@ PDF_EMBED_MODEL_NAME = "models/embedding-001"
 PDF_CHUNK_SIZE = 512
 PDF_CHUNK_OVERLAP = 50
 ITEM_SIMILARITY_TOP_K = 4
+# Sub-agent runs in flight at once for one call_sub_agents_parallel call.
+SUB_AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_SUB_AGENT_CONCURRENCY", "4"))
+# wait_seconds: shorter waits are slept within the run; longer ones end the run and resume the session later.
+WAIT_SUSPEND_AFTER_SECONDS = int(os.getenv("AGENT_WAIT_SUSPEND_AFTER_SECONDS", "30"))
+WAIT_MAX_SECONDS = int(os.getenv("AGENT_WAIT_MAX_SECONDS", "86400"))
+# Sessions that cannot be suspended (sub-agents, agents used outside the server) sleep at most this long.
+WAIT_MAX_INLINE_SECONDS = 300
 PDF_PERSIST_BASE_DIR_NAME = "agent_pdf_storage"
 PDF_TYPE = "pdf"
 FILE_TYPE = "file"
 URL_TYPE = "url"
 
+# Tool name -> spec (name, description, argument schema). Every Agent registers the same tools, so the
+# signature introspection runs once per process and each Agent only binds its own functions to the specs.
+_tool_metadata_cache: dict[str, ToolMetadata] = {}
+
+# Async loads of the same item are serialized (item_id -> lock); agents share one event loop.
+_item_load_locks: dict[str, asyncio.Lock] = {}
+
+
+class _ItemLoad:
+    """State of one file load, handed between the steps shared by load_and_index_item and its async variant."""
+
+    def __init__(self, file_path: Path, file_path_str: str, sane_item_id: str, item_persist_dir: Path, force_reindex: bool):
+        self.file_path = file_path
+        self.file_path_str = file_path_str
+        self.sane_item_id = sane_item_id
+        self.item_persist_dir = item_persist_dir
+        self.force_reindex = force_reindex
+        self.manifest: ItemManifest | None = None
+        self.current_sha256: str | None = None
+        self.nodes: list = []
+        self.chunk_hashes: list[str] = []
+        self.to_insert: list[int] = []
+        self.to_delete: list[str] = []
+
+    @property
+    def old_chunks(self) -> dict[str, str]:
+        return self.manifest.chunks if self.manifest is not None else {}
+
+    @property
+    def new_nodes(self) -> list:
+        return [self.nodes[position] for position in self.to_insert]
+
+
+class SubAgentNotFoundError(LookupError):
+    """Raised when a sub-agent name matches neither a built nor a persisted sub-agent of the caller."""
+
+
 class Agent:
-    def __init__(self, server, system_prompt: str = autonomous_system_prompt, name: str = "Main_Agent", verbose: bool = False):
+    def __init__(self, server, system_prompt: str = autonomous_system_prompt, name: str = "Main_Agent", verbose: bool = False,
+                 shared_query_engines: QueryEngineCache | None = None):
         self.name = name
         self.server = server
+        self.system_prompt = system_prompt
         self.tools = []
         self.verbose = verbose
+        # Sub-agent instances (tools and prompt only); their memory and plan live in the caller's session.
         self.SubWorkers = {}
+        # A sub-agent instance is bound to one session at a time, so calls to the same sub-agent run one at a time.
+        self._sub_agent_locks: dict[str, asyncio.Lock] = {}
         self._add_tools()
-        self.query_engines = {}
+        # Pooled agents pass the same cache here so loaded indexes are shared instead of rebuilt per instance.
+        self.query_engines = shared_query_engines if shared_query_engines is not None else QueryEngineCache()
         self.persist_base_dir = Path(f"./{PDF_PERSIST_BASE_DIR_NAME}")
         self.persist_base_dir.mkdir(parents=True, exist_ok=True)
         self._pdf_settings_configured = False
         self._email_settings_configured = False
-        self.worker = FunctionAgent(
-            tools=self.tools,
-            llm=llm,
-            system_prompt=system_prompt,)
+        self._worker: FunctionAgent | None = None
 
-        self.memory = ChatMemoryBuffer.from_defaults(token_limit=390000)
+        # Memory and plan state live on the session so a pool can rebind this agent between conversations.
+        self.session = AgentSession()
         print(f"Initialized '{self.name}' and {len(self.tools)} tools.")
 
+    @property
+    def worker(self) -> FunctionAgent:
+        # Built on first run, so sub-agents that are defined but never called stay cheap.
+        if self._worker is None:
+            self._worker = FunctionAgent(
+                tools=self.tools,
+                llm=llm,
+                system_prompt=self.system_prompt,)
+        return self._worker
+
+    def _make_tool(self, fn, name: str, description: str) -> FunctionTool:
+        """Binds `fn` to the process-wide spec of tool `name`, building the spec on first use."""
+        metadata = _tool_metadata_cache.get(name)
+        if metadata is None:
+            metadata = _tool_metadata_cache[name] = FunctionTool.from_defaults(fn=fn, name=name, description=description).metadata
+        if inspect.iscoroutinefunction(fn):
+            return FunctionTool(async_fn=fn, metadata=metadata)
+        return FunctionTool(fn=fn, metadata=metadata)
+
     def _add_tools(self):
         """Helper method to create and add tools for the agent."""
 
@@ -154,7 +233,7 @@ class Agent:
             if self.verbose: print(f"--- [{self.name}] Tool 'list_sub_agents' called ---")
             return self.ListSubAgents()
 
-        list_sub_agents_tool = FunctionTool.from_defaults(
+        list_sub_agents_tool = self._make_tool(
             fn=_list_sub_agents_tool_func,
             name="list_sub_agents",
             description="Lists the names of all currently available sub-agents that can be called for specialized tasks."
@@ -165,7 +244,7 @@ class Agent:
             if self.verbose: print(f"--- [{self.name}] Tool 'create_new_sub_agent' called with name: {name} ---")
             return self.CreateSubAgent(name=name, system_prompt=system_prompt_for_subagent)
 
-        create_sub_agent_tool = FunctionTool.from_defaults(
+        create_sub_agent_tool = self._make_tool(
             fn=_create_sub_agent_tool_func,
             name="create_new_sub_agent",
             description=(
@@ -179,11 +258,9 @@ class Agent:
 
         async def _call_sub_agent_tool_func(sub_agent_name: str, task_for_subagent: str) -> str:
             if self.verbose: print(f"--- [{self.name}] Tool 'call_specific_sub_agent' called for '{sub_agent_name}' with task: '{task_for_subagent[:70]}...' ---")
-            # Logic from original codebase to correctly qualify sub-agent name
-            full_sub_agent_name = sub_agent_name if "/" in sub_agent_name else f"{self.name}/{sub_agent_name}"
-            return await self.CallSubAgent(name=full_sub_agent_name, task=task_for_subagent)
+            return await self.CallSubAgent(name=self._qualify_sub_agent_name(sub_agent_name), task=task_for_subagent)
 
-        call_sub_agent_tool = FunctionTool.from_defaults(
+        call_sub_agent_tool = self._make_tool(
             fn=_call_sub_agent_tool_func, # This is async
             name="call_specific_sub_agent",
             description=(
@@ -195,6 +272,36 @@ class Agent:
         )
         self.tools.append(call_sub_agent_tool)
 
+        async def _call_sub_agents_parallel_tool_func(calls: str, max_concurrency: int = 0) -> str:
+            if self.verbose: print(f"--- [{self.name}] Tool 'call_sub_agents_parallel' called with: '{calls[:200]}...' ---")
+            try:
+                parsed = json.loads(calls)
+                pairs = [(call["sub_agent_name"], call["task"]) if isinstance(call, dict) else (call[0], call[1])
+                         for call in parsed]
+            except (ValueError, TypeError, KeyError, IndexError) as e:
+                return (f"Error: 'calls' must be a JSON list of objects with 'sub_agent_name' and 'task' "
+                        f"(or of [sub_agent_name, task] pairs): {e}")
+            results = await self.CallSubAgentsParallel(
+                [(self._qualify_sub_agent_name(name), task) for name, task in pairs],
+                max_concurrency=max_concurrency or None,
+            )
+            return json.dumps(results, ensure_ascii=False)
+
+        call_sub_agents_parallel_tool = self._make_tool(
+            fn=_call_sub_agents_parallel_tool_func, # This is async
+            name="call_sub_agents_parallel",
+            description=(
+                "Delegates several independent tasks to sub-agents at the same time and waits for all of them. "
+                "Required argument: 'calls' (string, a JSON list such as "
+                "'[{\"sub_agent_name\": \"Researcher\", \"task\": \"...\"}, {\"sub_agent_name\": \"MathExpert\", \"task\": \"...\"}]'). "
+                "Optional argument: 'max_concurrency' (integer, how many sub-agents may run at once; 0 uses the default). "
+                "Returns a JSON list with one entry per call, in the same order: 'sub_agent_name', 'status' ('ok' or 'error'), "
+                "'result' or 'error', and 'elapsed_seconds'. A failing call does not affect the others. "
+                "Prefer this over several call_specific_sub_agent calls when the tasks do not depend on each other."
+            )
+        )
+        self.tools.append(call_sub_agents_parallel_tool)
+
         def _get_current_datetime_with_timezone_func() -> str:
             """
             Retrieves the current local date and time, including the timezone name and UTC offset.
@@ -202,7 +309,7 @@ class Agent:
             if self.verbose: print(f"--- [{self.name}] Tool 'get_current_datetime_with_timezone' called ---")
             return self._get_current_datetime_with_timezone()
 
-        current_datetime_tool = FunctionTool.from_defaults(
+        current_datetime_tool = self._make_tool(
             fn=_get_current_datetime_with_timezone_func,
             name="get_current_datetime_with_timezone",
             description=(
@@ -214,15 +321,15 @@ class Agent:
         self.tools.append(current_datetime_tool)
 
         # --- URL Functionality Tools ---
-        def _load_url_document_tool_func(url: str, url_id: str) -> str:
+        async def _load_url_document_tool_func(url: str, url_id: str) -> str:
             if self.verbose: print(f"--- [{self.name}] Tool 'load_url_document' called with path: {url}, id: {url_id} ---")
-            ret = self.load_and_index_Url(url=url, url_id=url_id)
+            ret = await self.aload_and_index_Url(url=url, url_id=url_id)
             if not ret:
                 ret = "The load url document tool failed to return data"
             return ret
 
-        load_url_tool = FunctionTool.from_defaults(
-            fn=_load_url_document_tool_func,
+        load_url_tool = self._make_tool(
+            fn=_load_url_document_tool_func, # This is async
             name="load_url",
             description=(
                 "Loads and indexes a website from a given url for future querying. "
@@ -235,30 +342,30 @@ class Agent:
 
         # --- PDF Functionality Tools ---
         # --- File Functionality Tools (replaces PDF tools) ---
-        def _load_file_document_tool_func(file_path: str, item_id: str, force_reindex: bool = False) -> str:
+        async def _load_file_document_tool_func(file_path: str, item_id: str, force_reindex: bool = False) -> str:
             if self.verbose: print(f"--- [{self.name}] Tool 'load_file_document' called with path: {file_path}, id: {item_id}, force_reindex: {force_reindex} ---")
-            return self.load_and_index_item(file_path_str=file_path, item_id=item_id, force_reindex=force_reindex)
+            return await self.aload_and_index_item(file_path_str=file_path, item_id=item_id, force_reindex=force_reindex)
 
-        load_file_tool = FunctionTool.from_defaults(
-            fn=_load_file_document_tool_func,
+        load_file_tool = self._make_tool(
+            fn=_load_file_document_tool_func, # This is async
             name="load_file_document",
             description=(
                 "Loads and indexes a document from a given file path for future querying. "
                 "This tool uses FileDecoder to support various formats including PDF, DOCX, XLSX, PPTX, TXT, HTML, and others. "
                 "Required arguments: 'file_path' (string, the full or relative path to the file), "
                 "'item_id' (string, a unique identifier you assign to this file, e.g., 'report1', 'spreadsheet_data'). This ID will be used for querying and listing. create one yourself without asking"
-                "Optional argument: 'force_reindex' (boolean, defaults to False. If True, any existing index for this item_id will be deleted and rebuilt from the file). "
+                "Optional argument: 'force_reindex' (boolean, defaults to False. If True, the file content is re-checked even if its modification time is unchanged; changed parts are re-indexed). "
                 "Returns a status message. After successful loading, the file content can be queried using its 'item_id'."
             )
         )
         self.tools.append(load_file_tool)
 
-        def _query_item_document_tool_func(item_id: str, query_text: str) -> str:
+        async def _query_item_document_tool_func(item_id: str, query_text: str) -> str:
             if self.verbose: print(f"--- [{self.name}] Tool 'query_item_document' called with id: {item_id}, query: '{query_text[:70]}...' ---")
-            return self.query_indexed_item(item_id=item_id, query_text=query_text)
+            return await self.aquery_indexed_item(item_id=item_id, query_text=query_text)
 
-        query_item_tool = FunctionTool.from_defaults(
-            fn=_query_item_document_tool_func,
+        query_item_tool = self._make_tool(
+            fn=_query_item_document_tool_func, # This is async
             name="query_item_document",
             description=(
                 "Queries a previously loaded document using its assigned id. "
@@ -269,21 +376,41 @@ class Agent:
         )
         self.tools.append(query_item_tool)
 
+        async def _query_across_items_tool_func(query_text: str, item_ids: str = "") -> str:
+            if self.verbose: print(f"--- [{self.name}] Tool 'query_across_items' called with ids: '{item_ids}', query: '{query_text[:70]}...' ---")
+            return await self.aquery_across_items(query_text=query_text, item_ids=item_ids)
+
+        query_across_items_tool = self._make_tool(
+            fn=_query_across_items_tool_func, # This is async
+            name="query_across_items",
+            description=(
+                "Answers a question that spans several loaded documents or URLs in one call. "
+                "Required argument: 'query_text' (string, the question). "
+                "Optional argument: 'item_ids' (string, comma-separated item ids to search, e.g. 'report1,report2'; "
+                "leave empty to search every loaded item). "
+                "Prefer this over calling query_item_document once per item."
+            )
+        )
+        self.tools.append(query_across_items_tool)
+
         def _list_loaded_items_tool_func() -> str:
             if self.verbose: print(f"--- [{self.name}] Tool 'list_loaded_items' called ---")
             return self.list_loaded_pdfs() # Note: Function name is still list_loaded_pdfs but now lists all items
 
-        list_items_tool = FunctionTool.from_defaults(
+        list_items_tool = self._make_tool(
             fn=_list_loaded_items_tool_func,
             name="list_loaded_items",
-            description="Lists the unique IDs of all documents that are currently active in memory and available for querying."
+            description="Lists the unique IDs of all loaded documents and their types: those active in memory, and those persisted on disk that are loaded on first query."
         )
         self.tools.append(list_items_tool)
 
         # --- NEW WAIT TOOL ---
-        def _wait_seconds_tool_func(seconds: int) -> str:
+        async def _wait_seconds_tool_func(seconds: int) -> str:
             """
             Pauses the agent's execution for a specified number of seconds.
+            Short waits are awaited in the run (other requests keep running). Longer ones suspend the
+            session: the run ends, and the server checkpoints the session and resumes it from a
+            scheduled task once the wait is over.
             Args:
                 seconds (int): The number of seconds to wait. Must be a positive integer.
             Returns:
@@ -296,12 +423,14 @@ class Agent:
                 s = int(seconds)
                 if s <= 0:
                     return "Error: Wait duration must be a positive number of seconds."
-                if s > 300:  # Optional: Set a reasonable upper limit for safety
+                if s > WAIT_SUSPEND_AFTER_SECONDS and self.session.suspendable:
+                    return self._suspend_for(min(s, WAIT_MAX_SECONDS))
+                if s > WAIT_MAX_INLINE_SECONDS:  # Optional: Set a reasonable upper limit for safety
                     print(
-                        f"--- [{self.name}] Warning: Wait duration {s} is very long. Capping at 300 seconds for safety. ---")
-                    s = 300
+                        f"--- [{self.name}] Warning: Wait duration {s} is very long. Capping at {WAIT_MAX_INLINE_SECONDS} seconds for safety. ---")
+                    s = WAIT_MAX_INLINE_SECONDS
 
-                time.sleep(s)
+                await asyncio.sleep(s)
                 msg = f"Successfully waited for {s} seconds."
                 if self.verbose:
                     print(f"--- [{self.name}] {msg} ---")
@@ -314,7 +443,7 @@ class Agent:
                     print(f"--- [{self.name}] {error_msg} ---")
                 return error_msg
 
-        wait_seconds_tool = FunctionTool.from_defaults(
+        wait_seconds_tool = self._make_tool(
             fn=_wait_seconds_tool_func,
             name="wait_seconds",
             description=(
@@ -322,7 +451,8 @@ class Agent:
                 "Use this tool if you need to introduce a delay, for example, to wait for an external process to complete, "
                 "to respect a rate limit not handled by other means, or to implement a cooldown period. "
                 "Required argument: 'seconds' (integer, the duration to wait in seconds, e.g., 5 for five seconds). "
-                "Keep the wait time reasonable (e.g., 1 to 60 seconds typically, max 300)."
+                f"In server conversations, waits longer than {WAIT_SUSPEND_AFTER_SECONDS} seconds (max {WAIT_MAX_SECONDS}) pause the conversation: "
+                "end your turn right after the call, and you will be resumed automatically when the wait is over."
             )
         )
         self.tools.append(wait_seconds_tool)
@@ -336,7 +466,7 @@ class Agent:
                 requested_filename=requested_filename
             )
 
-        write_file_tool = FunctionTool.from_defaults(
+        write_file_tool = self._make_tool(
             fn=self._create_document_from_description_internal, # Renamed function internally
             name="write_file",
             description=(
@@ -358,7 +488,7 @@ class Agent:
             if self.verbose: print(f"--- [{self.name}] Tool 'send_email' called to {recipient} ---")
             return self._send_email_internal(recipient=recipient, subject=subject, body=body, attachment_paths=attachment_paths)
 
-        send_email_tool = FunctionTool.from_defaults(
+        send_email_tool = self._make_tool(
             fn=_send_email_tool_func,
             name="send_email",
             description=(
@@ -377,7 +507,7 @@ class Agent:
             if self.verbose: print(f"--- [{self.name}] Tool 'draft_email' called for {recipient} ---")
             return self._draft_email_internal(recipient=recipient, subject=subject, body=body, attachment_paths=attachment_paths)
 
-        draft_email_tool = FunctionTool.from_defaults(
+        draft_email_tool = self._make_tool(
             fn=_draft_email_tool_func,
             name="draft_email",
             description=(
@@ -391,25 +521,29 @@ class Agent:
         )
         self.tools.append(draft_email_tool)
 
-        def _schedule_task_tool_func(prompt: str, scheduled_time_iso: str) -> str:
-            """schedules a task for later execution."""
+        async def _schedule_task_tool_func(prompt: str, scheduled_time_iso: str = "", cron_expression: str = "",
+                                           interval_seconds: int = 0) -> str:
+            """schedules a task for later execution, optionally repeating."""
             if self.verbose: print(f"--- [{self.name}] Tool 'schedule_task' called for task {str} ---")
-            return self._schedule_task_internally(prompt, scheduled_time_iso)
+            return await self._schedule_task_internally(prompt, scheduled_time_iso, cron_expression, interval_seconds)
 
-        schedule_task_tool = FunctionTool.from_defaults(
+        schedule_task_tool = self._make_tool(
             fn=_schedule_task_tool_func,
             name="schedule_task",
             description=(
                 "Schedules a task the will be given to you to execute at a given time. "
                 "Required arguments: 'prompt' (string, The prompt string for the new task.), "
-                "'scheduled_time_iso' (string, The scheduled time in ISO 8601 format (e.g., 2024-03-15T10:00:00Z).)."
-                "Returns a string containing A dictionary with status, message, and task_id if successful."
+                "'scheduled_time_iso' (string, The scheduled time in ISO 8601 format (e.g., 2024-03-15T10:00:00Z).). "
+                "To repeat the task, also pass either 'cron_expression' (string, five-field cron in UTC, e.g. "
+                "'0 9 * * 1-5' for weekdays at 09:00) or 'interval_seconds' (integer); scheduled_time_iso is then "
+                "the first run and may be left empty. "
+                "Returns a string containing A dictionary with status, message, and task_id (or schedule_id) if successful."
             )
         )
         self.tools.append(schedule_task_tool)
 
         # --- CLI Input Tool ---
-        cli_input_tool = FunctionTool.from_defaults(
+        cli_input_tool = self._make_tool(
             fn=self._get_text_input_tool_func,
             name="get_text_input",
             description=(
@@ -423,10 +557,10 @@ class Agent:
 
         def _create_plan_tool_func(plan: str) -> str:  # Added self here as it's a method
             """Creates/stores a plan for a task."""
-            self.plan = plan  # Assuming self.plan is an attribute of your agent class
+            self.session.set_plan(plan)
             return "Plan successfully created and stored."
 
-        create_plan_tool = FunctionTool.from_defaults(
+        create_plan_tool = self._make_tool(
             fn=_create_plan_tool_func,  # Corrected to use the intended function and made it a method call
             name="create_plan",  # Changed name to snake_case for consistency, but "create plan" works if preferred
             description=(
@@ -444,7 +578,7 @@ class Agent:
             if self.verbose: print(f"--- [{self.name}] Tool 'view_check' called for task {str} ---")
             return self._view_check_tool(doCheck)
 
-        view_check_tool = FunctionTool.from_defaults(
+        view_check_tool = self._make_tool(
             fn=_view_check_tool_func,  # Corrected to use the intended function and made it a method call
             name="view_check_plan",  # Changed name to snake_case for consistency, but "create plan" works if preferred
             description=(
@@ -560,57 +694,78 @@ class Agent:
         return {'raw': raw_message}
 
     def ListSubAgents(self) -> str:
-        """Lists the names of all created sub-agents."""
-        return str(list(self.SubWorkers.keys()))
+        """Lists the names of all created sub-agents, including persisted ones not built yet."""
+        names = list(self.SubWorkers.keys())
+        names += [name for name in get_sub_agent_store().children(self.name) if name not in self.SubWorkers]
+        return str(names)
+
+    def _get_sub_agent(self, name: str) -> "Agent | None":
+        """A sub-agent by full name, built from its persisted definition on first use."""
+        sub_agent = self.SubWorkers.get(name)
+        if sub_agent is None:
+            definition = get_sub_agent_store().get(name)
+            if definition is None or definition["parent"] != self.name:
+                return None
+            sub_agent = self.SubWorkers[name] = self._build_sub_agent(name, definition["system_prompt"])
+        return sub_agent
+
+    def _build_sub_agent(self, name: str, system_prompt: str) -> "Agent":
+        return Agent(
+            self.server,
+            system_prompt=system_prompt,
+            name=name,
+            verbose=self.verbose,
+            shared_query_engines=self.query_engines,
+        )
 
     def _view_check_tool(self, doCheck=bool) -> str:  # Added self here as it's a method
         """
         Reviews the current execution plan. Optionally marks the current 'NEXT' step as 'DONE'
         and advances to the subsequent step if 'mark_current_step_as_done' is True.
         """
-        if not self.plan or not self.parsed_plan_steps:
+        if not self.session.plan or not self.session.parsed_plan_steps:
             # This check handles the case where _create_plan was not called or failed to parse
-            if not self.plan:
+            if not self.session.plan:
                 return "No plan has been created yet. Use 'create_plan' to set a plan first."
-            else:  # self.plan exists but self.parsed_plan_steps is empty
+            else:  # self.session.plan exists but self.session.parsed_plan_steps is empty
                 return "A plan string exists, but it could not be parsed into actionable steps. Please check the plan format or recreate it."
 
-        num_steps = len(self.parsed_plan_steps)
+        num_steps = len(self.session.parsed_plan_steps)
         response_parts = []
 
         # Action: Mark step as done (if requested and applicable)
         if doCheck:
-            if self.current_step_index < num_steps:
+            if self.session.current_step_index < num_steps:
                 # The step at current_step_index is the one being marked done
-                completed_step_text = self.parsed_plan_steps[self.current_step_index]
-                response_parts.append(f"Marking Step {self.current_step_index + 1} ('{completed_step_text}') as DONE.")
-                self.last_completed_step_index = self.current_step_index
-                self.current_step_index += 1  # Advance to the next step
-            elif self.current_step_index >= num_steps and self.last_completed_step_index == num_steps - 1:
+                completed_step_text = self.session.parsed_plan_steps[self.session.current_step_index]
+                response_parts.append(f"Marking Step {self.session.current_step_index + 1} ('{completed_step_text}') as DONE.")
+                self.session.last_completed_step_index = self.session.current_step_index
+                self.session.current_step_index += 1  # Advance to the next step
+            elif self.session.current_step_index >= num_steps and self.session.last_completed_step_index == num_steps - 1:
                 response_parts.append("All plan steps have already been completed. No further steps to mark done.")
             else:
                 response_parts.append(
                     "Cannot mark step as done: Already at the end of the plan, or no steps were pending to be marked.")
         else:
-            if self.last_completed_step_index == -1 and self.current_step_index == 0:
+            if self.session.last_completed_step_index == -1 and self.session.current_step_index == 0:
                 response_parts.append("Viewing initial plan. No steps marked done yet.")
-            elif self.last_completed_step_index >= 0:
+            elif self.session.last_completed_step_index >= 0:
                 response_parts.append(
-                    f"Viewing plan. Last completed step was {self.last_completed_step_index + 1}. No new step marked as done in this call.")
+                    f"Viewing plan. Last completed step was {self.session.last_completed_step_index + 1}. No new step marked as done in this call.")
             else:  # current_step_index might be > 0 but nothing completed if mark_done was always false
                 response_parts.append("Viewing plan. No steps marked done yet.")
 
         # Display: Show the full plan with current status
         response_parts.append("\n--- Current Plan Status ---")
-        if not self.parsed_plan_steps:  # Should be caught earlier, but for safety
+        if not self.session.parsed_plan_steps:  # Should be caught earlier, but for safety
             response_parts.append("  (No steps in plan to display)")
         else:
-            for i, step_text in enumerate(self.parsed_plan_steps):
-                if i <= self.last_completed_step_index:
+            for i, step_text in enumerate(self.session.parsed_plan_steps):
+                if i <= self.session.last_completed_step_index:
                     prefix = f"  [DONE] Step {i + 1}:"
-                elif i == self.current_step_index and i < num_steps:  # The new current/next step
+                elif i == self.session.current_step_index and i < num_steps:  # The new current/next step
                     prefix = f"  [NEXT] Step {i + 1}:"
-                elif i > self.current_step_index and i < num_steps:  # Upcoming steps
+                elif i > self.session.current_step_index and i < num_steps:  # Upcoming steps
                     prefix = f"         Step {i + 1}:"
                 else:  # Only if all steps are done and i >= num_steps (should not be hit if list ends)
                     # This case might occur if parsed_plan_steps is empty after the check above.
@@ -620,10 +775,10 @@ class Agent:
                 response_parts.append(f"{prefix} {step_text}")
 
         # Conclusion: Indicate next step or plan completion
-        if self.current_step_index < num_steps:
-            next_step_text = self.parsed_plan_steps[self.current_step_index]
-            response_parts.append(f"\nNext action is Step {self.current_step_index + 1}: '{next_step_text}'")
-        elif self.last_completed_step_index == num_steps - 1 and num_steps > 0:  # All steps are actually done
+        if self.session.current_step_index < num_steps:
+            next_step_text = self.session.parsed_plan_steps[self.session.current_step_index]
+            response_parts.append(f"\nNext action is Step {self.session.current_step_index + 1}: '{next_step_text}'")
+        elif self.session.last_completed_step_index == num_steps - 1 and num_steps > 0:  # All steps are actually done
             response_parts.append("\nPLAN COMPLETE: All steps have been processed.")
         elif num_steps == 0:
             response_parts.append("\nPlan is empty.")
@@ -646,18 +801,15 @@ class Agent:
         """
         try:
             name = self.name + "/" + name
-            if name in self.SubWorkers:
+            if self._get_sub_agent(name) is not None:
                 msg = f"Warning: Sub-agent with name '{name}' already exists. Returning existing instance."
                 print(msg)
                 return msg
             if self.verbose:
                 print(f"--- [{self.name}] Creating SubAgent: '{name}' ---")
-            sub_agent = Agent(
-                system_prompt=system_prompt,
-                name=name,
-                verbose=self.verbose
-            )
-            self.SubWorkers[name] = sub_agent
+            self.SubWorkers[name] = self._build_sub_agent(name, system_prompt)
+            # Persisted, so the sub-agent survives restarts and every pooled agent can call it.
+            get_sub_agent_store().put(name, self.name, system_prompt)
             return f"Sub-agent '{name}' created successfully with system prompt: '{system_prompt}'. It can now be called using its name."
         except Exception as e:
             msg = f"Error creating sub-agent '{name}': {str(e)}"
@@ -753,10 +905,13 @@ class Agent:
             return error_msg
 
 
-    def _schedule_task_internally(self, prompt: str, scheduled_time_iso: str) -> str:
+    async def _schedule_task_internally(self, prompt: str, scheduled_time_iso: str, cron_expression: str = "",
+                                        interval_seconds: int = 0) -> str:
         if self.verbose:
             print(f"--- [{self.name}] scheduling task at {scheduled_time_iso} ---")
-        return self.server._schedule_new_prompt_tool(prompt, scheduled_time_iso)
+        # The server inserts the task and wakes its scheduler if this deadline is earlier than the current one.
+        return await self.server._schedule_new_prompt_tool(prompt, scheduled_time_iso, cron_expression,
+                                                           interval_seconds)
 
     def _get_current_datetime_with_timezone(self) -> str:
         """
@@ -787,16 +942,73 @@ class Agent:
         Returns:
             The result from the sub-agent's run method or an error message.
         """
-        if name in self.SubWorkers:
-            sub_agent = self.SubWorkers[name]
-            if self.verbose:
-                print(f"--- [{self.name}] Directly calling SubAgent '{name}' with task: {task} ---")
-            return await sub_agent.run(task)
-        else:
-            error_msg = f"Error: Sub-agent '{name}' not found in '{self.name}'."
+        try:
+            return await self._call_sub_agent(name, task)
+        except SubAgentNotFoundError as e:
+            error_msg = f"Error: {e}"
             if self.verbose:
                 print(f"--- [{self.name}] {error_msg} ---")
             return error_msg
+        except Exception as e:
+            print(f"--- [{name}] Error during run: {e} ---")
+            import traceback
+            traceback.print_exc()
+            return f"Error in {name}: {str(e)}"
+
+    async def _call_sub_agent(self, name: str, task: str) -> str:
+        """
+        Runs `task` on sub-agent `name` and returns its answer. Raises SubAgentNotFoundError for an
+        unknown sub-agent, and whatever the sub-agent's run raises.
+        """
+        sub_agent = self._get_sub_agent(name)
+        if sub_agent is None:
+            raise SubAgentNotFoundError(f"Sub-agent '{name}' not found in '{self.name}'.")
+        if self.verbose:
+            print(f"--- [{self.name}] Directly calling SubAgent '{name}' with task: {task} ---")
+        if sub_agent.verbose:
+            print(f"\n--- [{name}] Task received: {task} ---")
+        lock = self._sub_agent_locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            # The sub-agent continues this conversation's delegation history, not another session's.
+            sub_agent.session = self.session.sub_agent_session(name)
+            try:
+                return await sub_agent._run(task)
+            finally:
+                sub_agent.session = AgentSession()
+
+    async def CallSubAgentsParallel(self, calls: list[tuple[str, str]], max_concurrency: int | None = None) -> list[dict]:
+        """
+        Runs several (sub_agent_name, task) calls concurrently, at most `max_concurrency`
+        (default SUB_AGENT_MAX_CONCURRENCY) at a time. Calls to the same sub-agent still run one after
+        another, since they share its memory.
+
+        Returns one dict per call, in the order given: sub_agent_name, status ("ok" or "error"),
+        result or error, and elapsed_seconds. A failing call never cancels or fails the others.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or SUB_AGENT_MAX_CONCURRENCY))
+
+        async def run_one(name: str, task: str) -> dict:
+            async with semaphore:
+                started = time.monotonic()
+                # Failures are the exceptions raised by the call, never inferred from the answer's text.
+                try:
+                    result, failed = await self._call_sub_agent(name, task), False
+                except Exception as e:
+                    result, failed = f"{type(e).__name__}: {e}", True
+                elapsed = round(time.monotonic() - started, 3)
+            if self.verbose:
+                print(f"--- [{self.name}] SubAgent '{name}' finished in {elapsed}s ({'error' if failed else 'ok'}) ---")
+            outcome = {"sub_agent_name": name, "status": "error" if failed else "ok", "elapsed_seconds": elapsed}
+            outcome["error" if failed else "result"] = result
+            return outcome
+
+        if self.verbose:
+            print(f"--- [{self.name}] Fanning out {len(calls)} sub-agent call(s) ---")
+        return list(await asyncio.gather(*(run_one(name, task) for name, task in calls)))
+
+    def _qualify_sub_agent_name(self, sub_agent_name: str) -> str:
+        # Logic from original codebase to correctly qualify sub-agent name
+        return sub_agent_name if "/" in sub_agent_name else f"{self.name}/{sub_agent_name}"
 
     def _ensure_pdf_settings_configured(self):
         """
@@ -816,7 +1028,7 @@ class Agent:
                 api_key=GeminiKey,
                 temperature=PDF_CONTEXT_LLM_TEMP
             )
-            Settings.embed_model = GeminiEmbedding(
+            Settings.embed_model = RateLimitedGeminiEmbedding(
                 model_name=PDF_EMBED_MODEL_NAME, 
                 api_key=GeminiKey
             )
@@ -829,15 +1041,13 @@ class Agent:
                 print(f"--- [{self.name}] LlamaIndex.Settings configured for PDF.Embed: {PDF_EMBED_MODEL_NAME}, Parser: chunk_size={PDF_CHUNK_SIZE} ---")
 
 
-    def load_and_index_Url(self, url: str, url_id: str):
-        # --- RAG Pipeline ---
-        # 3. Load data from the URL
+    def _prepare_url_load(self, url_id: str) -> tuple[str, Path]:
         my_gemini_embed_model = Settings.embed_model
         if not isinstance(my_gemini_embed_model, GeminiEmbedding):
             print("CRITICAL: Settings.embed_model is not a GeminiEmbedding instance. Re-initializing for local use.")
             # Fallback if global settings failed, or for explicit local control
             try:
-                Settings.embed_model = GeminiEmbedding(model_name="models/embedding-001")
+                Settings.embed_model = RateLimitedGeminiEmbedding(model_name="models/embedding-001")
             except Exception as e_embed_init:
                 print(f"Failed to initialize GeminiEmbedding locally: {e_embed_init}")
                 raise
@@ -847,82 +1057,188 @@ class Agent:
              sane_url_id = "default_url_id"
         if url_id != sane_url_id and self.verbose:
             print(f"--- [{self.name}] Sanitized pdf_id from '{url_id}' to '{sane_url_id}' for directory naming. ---")
+        return sane_url_id, self.persist_base_dir / sane_url_id
 
-        persist_dir = self.persist_base_dir / sane_url_id
+    def _load_url_index(self, sane_url_id: str, persist_dir: Path) -> VectorStoreIndex | None:
+        """Existing index of a URL (None in shared mode, where the item is a view of the shared index)."""
+        if self.verbose:
+            print(f"--- [{self.name}] Loading existing index for '{sane_url_id}' ---")
+        index = None
+        if self._shared_item_index() is None:
+            storage_context = load_storage_context(str(persist_dir))
+            index = load_index_from_storage(storage_context, embed_model=Settings.embed_model)  # Uses Settings.embed_model
+        if self.verbose:
+            print(f"--- [{self.name}] Index for '{sane_url_id}' loaded successfully. ---")
+        return index
 
+    def _fetch_url_nodes(self, url: str, sane_url_id: str) -> list | None:
+        """Downloads the page and splits it into nodes; None when the page could not be loaded."""
+        if self.verbose:
+            print(f"--- [{self.name}] Creating new index for '{sane_url_id}' from URL: {url} ---")
+        loader = SimpleWebPageReader(html_to_text=True)
+        try:
+            # It's good practice to set a timeout for web requests
+            documents = loader.load_data(urls=[url])
+        except Exception as e:
+            print(f"Error loading data from URL {url}: {e}")
+            print(
+                "This could be due to the website structure, content type (e.g., PDF instead of HTML), access restrictions, or timeout.")
+            return None
+        return Settings.node_parser.get_nodes_from_documents(documents)
+
+    def _store_url_nodes(self, sane_url_id: str, persist_dir: Path, nodes: list) -> VectorStoreIndex | None:
+        """Indexes and persists embedded URL nodes (in the shared index when it is enabled)."""
+        shared_index = self._shared_item_index()
+        if shared_index is not None:
+            shared_index.update_item(sane_url_id, URL_TYPE, nodes, [])
+            return None
+        persist_dir.mkdir(parents=True, exist_ok=True)
+        index = VectorStoreIndex(nodes, storage_context=new_storage_context(), embed_model=Settings.embed_model)
+        index.storage_context.persist(persist_dir=str(persist_dir))
+        return index
+
+    def _url_load_error(self, url: str, url_id: str, e: Exception) -> str:
+        error_msg = f"Error processing URL '{url}' (ID: {url_id}): {str(e)}"
+        if self.verbose:
+            print(f"--- [{self.name}] {error_msg} ---")
+            import traceback
+            traceback.print_exc()
+        return error_msg
+
+    def load_and_index_Url(self, url: str, url_id: str):
+        # --- RAG Pipeline ---
+        sane_url_id, persist_dir = self._prepare_url_load(url_id)
         try:
             if sane_url_id in self.query_engines:
                 return f"PDF '{url_id}' (ID: {sane_url_id}) is already loaded in memory. Use force_reindex=True to reload from file."
 
-
-            index = None
-            if persist_dir.exists():
-                if self.verbose:
-                    print(f"--- [{self.name}] Loading existing index for '{sane_url_id}' from {persist_dir} ---")
-                storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
-                index = load_index_from_storage(storage_context, embed_model=Settings.embed_model)  # Uses Settings.embed_model
-                if self.verbose:
-                    print(f"--- [{self.name}] Index for '{sane_url_id}' loaded successfully. ---")
+            if self._item_index_exists(sane_url_id, persist_dir):
+                index = self._load_url_index(sane_url_id, persist_dir)
             else:
+                nodes = self._fetch_url_nodes(url, sane_url_id)
+                if nodes is None:
+                    return
+                # Chunks seen before reuse their cached embeddings
+                embedding_service = get_embedding_service(Settings.embed_model)
+                embedding_service.embed_nodes(nodes)
                 if self.verbose:
-                    print(f"--- [{self.name}] Creating new index for '{sane_url_id}' from URL: {url} ---")
-
-                persist_dir.mkdir(parents=True, exist_ok=True)
+                    print(f"--- [{self.name}] Embeddings for '{sane_url_id}': {embedding_service.stats()} ---")
+                index = self._store_url_nodes(sane_url_id, persist_dir, nodes)
 
-                loader = SimpleWebPageReader(html_to_text=True)
-                documents = []
-                try:
-                    # It's good practice to set a timeout for web requests
-                    documents = loader.load_data(urls=[url])
-                except Exception as e:
-                    print(f"Error loading data from URL {url}: {e}")
-                    print(
-                        "This could be due to the website structure, content type (e.g., PDF instead of HTML), access restrictions, or timeout.")
-                    return
+            # Query engine uses Settings.llm by default if not overridden
+            self._cache_query_engine(sane_url_id, QueryTypes(self._item_query_engine(sane_url_id, index), URL_TYPE))
+            return f"URL '{url}' (ID: {sane_url_id}) processed. Query engine ready."
+        except Exception as e:
+            return self._url_load_error(url, url_id, e)
 
-                # 4. Create an index from the loaded documents
-                index = VectorStoreIndex.from_documents(documents, embed_model=Settings.embed_model)
+    async def aload_and_index_Url(self, url: str, url_id: str):
+        """
+        load_and_index_Url without blocking the event loop: the download, parsing and index I/O run on
+        worker threads and the embedding requests are awaited.
+        """
+        sane_url_id, persist_dir = self._prepare_url_load(url_id)
+        try:
+            async with self._item_load_lock(sane_url_id):
+                if sane_url_id in self.query_engines:
+                    return f"PDF '{url_id}' (ID: {sane_url_id}) is already loaded in memory. Use force_reindex=True to reload from file."
+
+                if await asyncio.to_thread(self._item_index_exists, sane_url_id, persist_dir):
+                    index = await asyncio.to_thread(self._load_url_index, sane_url_id, persist_dir)
+                else:
+                    nodes = await asyncio.to_thread(self._fetch_url_nodes, url, sane_url_id)
+                    if nodes is None:
+                        return
+                    embedding_service = get_embedding_service(Settings.embed_model)
+                    await embedding_service.aembed_nodes(nodes)
+                    if self.verbose:
+                        print(f"--- [{self.name}] Embeddings for '{sane_url_id}': {embedding_service.stats()} ---")
+                    index = await asyncio.to_thread(self._store_url_nodes, sane_url_id, persist_dir, nodes)
 
-            if index:
-                # Query engine uses Settings.llm by default if not overridden
-                query_engine = index.as_query_engine(similarity_top_k=ITEM_SIMILARITY_TOP_K)
-                self.query_engines[sane_url_id] = QueryTypes(query_engine, URL_TYPE)
+                query_engine = await asyncio.to_thread(self._item_query_engine, sane_url_id, index)
+                await asyncio.to_thread(self._cache_query_engine, sane_url_id, QueryTypes(query_engine, URL_TYPE))
                 return f"URL '{url}' (ID: {sane_url_id}) processed. Query engine ready."
-            else:  # Should not be reached if logic is correct
-                return f"Error: Failed to load or create index for URL '{url}' (ID: {sane_url_id})."
         except Exception as e:
-            error_msg = f"Error processing URL '{url}' (ID: {url_id}): {str(e)}"
-            if self.verbose:
-                print(f"--- [{self.name}] {error_msg} ---")
-                import traceback
-                traceback.print_exc()
-            return error_msg
+            return self._url_load_error(url, url_id, e)
 
+    def _item_load_lock(self, sane_item_id: str) -> asyncio.Lock:
+        """Serializes async loads of the same item across the agents sharing this event loop."""
+        lock = _item_load_locks.get(sane_item_id)
+        if lock is None:
+            lock = _item_load_locks[sane_item_id] = asyncio.Lock()
+        return lock
 
     def load_and_index_item(self, file_path_str: str, item_id: str, force_reindex: bool = False) -> str:
         """
         Loads a file from the given path, processes its text content,
         creates/loads a vector index, and stores a query engine for it.
         Uses FileDecoder to handle various file types.
+
+        A per-item manifest records the file and chunk hashes the index was built from. An unchanged
+        file is detected from its mtime/size (or content hash) without re-extraction; a changed file
+        only has its changed chunks deleted from and inserted into the existing index.
+        `force_reindex` skips the mtime/size shortcut and always re-checks the file content.
         """
         self._ensure_pdf_settings_configured() # Settings are general for embedding/LLM
 
+        load = self._start_item_load(file_path_str, item_id, force_reindex)
+        if isinstance(load, str):
+            return load
+        try:
+            message = self._check_item_current(load)
+            if message:
+                return message
+
+            # Use FileDecoder to get content
+            pages, error_msg = get_file_pages(str(load.file_path))
+            message = self._parse_item_content(load, pages, error_msg)
+            if message:
+                return message
+
+            embedding_service = get_embedding_service(Settings.embed_model)
+            embedding_service.embed_nodes(load.new_nodes)
+            if self.verbose:
+                print(f"--- [{self.name}] Embeddings for '{load.sane_item_id}': {embedding_service.stats()} ---")
+
+            return self._apply_item_load(load)
+        except Exception as e:
+            return self._item_load_error(file_path_str, item_id, e)
+
+    async def aload_and_index_item(self, file_path_str: str, item_id: str, force_reindex: bool = False) -> str:
+        """
+        load_and_index_item without blocking the event loop: text extraction runs in a worker process,
+        hashing, parsing and index I/O on worker threads, and the embedding requests are awaited.
+        """
+        self._ensure_pdf_settings_configured()
+
+        load = await asyncio.to_thread(self._start_item_load, file_path_str, item_id, force_reindex)
+        if isinstance(load, str):
+            return load
+        try:
+            async with self._item_load_lock(load.sane_item_id):
+                message = await asyncio.to_thread(self._check_item_current, load)
+                if message:
+                    return message
+
+                pages, error_msg = await aget_file_pages(str(load.file_path))
+                message = await asyncio.to_thread(self._parse_item_content, load, pages, error_msg)
+                if message:
+                    return message
+
+                embedding_service = get_embedding_service(Settings.embed_model)
+                await embedding_service.aembed_nodes(load.new_nodes)
+                if self.verbose:
+                    print(f"--- [{self.name}] Embeddings for '{load.sane_item_id}': {embedding_service.stats()} ---")
+
+                return await asyncio.to_thread(self._apply_item_load, load)
+        except Exception as e:
+            return self._item_load_error(file_path_str, item_id, e)
+
+    def _start_item_load(self, file_path_str: str, item_id: str, force_reindex: bool) -> "_ItemLoad | str":
         file_path = Path(file_path_str).resolve() # Resolve to absolute path
         print(f"Attempting to load and index file: {file_path}")
         if not file_path.exists() or not file_path.is_file():
             return f"Error: File not found at '{file_path_str}' (resolved to '{file_path}')."
 
-        # Use FileDecoder to get content
-        content, error_msg = get_file_content(str(file_path))
-
-        if error_msg:
-            print(f"--- Error during file content extraction: {error_msg} ---")
-            return f"Error extracting content from '{file_path_str}': {error_msg}"
-
-        if not content or not content.strip():
-             print(f"--- No text content extracted from file: {file_path} ---")
-             return f"Error: No text content could be extracted from '{file_path_str}', or the file is not suitable for text summarization."
-
         # Basic sanitization for item_id to be used as a directory name
         sane_item_id = "".join(c if c.isalnum() or c in ['_', '-'] else '_' for c in item_id)
         if not sane_item_id: # Should not happen if item_id is not empty
@@ -930,65 +1246,273 @@ class Agent:
         if item_id != sane_item_id and self.verbose:
             print(f"--- [{self.name}] Sanitized item_id from '{item_id}' to '{sane_item_id}' for directory naming. ---")
 
-        item_persist_dir = self.persist_base_dir / sane_item_id
+        return _ItemLoad(file_path, file_path_str, sane_item_id, self.persist_base_dir / sane_item_id, force_reindex)
+
+    def _check_item_current(self, load: "_ItemLoad") -> str | None:
+        """Returns a status message when the persisted index is already current, else None (hashing the file)."""
+        manifest = ItemManifest.load(load.item_persist_dir)
+        if manifest is not None and not self._item_index_exists(load.sane_item_id, load.item_persist_dir):
+            manifest = None  # Manifest without an index: rebuild.
+        load.manifest = manifest
+
+        # Cheap check first: same path, mtime and size as when the index was built.
+        if manifest is not None and not load.force_reindex and manifest.matches_stat(load.file_path):
+            return self._register_item_index(load.sane_item_id, load.item_persist_dir, load.file_path_str, "unchanged")
+
+        load.current_sha256 = file_sha256(load.file_path)
+        if manifest is not None and manifest.file_sha256 == load.current_sha256:
+            # Touched or copied, but the same bytes: the index is still current.
+            manifest.refresh_stat(load.file_path)
+            manifest.save(load.item_persist_dir)
+            return self._register_item_index(load.sane_item_id, load.item_persist_dir, load.file_path_str, "unchanged")
+        return None
+
+    def _parse_item_content(self, load: "_ItemLoad", pages: list[str], error_msg: str) -> str | None:
+        """Splits extracted text into nodes and diffs their hashes with the manifest; returns an error message or None."""
+        if error_msg:
+            print(f"--- Error during file content extraction: {error_msg} ---")
+            return f"Error extracting content from '{load.file_path_str}': {error_msg}"
 
-        try:
-            if sane_item_id in self.query_engines and not force_reindex:
-                return f"Item '{item_id}' (ID: {sane_item_id}) is already loaded in memory. Use force_reindex=True to reload from file."
+        if not any(page.strip() for page in pages):
+             print(f"--- No text content extracted from file: {load.file_path} ---")
+             return f"Error: No text content could be extracted from '{load.file_path_str}', or the file is not suitable for text summarization."
 
-            if force_reindex and item_persist_dir.exists():
-                if self.verbose:
-                    print(f"--- [{self.name}] FORCE_REINDEX: Deleting existing index for '{sane_item_id}' at {item_persist_dir} ---")
-                shutil.rmtree(item_persist_dir)
+        # One Document per page (PDFs; other formats are a single page): an edit then only changes the
+        # chunks of the pages it touches, and every other chunk keeps its hash.
+        documents = [Document(text=page, metadata={'file_path': str(load.file_path)})
+                     for page in pages if page.strip()]
+
+        if not documents: # Should not happen if content is not empty
+            return f"Error: Could not create document object from extracted content for '{load.file_path_str}'."
+        if self.verbose:
+            print(f"--- [{self.name}] Created {len(documents)} document object(s) from extracted text. ---")
 
-            index = None
+        nodes = Settings.node_parser.get_nodes_from_documents(documents, show_progress=self.verbose)
+        if not nodes:
+            return f"Error: No nodes (chunks) were created from the content of '{load.file_path_str}'."
+        if self.verbose:
+            print(f"--- [{self.name}] Parsed into {len(nodes)} Node object(s). ---")
+
+        load.nodes = nodes
+        load.chunk_hashes = [chunk_sha256(node.get_content(metadata_mode=MetadataMode.EMBED)) for node in nodes]
+        load.to_insert, load.to_delete = diff_chunks(load.old_chunks, load.chunk_hashes)
+        return None
+
+    def _apply_item_load(self, load: "_ItemLoad") -> str:
+        """Builds or updates the item's index from the embedded nodes, persists it and its manifest, and registers it."""
+        sane_item_id, item_persist_dir = load.sane_item_id, load.item_persist_dir
+        old_chunks, to_insert, to_delete, new_nodes = load.old_chunks, load.to_insert, load.to_delete, load.new_nodes
+        shared_index = self._shared_item_index()
+        index = None
+        if load.manifest is None:
+            # No trustworthy index: build from scratch (any leftover directory is from an older layout
+            # or an interrupted update).
             if item_persist_dir.exists():
-                if self.verbose:
-                    print(f"--- [{self.name}] Loading existing index for '{sane_item_id}' from {item_persist_dir} ---")
-                storage_context = StorageContext.from_defaults(persist_dir=str(item_persist_dir))
-                index = load_index_from_storage(storage_context) # Uses Settings.embed_model
-                if self.verbose:
-                    print(f"--- [{self.name}] Index for '{sane_item_id}' loaded successfully. ---")
+                shutil.rmtree(item_persist_dir)
+            item_persist_dir.mkdir(parents=True, exist_ok=True)
+            if self.verbose:
+                print(f"--- [{self.name}] Creating new index for '{sane_item_id}' from file: {load.file_path} ---")
+            if shared_index is not None:
+                shared_index.update_item(sane_item_id, FILE_TYPE, new_nodes, [], replace=True)
             else:
-                if self.verbose:
-                    print(f"--- [{self.name}] Creating new index for '{sane_item_id}' from file: {file_path} ---")
-
-                item_persist_dir.mkdir(parents=True, exist_ok=True)
-
-                # Create a single Document from the extracted content
-                documents = [Document(text=content, metadata={'file_path': str(file_path)})]
+                # Nodes already carry their embeddings, so the index build makes no embedding calls.
+                index = VectorStoreIndex(new_nodes, storage_context=new_storage_context(), show_progress=self.verbose)
+        else:
+            if self.verbose:
+                print(f"--- [{self.name}] Updating index for '{sane_item_id}': "
+                      f"{len(to_insert)} chunk(s) added, {len(to_delete)} removed, "
+                      f"{len(old_chunks) - len(to_delete)} unchanged. ---")
+            ItemManifest.invalidate(item_persist_dir)
+            if shared_index is not None:
+                shared_index.update_item(sane_item_id, FILE_TYPE, new_nodes, to_delete)
+            else:
+                storage_context = load_storage_context(str(item_persist_dir))
+                index = load_index_from_storage(storage_context)
+                if to_delete:
+                    index.delete_nodes(to_delete, delete_from_docstore=True)
+                if new_nodes:
+                    index.insert_nodes(new_nodes)
+
+        if index is not None:
+            index.storage_context.persist(persist_dir=str(item_persist_dir))
+        deleted = set(to_delete)
+        kept_chunks = {chunk_hash: node_id for chunk_hash, node_id in old_chunks.items() if node_id not in deleted}
+        kept_chunks.update({load.chunk_hashes[position]: load.nodes[position].node_id for position in to_insert})
+        stat = load.file_path.stat()
+        ItemManifest(str(load.file_path), load.current_sha256, stat.st_mtime_ns, stat.st_size, kept_chunks).save(item_persist_dir)
+        if self.verbose:
+            print(f"--- [{self.name}] Index for '{sane_item_id}' persisted to {item_persist_dir}. ---")
 
-                if not documents: # Should not happen if content is not empty
-                    return f"Error: Could not create document object from extracted content for '{file_path_str}'."
-                if self.verbose:
-                    print(f"--- [{self.name}] Created 1 document object from extracted text. ---")
+        # Query engine uses Settings.llm by default if not overridden
+        self._cache_query_engine(sane_item_id, QueryTypes(self._item_query_engine(sane_item_id, index), FILE_TYPE))
+        return f"File '{load.file_path_str}' (ID: {sane_item_id}) processed. Query engine ready."
 
-                nodes = Settings.node_parser.get_nodes_from_documents(documents, show_progress=self.verbose)
-                if not nodes:
-                    return f"Error: No nodes (chunks) were created from the content of '{file_path_str}'."
-                if self.verbose:
-                    print(f"--- [{self.name}] Parsed into {len(nodes)} Node object(s). ---")
+    def _item_load_error(self, file_path_str: str, item_id: str, e: Exception) -> str:
+        error_msg = f"Error processing file '{file_path_str}' (ID: {item_id}): {str(e)}"
+        if self.verbose:
+            print(f"--- [{self.name}] {error_msg} ---")
+            import traceback
+            traceback.print_exc()
+        return error_msg
 
-                index = VectorStoreIndex(nodes, show_progress=self.verbose) # Uses Settings.embed_model
-                index.storage_context.persist(persist_dir=str(item_persist_dir))
-                if self.verbose:
-                    print(f"--- [{self.name}] Index for '{sane_item_id}' created and persisted to {item_persist_dir}. ---")
+    def _register_item_index(self, sane_item_id: str, item_persist_dir: Path, file_path_str: str, state: str) -> str:
+        """Makes the persisted, up-to-date index of an item queryable (loading it unless already in memory)."""
+        if sane_item_id in self.query_engines:
+            return f"Item '{file_path_str}' (ID: {sane_item_id}) is already loaded and up to date."
+        if self.verbose:
+            print(f"--- [{self.name}] Loading {state} index for '{sane_item_id}' from {item_persist_dir} ---")
+        self._cache_query_engine(sane_item_id, QueryTypes(self._item_query_engine(sane_item_id), FILE_TYPE))
+        return f"File '{file_path_str}' (ID: {sane_item_id}) is {state}; loaded its existing index. Query engine ready."
+
+    def _persisted_index_bytes(self, sane_item_id: str) -> int:
+        """Size of an item's persisted index, charged against the query engine cache's byte budget."""
+        if self._shared_item_index() is not None:
+            return 0  # A filtered view; the shared index itself stays loaded once for all items.
+        item_persist_dir = self.persist_base_dir / sane_item_id
+        if not item_persist_dir.is_dir():
+            return 0
+        return sum(path.stat().st_size for path in item_persist_dir.iterdir() if path.is_file())
+
+    def _cache_query_engine(self, sane_item_id: str, query_types: QueryTypes):
+        self.query_engines.put(sane_item_id, query_types, self._persisted_index_bytes(sane_item_id))
+
+    def _load_query_engine(self, sane_item_id: str, known_type: str | None) -> tuple[QueryTypes, int] | None:
+        """Loader for QueryEngineCache.get_or_load: rebuilds an item's query engine from its persisted index."""
+        if not self._item_index_exists(sane_item_id, self.persist_base_dir / sane_item_id):
+            return None
+        item_type = known_type or self._persisted_items().get(sane_item_id, FILE_TYPE)
+        if self.verbose:
+            print(f"--- [{self.name}] ITEM '{sane_item_id}' not in memory, loading its index from storage ---")
+        query_types = QueryTypes(self._item_query_engine(sane_item_id), item_type)
+        return query_types, self._persisted_index_bytes(sane_item_id)
+
+    def _persisted_items(self) -> dict[str, str]:
+        """item_id -> type of every item with an index on disk."""
+        shared_index = self._shared_item_index()
+        if shared_index is not None:
+            return shared_index.items()
+        items = {}
+        for item_dir in sorted(self.persist_base_dir.iterdir()):
+            if item_dir.name != SHARED_INDEX_DIR_NAME and (item_dir / "docstore.json").exists():
+                # Only file indexes have a manifest; URL indexes are rebuilt from the page.
+                items[item_dir.name] = FILE_TYPE if ItemManifest.load(item_dir) is not None else URL_TYPE
+        return items
+
+    def _shared_item_index(self) -> SharedItemIndex | None:
+        """The consolidated index of all items when AGENT_SHARED_VECTOR_STORE is enabled, else None."""
+        if not USE_SHARED_VECTOR_STORE:
+            return None
+        self._ensure_pdf_settings_configured()
+        return get_shared_item_index(self.persist_base_dir)
+
+    def _item_index_exists(self, sane_item_id: str, item_persist_dir: Path) -> bool:
+        shared_index = self._shared_item_index()
+        if shared_index is not None:
+            return shared_index.has_item(sane_item_id)
+        return (item_persist_dir / "docstore.json").exists()
+
+    def _item_query_engine(self, sane_item_id: str, index: VectorStoreIndex | None = None):
+        """Query engine restricted to one item: a filtered view of the shared index, or the item's own index."""
+        shared_index = self._shared_item_index()
+        if shared_index is not None:
+            return shared_index.query_engine([sane_item_id], similarity_top_k=ITEM_SIMILARITY_TOP_K)
+        if index is None:
+            storage_context = load_storage_context(str(self.persist_base_dir / sane_item_id))
+            index = load_index_from_storage(storage_context) # Uses Settings.embed_model
+        return index.as_query_engine(similarity_top_k=ITEM_SIMILARITY_TOP_K)
+
+    @staticmethod
+    def _requested_item_ids(item_ids: str) -> list[str]:
+        return ["".join(c if c.isalnum() or c in ['_', '-'] else '_' for c in item_id.strip())
+                for item_id in item_ids.split(",") if item_id.strip()]
+
+    def _across_items_targets(self, requested: list[str]) -> list[str]:
+        return requested or list(self.query_engines.keys()) + list(self.query_engines.evicted_items())
+
+    def _across_items_error(self, e: Exception) -> str:
+        error_msg = f"Error querying across items: {str(e)}"
+        if self.verbose:
+            print(f"--- [{self.name}] {error_msg} ---")
+        return error_msg
 
-            if index:
-                # Query engine uses Settings.llm by default if not overridden
-                query_engine = index.as_query_engine(similarity_top_k=ITEM_SIMILARITY_TOP_K)
-                self.query_engines[sane_item_id] = QueryTypes(query_engine, FILE_TYPE) # Use FILE_TYPE
-                return f"File '{file_path_str}' (ID: {sane_item_id}) processed. Query engine ready."
-            else: # Should not be reached if logic is correct
-                return f"Error: Failed to load or create index for file '{file_path_str}' (ID: {sane_item_id})."
+    def query_across_items(self, query_text: str, item_ids: str = "") -> str:
+        """
+        Answers one question from several loaded items. `item_ids` is a comma-separated list; empty
+        means every item. With the shared vector store this is a single retrieval pass.
+        """
+        self._ensure_pdf_settings_configured()
+        requested = self._requested_item_ids(item_ids)
+        try:
+            shared_index = self._shared_item_index()
+            if shared_index is not None:
+                response = shared_index.query_engine(requested, similarity_top_k=ITEM_SIMILARITY_TOP_K * 2).query(query_text)
+                return str(response)
+            # Per-item indexes: one query per item; evicted items are reloaded from disk.
+            targets = self._across_items_targets(requested)
+            engines = {item_id: self.query_engines.get_or_load(item_id, self._load_query_engine) for item_id in targets}
+            missing = [item_id for item_id, entry in engines.items() if entry is None]
+            if missing:
+                return f"Error: ITEMs not loaded: {', '.join(missing)}."
+            answers = [f"[{item_id}] {entry.query_engine.query(query_text)}" for item_id, entry in engines.items()]
+            return "\n\n".join(answers) if answers else "No Items are currently active in memory."
+        except Exception as e:
+            return self._across_items_error(e)
 
+    async def aquery_across_items(self, query_text: str, item_ids: str = "") -> str:
+        """
+        query_across_items without blocking the event loop: index loads run on threads, and the
+        per-item queries are awaited concurrently.
+        """
+        await asyncio.to_thread(self._ensure_pdf_settings_configured)
+        requested = self._requested_item_ids(item_ids)
+        try:
+            shared_index = await asyncio.to_thread(self._shared_item_index)
+            if shared_index is not None:
+                query_engine = shared_index.query_engine(requested, similarity_top_k=ITEM_SIMILARITY_TOP_K * 2)
+                return str(await query_engine.aquery(query_text))
+            targets = self._across_items_targets(requested)
+            entries = await asyncio.gather(*(
+                asyncio.to_thread(self.query_engines.get_or_load, item_id, self._load_query_engine)
+                for item_id in targets))
+            missing = [item_id for item_id, entry in zip(targets, entries) if entry is None]
+            if missing:
+                return f"Error: ITEMs not loaded: {', '.join(missing)}."
+            responses = await asyncio.gather(*(entry.query_engine.aquery(query_text) for entry in entries))
+            answers = [f"[{item_id}] {response}" for item_id, response in zip(targets, responses)]
+            return "\n\n".join(answers) if answers else "No Items are currently active in memory."
         except Exception as e:
-            error_msg = f"Error processing file '{file_path_str}' (ID: {item_id}): {str(e)}"
+            return self._across_items_error(e)
+
+    def _changed_item_source(self, sane_item_id: str) -> ItemManifest | None:
+        """The item's manifest when its source file changed since it was indexed, else None."""
+        manifest = ItemManifest.load(self.persist_base_dir / sane_item_id)
+        if manifest is not None and Path(manifest.file_path).is_file() and not manifest.matches_stat(Path(manifest.file_path)):
             if self.verbose:
-                print(f"--- [{self.name}] {error_msg} ---")
-                import traceback
-                traceback.print_exc()
-            return error_msg
+                print(f"--- [{self.name}] Source of ITEM '{sane_item_id}' changed; re-syncing its index. ---")
+            return manifest
+        return None
+
+    def _resolve_item_query_engine(self, item_id: str, sane_item_id: str):
+        """The item's query engine, loading it from storage if needed; an error message when that fails."""
+        persist_dir = self.persist_base_dir / sane_item_id
+        # Items never loaded in this process, or evicted from the cache, are loaded lazily from storage.
+        try:
+            entry = self.query_engines.get_or_load(sane_item_id, self._load_query_engine)
+        except Exception as e:
+            msg = f"Error: ITEM ID '{item_id}' (sanitized: {sane_item_id}) not in active query engines, and failed to auto-load from storage {persist_dir}: {e}"
+            if self.verbose: print(f"--- [{self.name}] {msg} ---")
+            return msg
+        if entry is None:
+            return f"Error: ITEM '{item_id}' (sanitized: {sane_item_id}) not found. Please load it first using 'load_pdf_document'."
+        return entry.query_engine
+
+    def _item_query_error(self, sane_item_id: str, e: Exception) -> str:
+        error_msg = f"Error querying ITEM '{sane_item_id}': {str(e)}"
+        if self.verbose:
+            print(f"--- [{self.name}] {error_msg} ---")
+            import traceback
+            traceback.print_exc()
+        return error_msg
 
     def query_indexed_item(self, item_id: str, query_text: str) -> str:
         """
@@ -999,28 +1523,16 @@ class Agent:
         sane_item_id = "".join(c if c.isalnum() or c in ['_', '-'] else '_' for c in item_id)
         if not sane_item_id: sane_item_id = "default_item_id"
 
-        if sane_item_id not in self.query_engines:
-            persist_dir = self.persist_base_dir / sane_item_id
-            if persist_dir.exists():
-                if self.verbose:
-                    print(f"--- [{self.name}] ITEM ID '{sane_item_id}' not in memory, attempting to load from storage: {persist_dir} ---")
-                try:
-                    # This re-loading essentially re-runs part of load_and_index_pdf logic
-                    # It's a simplified auto-load. For full state persistence, Agent state would need saving/loading.
-                    storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
-                    index = load_index_from_storage(storage_context) # Uses Settings.embed_model
-                    query_engine = index.as_query_engine(similarity_top_k=ITEM_SIMILARITY_TOP_K) # Uses Settings.llm
-                    self.query_engines[sane_item_id] = query_engine
-                    if self.verbose:
-                        print(f"--- [{self.name}] Successfully loaded index and query engine for '{sane_item_id}' from storage. ---")
-                except Exception as e:
-                    msg = f"Error: ITEM ID '{item_id}' (sanitized: {sane_item_id}) not in active query engines, and failed to auto-load from storage {persist_dir}: {e}"
-                    if self.verbose: print(f"--- [{self.name}] {msg} ---")
-                    return msg
-            else:
-                return f"Error: ITEM '{item_id}' (sanitized: {sane_item_id}) not found. Please load it first using 'load_pdf_document'."
+        manifest = self._changed_item_source(sane_item_id)
+        if manifest is not None:
+            # The source file changed since it was indexed: bring the index up to date before answering.
+            sync_message = self.load_and_index_item(manifest.file_path, sane_item_id)
+            if sync_message.startswith("Error"):
+                return sync_message
 
-        query_engine = self.query_engines[sane_item_id].query_engine
+        query_engine = self._resolve_item_query_engine(item_id, sane_item_id)
+        if isinstance(query_engine, str):
+            return query_engine
         try:
             if self.verbose:
                 print(f"--- [{self.name}] Querying ITEM '{sane_item_id}' with: '{query_text}' ---")
@@ -1030,47 +1542,124 @@ class Agent:
                 print(f"--- [{self.name}] Response from ITEM '{sane_item_id}': '{response_str}' ---")
             return response_str
         except Exception as e:
-            error_msg = f"Error querying ITEM '{sane_item_id}': {str(e)}"
+            return self._item_query_error(sane_item_id, e)
+
+    async def aquery_indexed_item(self, item_id: str, query_text: str) -> str:
+        """query_indexed_item without blocking the event loop: loading runs on a thread and the query is awaited."""
+        self._ensure_pdf_settings_configured()
+
+        sane_item_id = "".join(c if c.isalnum() or c in ['_', '-'] else '_' for c in item_id)
+        if not sane_item_id: sane_item_id = "default_item_id"
+
+        manifest = await asyncio.to_thread(self._changed_item_source, sane_item_id)
+        if manifest is not None:
+            sync_message = await self.aload_and_index_item(manifest.file_path, sane_item_id)
+            if sync_message.startswith("Error"):
+                return sync_message
+
+        query_engine = await asyncio.to_thread(self._resolve_item_query_engine, item_id, sane_item_id)
+        if isinstance(query_engine, str):
+            return query_engine
+        try:
             if self.verbose:
-                print(f"--- [{self.name}] {error_msg} ---")
-                import traceback
-                traceback.print_exc()
-            return error_msg
+                print(f"--- [{self.name}] Querying ITEM '{sane_item_id}' with: '{query_text}' ---")
+            response_str = str(await query_engine.aquery(query_text))
+            if self.verbose:
+                print(f"--- [{self.name}] Response from ITEM '{sane_item_id}': '{response_str}' ---")
+            return response_str
+        except Exception as e:
+            return self._item_query_error(sane_item_id, e)
+
+    def _suspend_for(self, seconds: int) -> str:
+        """Marks the session to be resumed in `seconds`; the server schedules the resume once the run ends."""
+        self.session.resume_after_seconds = seconds
+        self.session.resume_at = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+        if self.verbose:
+            print(f"--- [{self.name}] Suspending session {self.session.session_id} until {self.session.resume_at.isoformat()}. ---")
+        return (f"Wait of {seconds} seconds scheduled: this conversation will be resumed automatically at "
+                f"{self.session.resume_at.isoformat()}. Do not call any more tools now; reply with a one-line "
+                f"status of what you are waiting for and end your turn.")
 
     def list_loaded_pdfs(self) -> str:
         """
-        Lists the IDs of all currently loaded and queryable PDFs.
+        Lists the items whose query engines are resident in memory, the items only persisted on disk
+        (queryable, loaded on first use), and the query engine cache statistics.
         """
-        # For more robustness, could also scan self.pdf_persist_base_dir for existing indexes
-        # and report them as "available on disk, can be loaded/queried".
-        # For now, just lists what's in memory.
-        if not self.query_engines:
+        resident = self.query_engines.resident_items()
+        on_disk = {**self.query_engines.evicted_items(), **self._persisted_items()}
+        on_disk = {item_id: item_type for item_id, item_type in on_disk.items() if item_id not in resident}
+        if not resident and not on_disk:
             return "No Items are currently active in memory."
         out = ""
-        for key in self.query_engines.keys():
-            out += key + " - " + self.query_engines[key].type + "\n"
-        return f"Active ITEMs IDs in memory and their types: {out}"
+        for key, (item_type, size_bytes) in resident.items():
+            out += f"{key} - {item_type} (in memory, ~{size_bytes // 1024} KiB)\n"
+        for key, item_type in on_disk.items():
+            out += f"{key} - {item_type} (on disk)\n"
+        stats = self.query_engines.stats()
+        out += (f"Cache: {stats['resident']} resident, {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['evictions']} evictions.\n")
+        return f"Active ITEMs IDs and their types: {out}"
+
+    async def _run(self, user_msg: str) -> str:
+        """run() without the error handling: failures raise instead of becoming an "Error in ..." reply."""
+        # Ensure PDF settings are configured if any PDF tool might be called
+        # This is a good place if tools might be used without explicit load first
+        # However, individual PDF methods also call it for safety.
+        # self._ensure_pdf_settings_configured() # Optional: configure preemptively
+
+        self.session.memory.begin_run()
+        agent_response = await self.worker.run(user_msg=user_msg, memory=self.session.memory)
+        response = str(agent_response.response)
+
+        if self.verbose:
+            print(f"--- [{self.name}] Response: {response} ---")
+            print(f"--- [{self.name}] Prompt tokens per step: {self.session.memory.run_prompt_tokens} ---")
+        return response
 
     async def run(self, user_msg: str) -> str:
         if self.verbose: 
             print(f"\n--- [{self.name}] Task received: {user_msg} ---")
         try:
-            # Ensure PDF settings are configured if any PDF tool might be called
-            # This is a good place if tools might be used without explicit load first
-            # However, individual PDF methods also call it for safety.
-            # self._ensure_pdf_settings_configured() # Optional: configure preemptively
-
-            agent_response = await self.worker.run(user_msg=user_msg, memory=self.memory)
-            response = str(agent_response.response)
-
-            if self.verbose: 
-                print(f"--- [{self.name}] Response: {response} ---")
-            return response
+            return await self._run(user_msg)
         except Exception as e:
             print(f"--- [{self.name}] Error during run: {e} ---")
             import traceback
             traceback.print_exc()
             return f"Error in {self.name}: {str(e)}"
 
-
-
+    async def run_stream(self, user_msg: str) -> AsyncIterator[dict]:
+        """
+        Streaming counterpart of run(). Yields events as the workflow produces them:
+        {"type": "tool_call"}, {"type": "tool_result"}, {"type": "token"} deltas, and finally
+        either {"type": "final", "response": ..., "prompt_tokens": [...]} (estimated prompt tokens of each
+        LLM step) or {"type": "error", "message": ...}.
+        """
+        if self.verbose:
+            print(f"\n--- [{self.name}] Streaming task received: {user_msg} ---")
+        try:
+            self.session.memory.begin_run()
+            handler = self.worker.run(user_msg=user_msg, memory=self.session.memory)
+            async for event in handler.stream_events():
+                if isinstance(event, ToolCallResult):
+                    yield {"type": "tool_result", "tool_name": event.tool_name, "output": str(event.tool_output)}
+                elif isinstance(event, ToolCall):
+                    yield {"type": "tool_call", "tool_name": event.tool_name, "tool_kwargs": event.tool_kwargs}
+                elif isinstance(event, AgentStream) and event.delta:
+                    yield {"type": "token", "delta": event.delta}
+            agent_response = await handler
+            response = str(agent_response.response)
+            if self.verbose:
+                print(f"--- [{self.name}] Streamed response: {response} ---")
+            yield {"type": "final", "response": response, "prompt_tokens": self.session.memory.run_prompt_tokens}
+        except Exception as e:
+            print(f"--- [{self.name}] Error during streaming run: {e} ---")
+            import traceback
+            traceback.print_exc()
+            error_event = {"type": "error", "message": f"Error in {self.name}: {str(e)}"}
+            # The workflow may wrap the LLM error; look for a stream that died mid-answer.
+            cause = e
+            while cause is not None and not isinstance(cause, StreamInterruptedError):
+                cause = cause.__cause__ or cause.__context__
+            if cause is not None:
+                error_event.update(resumable=True, partial_text=cause.partial_text)
+            yield error_event
@@ -0,0 +1,127 @@
+# agent_session.py
+
+import re
+import uuid
+from datetime import datetime
+
+from llama_index.core.base.llms.types import ChatMessage
+
+from .rolling_memory import RollingSummaryMemory, DEFAULT_RECENT_TOKEN_LIMIT
+
+AGENT_MEMORY_TOKEN_LIMIT = 390000
+
+# Matches leading step markers such as "1.", "2)", "Step 3:", "-" or "*".
+_PLAN_STEP_PREFIX = re.compile(r"^\s*(?:step\s*\d+\s*[:.)-]?|\d+\s*[.)]|[-*•])\s*", re.IGNORECASE)
+
+
+class AgentSession:
+    """
+    Per-conversation state of an Agent: chat memory (recent turns verbatim, older ones as a running
+    summary) and the multi-step plan tracked by the create_plan / view_check_plan tools, plus the
+    sessions of the sub-agents it delegated to. Everything else on an Agent (tools, LLM clients,
+    loaded indexes, the sub-agent instances) is shared between sessions, so a session can be bound
+    to any pooled Agent.
+    """
+
+    def __init__(self, session_id: str | None = None, token_limit: int = AGENT_MEMORY_TOKEN_LIMIT,
+                 recent_token_limit: int = DEFAULT_RECENT_TOKEN_LIMIT):
+        self.session_id = session_id or str(uuid.uuid4())
+        self.token_limit = token_limit
+        self.recent_token_limit = recent_token_limit
+        self._memory: RollingSummaryMemory | None = None
+        self.plan: str | None = None
+        self.parsed_plan_steps: list[str] = []
+        self.current_step_index = 0
+        self.last_completed_step_index = -1
+        # Set by the pool when the server can checkpoint this session and resume it from a scheduled task.
+        self.suspendable = False
+        # A long wait_seconds call ends the run and sets this; the server schedules the resume for then.
+        self.resume_at: datetime | None = None
+        self.resume_after_seconds = 0
+        # Sub-agent name -> that sub-agent's session within this conversation, so delegated context
+        # never leaks into another conversation served by the same pooled agent.
+        self.sub_agent_sessions: dict[str, "AgentSession"] = {}
+
+    @property
+    def memory(self) -> RollingSummaryMemory:
+        # Allocated on first use: idle pooled agents and never-called sub-agents hold no buffer.
+        if self._memory is None:
+            self._memory = RollingSummaryMemory.from_defaults(token_limit=self.token_limit)
+            self._memory.recent_token_limit = self.recent_token_limit
+        return self._memory
+
+    @memory.setter
+    def memory(self, memory: RollingSummaryMemory):
+        self._memory = memory
+
+    def sub_agent_session(self, name: str) -> "AgentSession":
+        """The session of sub-agent `name` in this conversation, created on first delegation."""
+        session = self.sub_agent_sessions.get(name)
+        if session is None:
+            session = self.sub_agent_sessions[name] = AgentSession(f"{self.session_id}/{name}", self.token_limit,
+                                                                   self.recent_token_limit)
+        return session
+
+    def set_plan(self, plan: str):
+        """Stores a plan and splits it into steps (one per non-empty line, list markers stripped)."""
+        self.plan = plan
+        self.parsed_plan_steps = [
+            _PLAN_STEP_PREFIX.sub("", line).strip()
+            for line in plan.splitlines()
+            if _PLAN_STEP_PREFIX.sub("", line).strip()
+        ]
+        self.current_step_index = 0
+        self.last_completed_step_index = -1
+
+    def to_checkpoint(self) -> dict:
+        """JSON-serializable snapshot of the conversation (messages, running summary, plan, pending resume)."""
+        memory = self.memory
+        return {
+            "session_id": self.session_id,
+            "messages": [_message_to_dict(message) for message in memory.get_all()],
+            "summary_state": memory.summary_state(),
+            "plan": self.plan,
+            "parsed_plan_steps": self.parsed_plan_steps,
+            "current_step_index": self.current_step_index,
+            "last_completed_step_index": self.last_completed_step_index,
+            "resume_at_iso": self.resume_at.isoformat() if self.resume_at else None,
+            "resume_after_seconds": self.resume_after_seconds,
+            "sub_agent_sessions": {name: session.to_checkpoint() for name, session in self.sub_agent_sessions.items()},
+        }
+
+    @classmethod
+    def from_checkpoint(cls, data: dict) -> "AgentSession":
+        session = cls(data["session_id"])
+        if data.get("messages"):
+            session.memory.set([_message_from_dict(message) for message in data["messages"]])
+            session.memory.restore_summary_state(data.get("summary_state") or {})
+        session.plan = data.get("plan")
+        session.parsed_plan_steps = list(data.get("parsed_plan_steps") or [])
+        session.current_step_index = data.get("current_step_index", 0)
+        session.last_completed_step_index = data.get("last_completed_step_index", -1)
+        if data.get("resume_at_iso"):
+            session.resume_at = datetime.fromisoformat(data["resume_at_iso"])
+        session.resume_after_seconds = data.get("resume_after_seconds", 0)
+        session.sub_agent_sessions = {name: cls.from_checkpoint(sub_data)
+                                      for name, sub_data in (data.get("sub_agent_sessions") or {}).items()}
+        return session
+
+
+def _message_to_dict(message: ChatMessage) -> dict:
+    additional_kwargs = dict(message.additional_kwargs)
+    tool_calls = additional_kwargs.pop("tool_calls", None)
+    data = message.model_copy(update={"additional_kwargs": additional_kwargs}).model_dump(mode="json")
+    if tool_calls:
+        # Gemini tool calls are protobuf FunctionCall messages.
+        data["tool_calls"] = [type(call).to_dict(call) for call in tool_calls]
+    return data
+
+
+def _message_from_dict(data: dict) -> ChatMessage:
+    data = dict(data)
+    tool_calls = data.pop("tool_calls", None)
+    message = ChatMessage.model_validate(data)
+    if tool_calls:
+        import google.generativeai as genai
+        message.additional_kwargs["tool_calls"] = [genai.protos.FunctionCall(call) for call in tool_calls]
+    return message
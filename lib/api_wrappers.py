@@ -1,6 +1,19 @@
-import tenacity
-import google.api_core.exceptions
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import itertools
+import os
+import random
+import threading
 import time
+from typing import AsyncIterator, Awaitable, Callable, Iterator
+
+import google.api_core.exceptions
+
+from .metrics import LatencyRecorder
+from .rate_limiter import estimate_tokens
 
 # Define exceptions that should trigger a retry
 RETRY_EXCEPTIONS = (
@@ -10,29 +23,312 @@ RETRY_EXCEPTIONS = (
     # Add other relevant exceptions as identified during testing
 )
 
+# Retry policy: exponential backoff with jitter. Attempt n sleeps uniformly in
+# [min_backoff, clamp(base * 2**n, min_backoff, max_backoff)]. The defaults keep the budget of the
+# previous tenacity policy (wait_exponential(multiplier=2, min=10, max=300), retrying until success);
+# the jitter only spreads concurrent retries apart. A request deadline (deadline_scope) still cuts
+# retries short, and GEMINI_RETRY_MAX_ATTEMPTS > 0 caps the attempts.
+RETRY_BASE_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_SECONDS", "2"))
+RETRY_MIN_BACKOFF_SECONDS = float(os.getenv("GEMINI_RETRY_MIN_BACKOFF_SECONDS", "10"))
+RETRY_MAX_BACKOFF_SECONDS = float(os.getenv("GEMINI_RETRY_MAX_BACKOFF_SECONDS", "300"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("GEMINI_RETRY_MAX_ATTEMPTS", "0"))  # 0: unlimited
+
+# Hedging: once enough latencies are known, a second identical request is fired if the first one is
+# still running after the p95 latency, and whichever answer arrives first wins. Opt-in, since every
+# hedge is an extra request against the provider quota.
+HEDGE_REQUESTS = os.getenv("GEMINI_HEDGE_REQUESTS", "0").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY_SECONDS = 0.5
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when an API call (including its retries) would run past the request's deadline."""
+
+
+class StreamInterruptedError(Exception):
+    """
+    A streamed response failed after some of it had already been delivered, so it could not be
+    retried transparently. `partial_text` holds what was received; a caller can resume by asking
+    the model to continue from it.
+    """
+
+    def __init__(self, fn_name: str, partial_text: str, cause: Exception):
+        super().__init__(f"{fn_name} was interrupted after {len(partial_text)} characters: {cause}")
+        self.partial_text = partial_text
+        self.cause = cause
+
+
+# Absolute time.monotonic() deadline of the request being served, or None for no deadline.
+_request_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("request_deadline", default=None)
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds: float | None):
+    """
+    Bounds every API call made inside the block (including from tasks it spawns) to finish within
+    `seconds` from now. Nested scopes can only shorten the deadline.
+    """
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = _request_deadline.get()
+    token = _request_deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def remaining_time_budget() -> float | None:
+    """Seconds left before the current request's deadline, or None if it has none."""
+    deadline = _request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _attempts() -> Iterator[int]:
+    """Attempt numbers 0, 1, ... up to RETRY_MAX_ATTEMPTS, or without end when it is 0."""
+    return iter(range(RETRY_MAX_ATTEMPTS)) if RETRY_MAX_ATTEMPTS > 0 else itertools.count()
+
+
+def _backoff_seconds(attempt: int) -> float:
+    # The exponent is capped so long retry runs never overflow the float.
+    ceiling = min(RETRY_MAX_BACKOFF_SECONDS, max(RETRY_MIN_BACKOFF_SECONDS, RETRY_BASE_SECONDS * 2 ** min(attempt, 30)))
+    return random.uniform(RETRY_MIN_BACKOFF_SECONDS, ceiling)
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _next_sleep_or_raise(fn_name: str, attempt: int, error: Exception) -> float:
+    """Returns how long to back off before the next attempt, or re-raises if no attempt is left."""
+    if 0 < RETRY_MAX_ATTEMPTS <= attempt + 1:
+        raise error
+    sleep = _backoff_seconds(attempt)
+    remaining = remaining_time_budget()
+    if remaining is not None and sleep >= remaining:
+        raise DeadlineExceededError(f"{fn_name}: no time left for another attempt after: {error}") from error
+    print(f"Retrying {fn_name} in {sleep:.2f}s, attempt {attempt + 1} failed with {error}")
+    return sleep
+
+
+def _sync_sleep_or_raise(fn_name: str, attempt: int, error: Exception):
+    """
+    Backoff of the sync wrappers. Their time.sleep would stall every request sharing the event loop,
+    so on a loop thread the error is raised instead; async callers use the a* methods.
+    """
+    if _on_event_loop():
+        print(f"Not retrying sync {fn_name} on the event loop thread; use its async variant.")
+        raise error
+    time.sleep(_next_sleep_or_raise(fn_name, attempt, error))
+
+
+class RequestHedger:
+    """
+    Races a slow provider call against one duplicate. The hedge delay is the HEDGE_PERCENTILE of
+    recent latencies of the provider call alone. Callers wait for the rate limiter before run(), so
+    limiter queueing never shrinks the delay, and the duplicate does not take a second limiter slot.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = LatencyRecorder(window=200)
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> float | None:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY_SECONDS, self.latencies.percentile(HEDGE_PERCENTILE))
+
+    async def _timed(self, call):
+        started = time.monotonic()
+        result = await call()
+        self.latencies.record(time.monotonic() - started)
+        return result
+
+    async def run(self, call):
+        """Runs `call()`; if it outlives the hedge delay, races it against a second `call()`."""
+        delay = self.hedge_delay()
+        remaining = remaining_time_budget()
+        first = asyncio.ensure_future(self._timed(call))
+        second = None
+        # Whatever ends this coroutine (an answer, an error, the deadline cancelling it), no request is left running.
+        try:
+            if delay is None or (remaining is not None and delay >= remaining):
+                return await first
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+            self.hedges += 1
+            second = asyncio.ensure_future(self._timed(call))
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+            # Both failed: surface the original request's error.
+            return first.result()
+        finally:
+            for task in (first, second):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {"hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                "hedge_delay_seconds": self.hedge_delay(), "latency": self.latencies.snapshot()}
+
+
+_hedgers: dict[str, RequestHedger] = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_request_hedger(name: str) -> RequestHedger:
+    """Process-wide hedger for one kind of call (e.g. "<model>:achat"), shared by every LLM instance."""
+    with _hedgers_lock:
+        hedger = _hedgers.get(name)
+        if hedger is None:
+            hedger = _hedgers[name] = RequestHedger(name)
+        return hedger
+
+
+def hedging_stats() -> dict:
+    with _hedgers_lock:
+        hedgers = list(_hedgers.values())
+    return {hedger.name: hedger.stats() for hedger in hedgers}
+
+
 def retry_gemini_api_call(func):
     """
-    Decorator to apply retry logic with exponential backoff to Gemini API calls.
+    Decorator to apply retry logic with jittered exponential backoff to Gemini API calls.
+    Works on both sync and async functions; the async variant backs off with asyncio.sleep and
+    bounds each attempt by the remaining deadline (see deadline_scope).
     """
-    @tenacity.retry(
-        wait=tenacity.wait_exponential(multiplier=2, min=10, max=300),
-        retry=tenacity.retry_if_exception_type(RETRY_EXCEPTIONS),
-        before_sleep=lambda retry_state: print(
-            f"Retrying {retry_state.fn.__name__} after {retry_state.seconds_since_start:.2f}s, "
-            f"attempt {retry_state.attempt_number} failed with {retry_state.outcome.exception()}"
-        )
-    )
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            for attempt in _attempts():
+                remaining = remaining_time_budget()
+                if remaining is not None and remaining <= 0:
+                    raise DeadlineExceededError(f"{func.__name__}: request deadline already passed.")
+                try:
+                    return await asyncio.wait_for(func(*args, **kwargs), timeout=remaining)
+                except asyncio.TimeoutError as e:
+                    if remaining is None:
+                        raise
+                    raise DeadlineExceededError(f"{func.__name__}: request deadline exceeded.") from e
+                except RETRY_EXCEPTIONS as e:
+                    await asyncio.sleep(_next_sleep_or_raise(func.__name__, attempt, e))
+        return async_wrapper
+
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
+        for attempt in _attempts():
+            remaining = remaining_time_budget()
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceededError(f"{func.__name__}: request deadline already passed.")
+            try:
+                return func(*args, **kwargs)
+            except RETRY_EXCEPTIONS as e:
+                _sync_sleep_or_raise(func.__name__, attempt, e)
     return wrapper
 
-# Example usage (will be applied in agent.py)
-# @retry_gemini_api_call
-# def call_gemini_complete(...):
-#     # Call the actual gemini complete method
-#     pass
 
-# @retry_gemini_api_call
-# async def acall_gemini_complete(...):
-#     # Call the actual async gemini complete method
-#     pass
\ No newline at end of file
+class _StreamStats:
+    """Time-to-first-token and throughput of recent streamed calls, for the latency dashboards."""
+
+    def __init__(self, size: int = 1000):
+        self._ttft = LatencyRecorder(window=size)
+        self._tokens_per_second = LatencyRecorder(window=size)
+        self.streams = 0
+        self.retried_before_first_token = 0
+        self.interrupted = 0
+
+    def record(self, fn_name: str, ttft: float, total_seconds: float, text: str):
+        tokens = estimate_tokens(text)
+        generation_seconds = total_seconds - ttft
+        tokens_per_second = tokens / generation_seconds if generation_seconds > 0 else 0.0
+        self.streams += 1
+        self._ttft.record(ttft)
+        self._tokens_per_second.record(tokens_per_second)
+        print(f"{fn_name}: time to first token {ttft * 1000:.0f}ms, ~{tokens} tokens at {tokens_per_second:.1f} tokens/s")
+
+    def snapshot(self) -> dict:
+        return {
+            "streams": self.streams,
+            "retried_before_first_token": self.retried_before_first_token,
+            "interrupted": self.interrupted,
+            "ttft_p50_seconds": self._ttft.percentile(0.50) or 0.0,
+            "ttft_p95_seconds": self._ttft.percentile(0.95) or 0.0,
+            "tokens_per_second_p50": self._tokens_per_second.percentile(0.50) or 0.0,
+        }
+
+
+stream_stats = _StreamStats()
+
+
+def _chunk_text(chunk) -> str:
+    delta = getattr(chunk, "delta", None)
+    return delta if isinstance(delta, str) else ""
+
+
+def retry_stream(open_stream: Callable[[], Iterator], fn_name: str) -> Iterator:
+    """
+    Iterates the stream returned by `open_stream()`, reopening it with backoff while nothing has been
+    emitted yet. Once a chunk has been yielded a failure raises StreamInterruptedError instead, since
+    restarting would replay text the caller already consumed.
+    """
+    started = time.monotonic()
+    first_token_at = None
+    received: list[str] = []
+    for attempt in _attempts():
+        try:
+            for chunk in open_stream():
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                received.append(_chunk_text(chunk))
+                yield chunk
+            break
+        except RETRY_EXCEPTIONS as e:
+            if first_token_at is not None:
+                stream_stats.interrupted += 1
+                raise StreamInterruptedError(fn_name, "".join(received), e) from e
+            stream_stats.retried_before_first_token += 1
+            _sync_sleep_or_raise(fn_name, attempt, e)
+    if first_token_at is not None:
+        stream_stats.record(fn_name, first_token_at - started, time.monotonic() - started, "".join(received))
+
+
+async def aretry_stream(open_stream: Callable[[], Awaitable[AsyncIterator]], fn_name: str) -> AsyncIterator:
+    """Async counterpart of retry_stream; backs off with asyncio.sleep and honours the request deadline."""
+    started = time.monotonic()
+    first_token_at = None
+    received: list[str] = []
+    for attempt in _attempts():
+        remaining = remaining_time_budget()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceededError(f"{fn_name}: request deadline already passed.")
+        try:
+            async for chunk in await open_stream():
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                received.append(_chunk_text(chunk))
+                yield chunk
+            break
+        except RETRY_EXCEPTIONS as e:
+            if first_token_at is not None:
+                stream_stats.interrupted += 1
+                raise StreamInterruptedError(fn_name, "".join(received), e) from e
+            stream_stats.retried_before_first_token += 1
+            await asyncio.sleep(_next_sleep_or_raise(fn_name, attempt, e))
+    if first_token_at is not None:
+        stream_stats.record(fn_name, first_token_at - started, time.monotonic() - started, "".join(received))
@@ -0,0 +1,267 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable
+
+from .rate_limiter import estimate_tokens
+
+# Opt-in: "gemini" caches the prompt prefix on the provider; "fake" is a dry run that only does the
+# bookkeeping (requests are still sent in full), to measure reuse and savings before enabling it.
+CONTEXT_CACHE_BACKEND = os.getenv("GEMINI_CONTEXT_CACHE", "").lower()
+DEFAULT_TTL_SECONDS = float(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Refresh a cache this long before it expires, so requests never hit an expired handle.
+DEFAULT_REFRESH_MARGIN_SECONDS = float(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS", "300"))
+# Providers reject small caches (Gemini's minimum depends on the model); smaller prefixes are sent as usual.
+DEFAULT_MIN_PREFIX_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+# A prefix the provider refused to cache is not retried for this long.
+UNCACHEABLE_RETRY_SECONDS = 3600.0
+
+
+def prefix_key(model: str, system_instruction: str, tools_fingerprint: str) -> str:
+    """Identifies one version of an immutable prefix: any change to the prompt or the tools is a new version."""
+    digest = hashlib.sha256()
+    for part in (model, system_instruction, tools_fingerprint):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def estimate_prefix_tokens(system_instruction: str, tools: Any, tool_config: Any) -> int:
+    """Rough size of a prefix (system prompt plus tool declarations), as counted against the provider's minimum."""
+    return estimate_tokens(system_instruction) + estimate_tokens(repr(tools)) + estimate_tokens(repr(tool_config))
+
+
+class CachedPrefix:
+    """A provider-side cache of a request prefix: its handle (`name`), expiry and cached token count."""
+
+    def __init__(self, key: str, name: str, expires_at: float, token_count: int, backend_object: Any = None):
+        self.key = key
+        self.name = name
+        self.expires_at = expires_at
+        self.token_count = token_count
+        self.backend_object = backend_object
+
+
+class ContextCacheBackend:
+    """Creates, extends and deletes cached prefixes on a provider. Times are time.time() seconds."""
+
+    # False when handles are not real provider caches, so requests must still carry the full prefix.
+    provider_backed = True
+
+    def create(self, key: str, model: str, system_instruction: str, tools: Any, tool_config: Any,
+               ttl_seconds: float) -> CachedPrefix:
+        raise NotImplementedError
+
+    def refresh(self, prefix: CachedPrefix, ttl_seconds: float):
+        raise NotImplementedError
+
+    def delete(self, prefix: CachedPrefix):
+        raise NotImplementedError
+
+
+class GeminiContextCacheBackend(ContextCacheBackend):
+    """google.generativeai CachedContent: the system instruction, tools and tool config are cached together."""
+
+    def create(self, key, model, system_instruction, tools, tool_config, ttl_seconds):
+        import datetime
+        from google.generativeai import caching
+
+        cached = caching.CachedContent.create(
+            model=model,
+            display_name=f"prefix-{key[:16]}",
+            system_instruction=system_instruction,
+            tools=tools,
+            tool_config=tool_config,
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+        return CachedPrefix(key, cached.name, cached.expire_time.timestamp(),
+                            cached.usage_metadata.total_token_count, backend_object=cached)
+
+    def refresh(self, prefix, ttl_seconds):
+        import datetime
+
+        prefix.backend_object.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+        prefix.expires_at = prefix.backend_object.expire_time.timestamp()
+
+    def delete(self, prefix):
+        prefix.backend_object.delete()
+
+
+class FakeContextCacheBackend(ContextCacheBackend):
+    """
+    In-memory stand-in for offline tests: handles expire on the injected clock, and token counts are
+    estimated like the rate limiter does. Records every call so tests can assert on reuse.
+    """
+
+    provider_backed = False
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.live: dict[str, CachedPrefix] = {}
+        self.created = 0
+        self.refreshed = 0
+        self.deleted = 0
+        self._counter = 0
+
+    def create(self, key, model, system_instruction, tools, tool_config, ttl_seconds):
+        self._counter += 1
+        self.created += 1
+        token_count = estimate_prefix_tokens(system_instruction, tools, tool_config)
+        prefix = CachedPrefix(key, f"cachedContents/fake-{self._counter}", self.clock() + ttl_seconds, token_count)
+        self.live[prefix.name] = prefix
+        return prefix
+
+    def refresh(self, prefix, ttl_seconds):
+        if prefix.name not in self.live or self.live[prefix.name].expires_at <= self.clock():
+            raise LookupError(f"{prefix.name} has expired")
+        self.refreshed += 1
+        prefix.expires_at = self.clock() + ttl_seconds
+
+    def delete(self, prefix):
+        self.deleted += 1
+        self.live.pop(prefix.name, None)
+
+    def is_live(self, name: str) -> bool:
+        prefix = self.live.get(name)
+        return prefix is not None and prefix.expires_at > self.clock()
+
+
+class ContextCacheManager:
+    """
+    Keeps one provider-side cache per prefix version (model + system prompt + tool declarations):
+    created on first use, reused by every later request, and extended when it gets within
+    `refresh_margin_seconds` of expiring. Prefixes below `min_prefix_tokens`, or ones the provider refuses,
+    fall back to being sent in full. Thread-safe; each prefix is created at most once concurrently.
+    """
+
+    def __init__(self, backend: ContextCacheBackend, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 refresh_margin_seconds: float = DEFAULT_REFRESH_MARGIN_SECONDS,
+                 min_prefix_tokens: int = DEFAULT_MIN_PREFIX_TOKENS, clock: Callable[[], float] = time.time):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds / 2)
+        self.min_prefix_tokens = min_prefix_tokens
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._prefixes: dict[str, CachedPrefix] = {}
+        self._uncacheable_until: dict[str, float] = {}
+        self.creates = 0
+        self.refreshes = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.failures = 0
+        self.invalidations = 0
+        self.cached_tokens_reused = 0
+
+    def acquire(self, model: str, system_instruction: str, tools: Any = None, tool_config: Any = None,
+                tools_fingerprint: str = "") -> CachedPrefix | None:
+        """
+        The live cache for this prefix, creating or refreshing it as needed; None when the request
+        should be sent without a cache. `tools_fingerprint` must change whenever `tools` does.
+        """
+        key = prefix_key(model, system_instruction, tools_fingerprint)
+        now = self.clock()
+        with self._lock:
+            if self._uncacheable_until.get(key, 0.0) > now:
+                self.fallbacks += 1
+                return None
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # The fingerprint is only a hash of the tools; their declarations are what count towards the size.
+        if estimate_prefix_tokens(system_instruction, tools, tool_config) < self.min_prefix_tokens:
+            with self._lock:
+                self._uncacheable_until[key] = float("inf")
+                self.fallbacks += 1
+            return None
+
+        with key_lock:
+            with self._lock:
+                prefix = self._prefixes.get(key)
+            now = self.clock()
+            try:
+                if prefix is not None and prefix.expires_at - now <= self.refresh_margin_seconds:
+                    if prefix.expires_at > now:
+                        try:
+                            self.backend.refresh(prefix, self.ttl_seconds)
+                            with self._lock:
+                                self.refreshes += 1
+                        except Exception as e:
+                            print(f"Context cache: refreshing {prefix.name} failed ({e}); creating a new one.")
+                            prefix = None
+                    else:
+                        prefix = None
+                if prefix is None:
+                    prefix = self.backend.create(key, model, system_instruction, tools, tool_config, self.ttl_seconds)
+                    print(f"Context cache: created {prefix.name} ({prefix.token_count} tokens) for model {model}.")
+                    with self._lock:
+                        self._prefixes[key] = prefix
+                        self.creates += 1
+            except Exception as e:
+                print(f"Context cache: could not cache prefix for model {model} ({type(e).__name__}: {e}); "
+                      f"sending it in full for the next {UNCACHEABLE_RETRY_SECONDS:.0f}s.")
+                with self._lock:
+                    self._prefixes.pop(key, None)
+                    self._uncacheable_until[key] = self.clock() + UNCACHEABLE_RETRY_SECONDS
+                    self.failures += 1
+                return None
+
+        with self._lock:
+            self.hits += 1
+            self.cached_tokens_reused += prefix.token_count
+        return prefix
+
+    def invalidate(self, prefix: CachedPrefix):
+        """Forgets a cache the provider no longer knows (deleted or expired early); the next request recreates it."""
+        with self._lock:
+            if self._prefixes.get(prefix.key) is prefix:
+                del self._prefixes[prefix.key]
+                self.invalidations += 1
+
+    def close(self):
+        """Deletes every cache created by this manager."""
+        with self._lock:
+            prefixes = list(self._prefixes.values())
+            self._prefixes.clear()
+        for prefix in prefixes:
+            try:
+                self.backend.delete(prefix)
+            except Exception as e:
+                print(f"Context cache: could not delete {prefix.name}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": type(self.backend).__name__,
+                "live_prefixes": len(self._prefixes),
+                "cached_tokens": sum(prefix.token_count for prefix in self._prefixes.values()),
+                "hits": self.hits,
+                "creates": self.creates,
+                "refreshes": self.refreshes,
+                "fallbacks": self.fallbacks,
+                "failures": self.failures,
+                "invalidations": self.invalidations,
+                # Prefix tokens served from a cache instead of being sent (and billed) in full.
+                "cached_tokens_reused": self.cached_tokens_reused,
+            }
+
+
+_manager: ContextCacheManager | None = None
+_manager_lock = threading.Lock()
+
+
+def get_context_cache_manager() -> ContextCacheManager | None:
+    """Process-wide manager for the GEMINI_CONTEXT_CACHE backend, or None when context caching is off."""
+    global _manager
+    if CONTEXT_CACHE_BACKEND not in ("gemini", "fake"):
+        return None
+    with _manager_lock:
+        if _manager is None:
+            backend = GeminiContextCacheBackend() if CONTEXT_CACHE_BACKEND == "gemini" else FakeContextCacheBackend()
+            _manager = ContextCacheManager(backend)
+        return _manager
+
+
+def context_cache_stats() -> dict:
+    with _manager_lock:
+        return _manager.stats() if _manager is not None else {}
@@ -0,0 +1,188 @@
+import array
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Sequence
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import BaseNode, MetadataMode
+
+DEFAULT_EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+DEFAULT_MAX_CONCURRENT_BATCHES = int(os.getenv("EMBED_MAX_CONCURRENT_BATCHES", "4"))
+DEFAULT_EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model, sha256(text)). Vectors are stored as packed float32,
+    so re-indexing content that has been embedded before costs no API calls.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_EMBEDDING_CACHE_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_sha256 TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_sha256)
+            )
+            """
+        )
+
+    def get_many(self, model: str, digests: Sequence[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        unique = list(dict.fromkeys(digests))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_sha256, vector FROM embeddings WHERE model = ? "
+                    f"AND text_sha256 IN ({', '.join('?' * len(chunk))})",
+                    (model, *chunk),
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = array.array("f", blob).tolist()
+        return found
+
+    def put_many(self, model: str, items: dict[str, list[float]]):
+        if not items:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_sha256, vector) VALUES (?, ?, ?)",
+                    [(model, digest, array.array("f", vector).tobytes()) for digest, vector in items.items()],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingService:
+    """
+    Embeds texts for index builds: cached vectors are reused, the rest are sent in batches of
+    `batch_size`, with at most `max_concurrent_batches` requests in flight (each one still goes
+    through the embedding model's own rate limiter).
+    """
+
+    def __init__(self, embed_model: BaseEmbedding, cache: EmbeddingCache | None = None,
+                 batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+                 max_concurrent_batches: int = DEFAULT_MAX_CONCURRENT_BATCHES):
+        self.embed_model = embed_model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self.cache_hits = 0
+        self.embedded = 0
+
+    @property
+    def model_key(self) -> str:
+        return getattr(self.embed_model, "model_name", None) or type(self.embed_model).__name__
+
+    def _split_misses(self, texts: Sequence[str]) -> tuple[list[str], dict[str, list[float]], list[str]]:
+        digests = [text_digest(text) for text in texts]
+        cached = self.cache.get_many(self.model_key, digests) if self.cache else {}
+        # Identical chunks inside one build are embedded once.
+        missing: dict[str, str] = {}
+        for digest, text in zip(digests, texts):
+            if digest not in cached and digest not in missing:
+                missing[digest] = text
+        self.cache_hits += sum(1 for digest in digests if digest in cached)
+        return digests, cached, list(missing.items())
+
+    def _batches(self, missing: list[tuple[str, str]]) -> list[list[tuple[str, str]]]:
+        return [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+
+    def _store(self, vectors: dict[str, list[float]], batch: list[tuple[str, str]], embeddings: list[list[float]]):
+        new = {digest: embedding for (digest, _), embedding in zip(batch, embeddings)}
+        vectors.update(new)
+        self.embedded += len(new)
+        if self.cache:
+            self.cache.put_many(self.model_key, new)
+
+    def embed_texts(self, texts: Sequence[str]) -> list[list[float]]:
+        digests, vectors, missing = self._split_misses(texts)
+        if missing:
+            batches = self._batches(missing)
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_batches) as pool:
+                results = pool.map(
+                    lambda batch: self.embed_model.get_text_embedding_batch([text for _, text in batch]),
+                    batches,
+                )
+                for batch, embeddings in zip(batches, results):
+                    self._store(vectors, batch, embeddings)
+        return [vectors[digest] for digest in digests]
+
+    async def aembed_texts(self, texts: Sequence[str]) -> list[list[float]]:
+        digests, vectors, missing = await asyncio.to_thread(self._split_misses, texts)
+        semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+
+        async def embed_batch(batch: list[tuple[str, str]]):
+            async with semaphore:
+                embeddings = await self.embed_model.aget_text_embedding_batch([text for _, text in batch])
+            await asyncio.to_thread(self._store, vectors, batch, embeddings)
+
+        await asyncio.gather(*(embed_batch(batch) for batch in self._batches(missing)))
+        return [vectors[digest] for digest in digests]
+
+    def embed_nodes(self, nodes: Sequence[BaseNode]) -> int:
+        """
+        Sets `embedding` on every node that lacks one, using the same text VectorStoreIndex would embed,
+        so the index build then skips them. Returns the number of vectors actually requested from the API.
+        """
+        pending = [node for node in nodes if node.embedding is None]
+        before = self.embedded
+        vectors = self.embed_texts([node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending])
+        for node, vector in zip(pending, vectors):
+            node.embedding = vector
+        return self.embedded - before
+
+    async def aembed_nodes(self, nodes: Sequence[BaseNode]) -> int:
+        pending = [node for node in nodes if node.embedding is None]
+        before = self.embedded
+        vectors = await self.aembed_texts([node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending])
+        for node, vector in zip(pending, vectors):
+            node.embedding = vector
+        return self.embedded - before
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_key,
+            "batch_size": self.batch_size,
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "cache_hits": self.cache_hits,
+            "embedded": self.embedded,
+        }
+
+
+_shared_cache: EmbeddingCache | None = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_embedding_service(embed_model: BaseEmbedding) -> EmbeddingService:
+    """Embedding service for `embed_model` backed by the process-wide on-disk cache."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+    return EmbeddingService(embed_model, cache=_shared_cache)
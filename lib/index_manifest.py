@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Sequence
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+def file_sha256(path: Path, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ItemManifest:
+    """
+    What an item's persisted index was built from: the source file (path, content hash, mtime and size)
+    and the hash -> node id map of its chunks. A matching mtime/size means the index is current without
+    reading the file; otherwise the content hash decides, and only then are chunks diffed.
+    """
+
+    def __init__(self, file_path: str, file_sha256: str, mtime_ns: int, size: int, chunks: dict[str, str]):
+        self.file_path = file_path
+        self.file_sha256 = file_sha256
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.chunks = chunks
+
+    @classmethod
+    def load(cls, persist_dir: Path) -> "ItemManifest | None":
+        try:
+            with open(persist_dir / MANIFEST_FILE_NAME, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(data["file_path"], data["file_sha256"], data["mtime_ns"], data["size"], data["chunks"])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+
+    def save(self, persist_dir: Path):
+        tmp_path = persist_dir / f"{MANIFEST_FILE_NAME}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "file_path": self.file_path,
+                "file_sha256": self.file_sha256,
+                "mtime_ns": self.mtime_ns,
+                "size": self.size,
+                "chunks": self.chunks,
+            }, f)
+        os.replace(tmp_path, persist_dir / MANIFEST_FILE_NAME)
+
+    @staticmethod
+    def invalidate(persist_dir: Path):
+        """
+        Removes the manifest before the index is modified: if the update is interrupted, the next
+        load sees no manifest and rebuilds instead of trusting a half-updated index.
+        """
+        try:
+            os.remove(persist_dir / MANIFEST_FILE_NAME)
+        except FileNotFoundError:
+            pass
+
+    def matches_stat(self, file_path: Path) -> bool:
+        stat = file_path.stat()
+        return self.file_path == str(file_path) and self.mtime_ns == stat.st_mtime_ns and self.size == stat.st_size
+
+    def refresh_stat(self, file_path: Path):
+        stat = file_path.stat()
+        self.file_path, self.mtime_ns, self.size = str(file_path), stat.st_mtime_ns, stat.st_size
+
+
+def diff_chunks(old_chunks: dict[str, str], new_chunk_hashes: Sequence[str]) -> tuple[list[int], list[str]]:
+    """
+    Compares the chunk hashes of a fresh parse with the manifest. Returns the positions (in
+    `new_chunk_hashes`) of chunks to insert, and the node ids of stale chunks to delete. Repeated
+    chunks are only indexed once.
+    """
+    to_insert: list[int] = []
+    seen: set[str] = set()
+    for position, chunk_hash in enumerate(new_chunk_hashes):
+        if chunk_hash in seen:
+            continue
+        seen.add(chunk_hash)
+        if chunk_hash not in old_chunks:
+            to_insert.append(position)
+    to_delete = [node_id for chunk_hash, node_id in old_chunks.items() if chunk_hash not in seen]
+    return to_insert, to_delete
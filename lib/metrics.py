@@ -0,0 +1,54 @@
+# metrics.py
+
+import threading
+from collections import deque
+
+
+class LatencyRecorder:
+    """
+    Keeps the most recent `window` samples (in seconds) of a latency-like measurement
+    and summarizes them as count/mean/percentiles for the metrics endpoints. Thread-safe; also
+    used for other per-sample measurements (e.g. tokens per second) through percentile().
+    """
+
+    def __init__(self, window: int = 1000):
+        self._samples: deque[float] = deque(maxlen=window)
+        self._total_count = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._total_count += 1
+
+    def __len__(self) -> int:
+        """Number of samples currently in the window."""
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, fraction: float) -> float | None:
+        """The `fraction` percentile (0..1) of the samples in the window, or None if there are none."""
+        with self._lock:
+            samples = sorted(self._samples)
+        return self._percentile(samples, fraction) if samples else None
+
+    @staticmethod
+    def _percentile(sorted_samples: list[float], fraction: float) -> float:
+        index = min(len(sorted_samples) - 1, max(0, round(fraction * (len(sorted_samples) - 1))))
+        return sorted_samples[index]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            total_count = self._total_count
+        if not samples:
+            return {"count": total_count, "window": 0}
+        return {
+            "count": total_count,
+            "window": len(samples),
+            "mean_seconds": sum(samples) / len(samples),
+            "p50_seconds": self._percentile(samples, 0.50),
+            "p95_seconds": self._percentile(samples, 0.95),
+            "p99_seconds": self._percentile(samples, 0.99),
+            "max_seconds": samples[-1],
+        }
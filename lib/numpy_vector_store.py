@@ -0,0 +1,239 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from pydantic import PrivateAttr
+from llama_index.core import StorageContext
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+# File names inside a persist dir, next to the docstore/index_store JSON written by StorageContext.
+VECTORS_FILE_NAME = "default__vector_store.npy"
+META_FILE_NAME = "default__vector_store.meta.json"
+LEGACY_VECTOR_STORE_FILE_NAME = "default__vector_store.json"
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    Vector store persisted as one contiguous float32 matrix (`.npy`) plus a small JSON sidecar with
+    node ids, ref doc ids and filterable metadata. Loading memory-maps the matrix, so a cold load
+    costs milliseconds regardless of index size, and queries are one matrix-vector product followed
+    by an argpartition top-k. With `normalize` (the default) rows are stored unit-length, so cosine
+    similarity is a plain dot product.
+    """
+
+    stores_text: bool = False
+    normalize: bool = True
+
+    _vectors: np.ndarray = PrivateAttr()
+    _node_ids: list = PrivateAttr(default_factory=list)
+    _ref_doc_ids: list = PrivateAttr(default_factory=list)
+    _metadata: list = PrivateAttr(default_factory=list)
+    _norms: Optional[np.ndarray] = PrivateAttr(default=None)
+
+    def __init__(self, normalize: bool = True, **kwargs: Any):
+        super().__init__(normalize=normalize, **kwargs)
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    # --- Persistence ---
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str | Path) -> "NumpyVectorStore":
+        persist_dir = Path(persist_dir)
+        with open(persist_dir / META_FILE_NAME, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        store = cls(normalize=meta.get("normalize", True))
+        store._node_ids = meta["node_ids"]
+        store._ref_doc_ids = meta["ref_doc_ids"]
+        store._metadata = meta["metadata"]
+        if store._node_ids:
+            store._vectors = np.load(persist_dir / VECTORS_FILE_NAME, mmap_mode="r")
+        return store
+
+    @classmethod
+    def from_simple_vector_store(cls, simple_store: SimpleVectorStore, normalize: bool = True) -> "NumpyVectorStore":
+        """Converts the default JSON vector store (float lists) into this format."""
+        data = simple_store.data
+        store = cls(normalize=normalize)
+        node_ids = list(data.embedding_dict.keys())
+        store._node_ids = node_ids
+        store._ref_doc_ids = [data.text_id_to_ref_doc_id.get(node_id) for node_id in node_ids]
+        store._metadata = [data.metadata_dict.get(node_id, {}) for node_id in node_ids]
+        if node_ids:
+            store._vectors = store._prepare(np.asarray([data.embedding_dict[node_id] for node_id in node_ids],
+                                                       dtype=np.float32))
+        return store
+
+    def persist(self, persist_path: str, fs: Any = None) -> None:
+        # StorageContext passes ".../default__vector_store.json"; the matrix and sidecar go next to it.
+        persist_dir = Path(persist_path).parent
+        persist_dir.mkdir(parents=True, exist_ok=True)
+        tmp_vectors = persist_dir / f"{VECTORS_FILE_NAME}.tmp"
+        with open(tmp_vectors, "wb") as f:
+            np.save(f, np.ascontiguousarray(self._vectors, dtype=np.float32))
+        os.replace(tmp_vectors, persist_dir / VECTORS_FILE_NAME)
+        tmp_meta = persist_dir / f"{META_FILE_NAME}.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"normalize": self.normalize, "node_ids": self._node_ids,
+                       "ref_doc_ids": self._ref_doc_ids, "metadata": self._metadata}, f)
+        os.replace(tmp_meta, persist_dir / META_FILE_NAME)
+
+    # --- Mutation ---
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        if self.normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1.0, norms)
+        return vectors.astype(np.float32, copy=False)
+
+    @staticmethod
+    def _filterable_metadata(node: BaseNode) -> dict:
+        return {key: value for key, value in node.metadata.items()
+                if isinstance(value, (str, int, float, bool)) or value is None}
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        new_vectors = self._prepare(np.asarray([node.get_embedding() for node in nodes], dtype=np.float32))
+        if len(self._node_ids):
+            # Copies the memory-mapped matrix into memory; the file is only rewritten on persist.
+            self._vectors = np.concatenate([np.asarray(self._vectors), new_vectors])
+        else:
+            self._vectors = new_vectors
+        for node in nodes:
+            self._node_ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id)
+            self._metadata.append(self._filterable_metadata(node))
+        self._norms = None
+        return [node.node_id for node in nodes]
+
+    def _keep(self, keep: np.ndarray):
+        self._vectors = np.asarray(self._vectors)[keep]
+        self._node_ids = [node_id for node_id, kept in zip(self._node_ids, keep) if kept]
+        self._ref_doc_ids = [ref for ref, kept in zip(self._ref_doc_ids, keep) if kept]
+        self._metadata = [meta for meta, kept in zip(self._metadata, keep) if kept]
+        self._norms = None
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._keep(np.array([ref != ref_doc_id for ref in self._ref_doc_ids], dtype=bool))
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[MetadataFilters] = None,
+                     **delete_kwargs: Any) -> None:
+        drop = np.zeros(len(self._node_ids), dtype=bool)
+        if node_ids:
+            targets = set(node_ids)
+            drop |= np.array([node_id in targets for node_id in self._node_ids], dtype=bool)
+        if filters is not None:
+            drop |= self._filter_mask(filters)
+        self._keep(~drop)
+
+    def get(self, node_id: str) -> List[float]:
+        return np.asarray(self._vectors[self._node_ids.index(node_id)]).tolist()
+
+    # --- Query ---
+    @staticmethod
+    def _matches(value: Any, operator: FilterOperator, expected: Any) -> bool:
+        if operator == FilterOperator.EQ:
+            return value == expected
+        if operator == FilterOperator.NE:
+            return value != expected
+        if operator == FilterOperator.IN:
+            return value in expected
+        if operator == FilterOperator.NIN:
+            return value not in expected
+        if value is None:
+            return False
+        if operator == FilterOperator.GT:
+            return value > expected
+        if operator == FilterOperator.GTE:
+            return value >= expected
+        if operator == FilterOperator.LT:
+            return value < expected
+        if operator == FilterOperator.LTE:
+            return value <= expected
+        raise NotImplementedError(f"NumpyVectorStore does not support filter operator {operator}.")
+
+    def _filter_mask(self, filters: MetadataFilters) -> np.ndarray:
+        masks = []
+        for metadata_filter in filters.filters:
+            if isinstance(metadata_filter, MetadataFilters):
+                masks.append(self._filter_mask(metadata_filter))
+            else:
+                masks.append(np.array([
+                    self._matches(meta.get(metadata_filter.key), metadata_filter.operator, metadata_filter.value)
+                    for meta in self._metadata
+                ], dtype=bool))
+        if not masks:
+            return np.ones(len(self._node_ids), dtype=bool)
+        if filters.condition == FilterCondition.OR:
+            return np.logical_or.reduce(masks)
+        return np.logical_and.reduce(masks)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if not self._node_ids or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        query_vector = np.asarray(query.query_embedding, dtype=np.float32)
+        query_norm = float(np.linalg.norm(query_vector)) or 1.0
+        scores = self._vectors @ (query_vector / query_norm)
+        if not self.normalize:
+            if self._norms is None:
+                self._norms = np.linalg.norm(self._vectors, axis=1)
+            scores = scores / np.where(self._norms == 0, 1.0, self._norms)
+
+        candidates = np.ones(len(self._node_ids), dtype=bool)
+        if query.filters is not None:
+            candidates &= self._filter_mask(query.filters)
+        if query.node_ids:
+            allowed = set(query.node_ids)
+            candidates &= np.array([node_id in allowed for node_id in self._node_ids], dtype=bool)
+        if query.doc_ids:
+            allowed = set(query.doc_ids)
+            candidates &= np.array([ref in allowed for ref in self._ref_doc_ids], dtype=bool)
+        positions = np.flatnonzero(candidates)
+        if positions.size == 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        candidate_scores = scores[positions]
+        k = min(query.similarity_top_k, positions.size)
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top = top[np.argsort(-candidate_scores[top])]
+        return VectorStoreQueryResult(
+            ids=[self._node_ids[i] for i in positions[top]],
+            similarities=candidate_scores[top].tolist(),
+        )
+
+
+def new_storage_context() -> StorageContext:
+    """Storage context for building a new index with the NumPy vector store."""
+    return StorageContext.from_defaults(vector_store=NumpyVectorStore())
+
+
+def load_storage_context(persist_dir: str | Path) -> StorageContext:
+    """
+    Storage context for a persisted index, memory-mapping its vectors. Indexes still in the default
+    JSON layout are converted on first load (the JSON file is removed once the matrix is written).
+    """
+    persist_dir = Path(persist_dir)
+    if not (persist_dir / META_FILE_NAME).exists() and (persist_dir / LEGACY_VECTOR_STORE_FILE_NAME).exists():
+        legacy_store = SimpleVectorStore.from_persist_path(str(persist_dir / LEGACY_VECTOR_STORE_FILE_NAME))
+        NumpyVectorStore.from_simple_vector_store(legacy_store).persist(str(persist_dir / LEGACY_VECTOR_STORE_FILE_NAME))
+        os.remove(persist_dir / LEGACY_VECTOR_STORE_FILE_NAME)
+        print(f"Converted vector store in {persist_dir} to the memory-mapped NumPy format.")
+    return StorageContext.from_defaults(persist_dir=str(persist_dir),
+                                        vector_store=NumpyVectorStore.from_persist_dir(persist_dir))
@@ -0,0 +1,137 @@
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Callable, Iterator
+
+from .QueryTypes import QueryTypes
+
+# Budgets for resident query engines; 0 disables a limit.
+DEFAULT_MAX_ENTRIES = int(os.getenv("AGENT_QUERY_ENGINE_MAX_ENTRIES", "32"))
+DEFAULT_MAX_BYTES = int(os.getenv("AGENT_QUERY_ENGINE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+class QueryEngineCache(MutableMapping):
+    """
+    Bounded registry of loaded query engines (item_id -> QueryTypes), least recently used first out.
+    Each entry is charged `size_bytes` (the Agent passes the size of the item's persisted index) against
+    `max_bytes`, and the number of entries is capped by `max_entries`. Evicted items stay on disk and
+    are remembered with their type, so `get_or_load` can bring them back on the next query.
+
+    Behaves like the plain dict it replaces: `in`, iteration and `len` only see resident entries.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, QueryTypes] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._evicted: dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reloads = 0
+
+    # --- Mapping interface (resident entries only) ---
+    def __getitem__(self, item_id: str) -> QueryTypes:
+        with self._lock:
+            entry = self._entries[item_id]
+            self._entries.move_to_end(item_id)
+            return entry
+
+    def __setitem__(self, item_id: str, entry: QueryTypes):
+        self.put(item_id, entry)
+
+    def __delitem__(self, item_id: str):
+        with self._lock:
+            del self._entries[item_id]
+            self._sizes.pop(item_id, None)
+
+    def __contains__(self, item_id: object) -> bool:
+        with self._lock:
+            return item_id in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    # --- Cache operations ---
+    def put(self, item_id: str, entry: QueryTypes, size_bytes: int = 0):
+        with self._lock:
+            self._entries[item_id] = entry
+            self._entries.move_to_end(item_id)
+            self._sizes[item_id] = size_bytes
+            self._evicted.pop(item_id, None)
+            self._evict_over_budget(keep=item_id)
+
+    def _evict_over_budget(self, keep: str):
+        # The newest entry is always kept, even when it alone exceeds the byte budget.
+        while len(self._entries) > 1:
+            over_entries = self.max_entries and len(self._entries) > self.max_entries
+            over_bytes = self.max_bytes and sum(self._sizes.values()) > self.max_bytes
+            if not (over_entries or over_bytes):
+                break
+            item_id = next(iter(self._entries))
+            if item_id == keep:
+                break
+            entry = self._entries.pop(item_id)
+            self._sizes.pop(item_id, None)
+            self._evicted[item_id] = entry.type
+            self.evictions += 1
+            print(f"Query engine cache: evicted '{item_id}' ({entry.type}); it will be reloaded from disk on next use.")
+
+    def get_or_load(self, item_id: str, loader: Callable[[str, str | None], tuple[QueryTypes, int] | None]) -> QueryTypes | None:
+        """
+        Resident entry for `item_id`, or the result of `loader(item_id, known_type)` when it is not in
+        memory. The loader returns `(entry, size_bytes)`, or None when the item has no persisted index.
+        Loading runs outside the lock; if two callers race, the first entry stored wins.
+        """
+        with self._lock:
+            entry = self._entries.get(item_id)
+            if entry is not None:
+                self._entries.move_to_end(item_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            known_type = self._evicted.get(item_id)
+        loaded = loader(item_id, known_type)
+        if loaded is None:
+            return None
+        entry, size_bytes = loaded
+        with self._lock:
+            existing = self._entries.get(item_id)
+            if existing is not None:
+                return existing
+            self.reloads += 1
+        self.put(item_id, entry, size_bytes)
+        return entry
+
+    def evicted_items(self) -> dict[str, str]:
+        """item_id -> type of items evicted from memory (their indexes are still on disk)."""
+        with self._lock:
+            return dict(self._evicted)
+
+    def resident_items(self) -> dict[str, tuple[str, int]]:
+        """item_id -> (type, charged bytes), least recently used first."""
+        with self._lock:
+            return {item_id: (entry.type, self._sizes.get(item_id, 0)) for item_id, entry in self._entries.items()}
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "resident": len(self._entries),
+                "resident_bytes": sum(self._sizes.values()),
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+            }
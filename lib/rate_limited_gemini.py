@@ -1,7 +1,7 @@
-import tenacity
 from llama_index.llms.gemini.base import Gemini
 from llama_index.core.base.llms.types import (
     ChatMessage,
+    MessageRole,
     ChatResponse,
     ChatResponseAsyncGen,
     ChatResponseGen,
@@ -10,67 +10,431 @@ from llama_index.core.base.llms.types import (
     CompletionResponseGen,
 )
 from typing import Any, Sequence, Optional, Dict, Union, List
+import asyncio
+import enum
+import json
 import google.api_core.exceptions
+import google.generativeai as genai
+from pydantic import Field, PrivateAttr
+
+from llama_index.embeddings.gemini import GeminiEmbedding
 
 # Import the retry decorator from our wrappers module
-from .api_wrappers import retry_gemini_api_call, RETRY_EXCEPTIONS
+from .api_wrappers import (
+    retry_gemini_api_call,
+    retry_stream,
+    aretry_stream,
+    get_request_hedger,
+    RETRY_EXCEPTIONS,
+    HEDGE_REQUESTS,
+)
+from .llm_cache import LLMCache, get_llm_cache, request_cache_key
+from .context_cache import CachedPrefix, ContextCacheManager, get_context_cache_manager
+from .rate_limiter import (
+    RateLimiter,
+    get_rate_limiter,
+    estimate_tokens,
+    DEFAULT_EMBED_REQUESTS_PER_MINUTE,
+    DEFAULT_EMBED_TOKENS_PER_MINUTE,
+)
+
+
+def _messages_tokens(messages: Sequence[ChatMessage]) -> int:
+    return sum(estimate_tokens(str(message.content or "")) for message in messages)
+
+
+def _response_text(response: Union[ChatResponse, CompletionResponse]) -> str:
+    text = getattr(response, "text", None)
+    if text is None:
+        text = response.message.content
+    return text or ""
+
+
+def _plain(value: Any) -> Any:
+    """JSON-friendly form of tool declarations / tool config (protos, enums, nested dicts and lists)."""
+    if hasattr(value, "to_proto"):
+        proto = value.to_proto()
+        return json.loads(type(proto).to_json(proto))
+    if isinstance(value, dict):
+        return {str(key): _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+
+_NO_CHUNK = object()
+
+
+def _after_first(first, stream):
+    """Yields `first` (unless the stream was empty) and then the rest of `stream`."""
+    if first is not _NO_CHUNK:
+        yield first
+        yield from stream
+
+
+async def _aafter_first(first, stream):
+    if first is not _NO_CHUNK:
+        yield first
+        async for chunk in stream:
+            yield chunk
+
+
+def _tools_fingerprint(tools: Any, tool_config: Any) -> str:
+    if tools is None and tool_config is None:
+        return ""
+    return json.dumps({"tools": _plain(tools), "tool_config": _plain(tool_config)}, sort_keys=True, default=str)
+
 
 class RateLimitedGemini(Gemini):
     """
     Custom Gemini LLM class that incorporates retry logic with exponential backoff.
+    Before every call it also acquires from the process-wide rate limiter of its model, which is
+    shared by every instance (agents, Settings.llm, the browser module), so requests are spaced
+    to stay under the RPM/TPM quota instead of running into ResourceExhausted.
+
+    With a `response_cache` (or LLM_CACHE_PATH set), chat/achat/complete/acomplete answers are
+    served from an on-disk cache when the exact same request was made before. Calls with
+    temperature > 0 bypass the cache unless `cache_nonzero_temperature` is True, and tool-calling
+    or multimodal requests are never cached (a cached answer keeps no tool calls). Agent turns go
+    through the tools API, so only plain chat/complete calls are served from the cache.
+
+    With a `context_cache` (or GEMINI_CONTEXT_CACHE set), chat requests that start with a system
+    prompt keep that prompt, the tool declarations and tool config in a provider-side cache, and
+    send only the rest of the conversation plus the cache handle.
+
+    With `hedge_requests` (or GEMINI_HEDGE_REQUESTS set), achat/acomplete calls still running after the
+    p95 provider latency are raced against one duplicate request (see RequestHedger). astream_chat,
+    which FunctionAgent's tool-calling turns use, is hedged the same way until its first chunk;
+    the sync methods and astream_complete are not hedged.
     """
 
-    @retry_gemini_api_call
+    # Gemini only hands these to its GenerativeModel; kept here so cache-bound copies are built the same way.
+    generation_config: Optional[dict] = Field(default=None, description="Generation config passed at construction.")
+    safety_settings: Optional[Any] = Field(default=None, description="Safety settings passed at construction.")
+
+    _response_cache: Optional[LLMCache] = PrivateAttr(default=None)
+    _cache_nonzero_temperature: bool = PrivateAttr(default=False)
+    _context_cache: Optional[ContextCacheManager] = PrivateAttr(default=None)
+    _hedge_requests: bool = PrivateAttr(default=False)
+
+    def _cache_key(self, kind: str, payload: Any, kwargs: dict) -> str | None:
+        """Returns the cache key for this request, or None if it must not be cached."""
+        cache = self._response_cache
+        if cache is None:
+            return None
+        temperature = getattr(self, "temperature", None)
+        cacheable = "tools" not in kwargs and "tool_choice" not in kwargs
+        if temperature and temperature > 0 and not self._cache_nonzero_temperature:
+            cacheable = False
+        if not cacheable:
+            cache.record_bypass()
+            return None
+        model = getattr(self, "model", None) or getattr(self, "model_name", "gemini")
+        return request_cache_key(model, kind, payload, temperature, kwargs)
+
+    def _chat_cache_key(self, messages: Sequence[ChatMessage], kwargs: dict) -> str | None:
+        if any(getattr(block, "block_type", "text") != "text"
+               for message in messages for block in getattr(message, "blocks", [])):
+            if self._response_cache is not None:
+                self._response_cache.record_bypass()
+            return None
+        payload = [{"role": str(getattr(message.role, "value", message.role)), "content": message.content or ""}
+                   for message in messages]
+        return self._cache_key("chat", payload, kwargs)
+
+    @staticmethod
+    def _chat_from_cache(value: dict) -> ChatResponse:
+        return ChatResponse(message=ChatMessage(role=value["role"], content=value["content"]))
+
+    @staticmethod
+    def _chat_to_cache(response: ChatResponse) -> dict:
+        return {"role": str(getattr(response.message.role, "value", response.message.role)),
+                "content": response.message.content or ""}
+
+    def _rate_limiter(self) -> RateLimiter:
+        return get_rate_limiter(getattr(self, "model", None) or getattr(self, "model_name", "gemini"))
+
+    async def _provider_call(self, kind: str, call):
+        """Awaits `call()`, hedged when enabled. Runs after the rate limiter has admitted the request."""
+        if not self._hedge_requests:
+            return await call()
+        model = getattr(self, "model", None) or getattr(self, "model_name", "gemini")
+        return await get_request_hedger(f"{model}:{kind}").run(call)
+
+    def _cached_prefix_request(self, messages: Sequence[ChatMessage], kwargs: dict):
+        """
+        Returns (target, messages, kwargs, prefix) for a chat request. When the leading system prompt
+        and tools have a live provider cache, `target` is a copy of this LLM bound to that cache and the
+        prefix is stripped from the messages and kwargs; otherwise the request is returned unchanged.
+        """
+        manager = self._context_cache
+        if manager is None or len(messages) < 2 or messages[0].role != MessageRole.SYSTEM:
+            return self, messages, kwargs, None
+        tools, tool_config = kwargs.get("tools"), kwargs.get("tool_config")
+        prefix = manager.acquire(self.model, messages[0].content or "", tools, tool_config,
+                                 _tools_fingerprint(tools, tool_config))
+        if prefix is None or not manager.backend.provider_backed:
+            return self, messages, kwargs, None
+        bound = self.model_copy()
+        bound._model = genai.GenerativeModel.from_cached_content(
+            prefix.backend_object,
+            generation_config={"temperature": self.temperature, **(self.generation_config or {})},
+            safety_settings=self.safety_settings,
+        )
+        request_kwargs = {key: value for key, value in kwargs.items() if key not in ("tools", "tool_config")}
+        return bound, list(messages[1:]), request_kwargs, prefix
+
+    def _prefix_gone(self, prefix: Optional[CachedPrefix], error: Exception) -> bool:
+        """True when a request failed because its cache no longer exists; the cache is then forgotten."""
+        if prefix is None or not isinstance(error, google.api_core.exceptions.NotFound):
+            return False
+        print(f"Context cache {prefix.name} is gone ({error}); resending the full prompt.")
+        self._context_cache.invalidate(prefix)
+        return True
+
+    def _chat_with_prefix(self, method_name: str, messages: Sequence[ChatMessage], kwargs: dict):
+        target, request_messages, request_kwargs, prefix = self._cached_prefix_request(messages, kwargs)
+        try:
+            return getattr(super(RateLimitedGemini, target), method_name)(request_messages, **request_kwargs)
+        except Exception as e:
+            if not self._prefix_gone(prefix, e):
+                raise
+        return getattr(super(RateLimitedGemini, self), method_name)(messages, **kwargs)
+
+    async def _achat_with_prefix(self, method_name: str, messages: Sequence[ChatMessage], kwargs: dict,
+                                 hedged: bool = False):
+        # Creating or refreshing a cache is a blocking API call.
+        target, request_messages, request_kwargs, prefix = await asyncio.to_thread(
+            self._cached_prefix_request, messages, kwargs)
+
+        async def call(llm, call_messages, call_kwargs):
+            method = getattr(super(RateLimitedGemini, llm), method_name)
+            if hedged:
+                return await self._provider_call(method_name, lambda: method(call_messages, **call_kwargs))
+            return await method(call_messages, **call_kwargs)
+
+        try:
+            return await call(target, request_messages, request_kwargs)
+        except Exception as e:
+            if not self._prefix_gone(prefix, e):
+                raise
+        return await call(self, messages, kwargs)
+
+    def _stream_with_prefix(self, method_name: str, messages: Sequence[ChatMessage], kwargs: dict):
+        """
+        _chat_with_prefix for streams. A stream reports a missing cache only when iterated, so the first
+        chunk is read here, where the request can still be resent with the full prompt.
+        """
+        target, request_messages, request_kwargs, prefix = self._cached_prefix_request(messages, kwargs)
+        try:
+            stream = getattr(super(RateLimitedGemini, target), method_name)(request_messages, **request_kwargs)
+            first = next(stream, _NO_CHUNK)
+        except Exception as e:
+            if not self._prefix_gone(prefix, e):
+                raise
+            return getattr(super(RateLimitedGemini, self), method_name)(messages, **kwargs)
+        return _after_first(first, stream)
+
+    async def _astream_with_prefix(self, method_name: str, messages: Sequence[ChatMessage], kwargs: dict,
+                                   hedged: bool = False):
+        """
+        Async counterpart of _stream_with_prefix. With `hedged`, opening the stream up to its first chunk
+        is hedged like achat: nothing has reached the caller yet, so the slower request can be dropped.
+        """
+        target, request_messages, request_kwargs, prefix = await asyncio.to_thread(
+            self._cached_prefix_request, messages, kwargs)
+
+        async def open_first(llm, call_messages, call_kwargs):
+            stream = await getattr(super(RateLimitedGemini, llm), method_name)(call_messages, **call_kwargs)
+            try:
+                return await stream.__anext__(), stream
+            except StopAsyncIteration:
+                return _NO_CHUNK, stream
+
+        async def call(llm, call_messages, call_kwargs):
+            if hedged:
+                return await self._provider_call(method_name, lambda: open_first(llm, call_messages, call_kwargs))
+            return await open_first(llm, call_messages, call_kwargs)
+
+        try:
+            first, stream = await call(target, request_messages, request_kwargs)
+        except Exception as e:
+            if not self._prefix_gone(prefix, e):
+                raise
+            first, stream = await call(self, messages, kwargs)
+        return _aafter_first(first, stream)
+
+    def _metered(self, responses):
+        last = None
+        for last in responses:
+            yield last
+        if last is not None:
+            self._rate_limiter().record_usage(estimate_tokens(_response_text(last)))
+
+    async def _ametered(self, responses):
+        last = None
+        async for last in responses:
+            yield last
+        if last is not None:
+            self._rate_limiter().record_usage(estimate_tokens(_response_text(last)))
+
     def complete(
         self, prompt: str, formatted: bool = False, **kwargs: Any
     ) -> CompletionResponse:
-        return super().complete(prompt, formatted=formatted, **kwargs)
+        key = self._cache_key("complete", {"prompt": prompt, "formatted": formatted}, kwargs)
+        cached = self._response_cache.get(key) if key else None
+        if cached is not None:
+            return CompletionResponse(text=cached["text"])
+        response = self._complete_uncached(prompt, formatted=formatted, **kwargs)
+        if key:
+            self._response_cache.put(key, {"text": response.text})
+        return response
 
-    @retry_gemini_api_call
     async def acomplete(
         self, prompt: str, formatted: bool = False, **kwargs: Any
     ) -> CompletionResponse:
-        return await super().acomplete(prompt, formatted=formatted, **kwargs)
+        key = self._cache_key("complete", {"prompt": prompt, "formatted": formatted}, kwargs)
+        cached = await asyncio.to_thread(self._response_cache.get, key) if key else None
+        if cached is not None:
+            return CompletionResponse(text=cached["text"])
+        response = await self._acomplete_uncached(prompt, formatted=formatted, **kwargs)
+        if key:
+            await asyncio.to_thread(self._response_cache.put, key, {"text": response.text})
+        return response
+
+    @retry_gemini_api_call
+    def _complete_uncached(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        self._rate_limiter().acquire(estimate_tokens(prompt))
+        response = super().complete(prompt, formatted=formatted, **kwargs)
+        self._rate_limiter().record_usage(estimate_tokens(_response_text(response)))
+        return response
 
     @retry_gemini_api_call
+    async def _acomplete_uncached(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        await self._rate_limiter().aacquire(estimate_tokens(prompt))
+        acomplete = super().acomplete
+        response = await self._provider_call("acomplete", lambda: acomplete(prompt, formatted=formatted, **kwargs))
+        self._rate_limiter().record_usage(estimate_tokens(_response_text(response)))
+        return response
+
+    # Streams are retried only until their first chunk; see retry_stream / StreamInterruptedError.
     def stream_complete(
         self, prompt: str, formatted: bool = False, **kwargs: Any
     ) -> CompletionResponseGen:
-        # Note: Retrying a generator might restart the entire generation.
-        # This is a limitation of applying retry at this level.
-        return super().stream_complete(prompt, formatted=formatted, **kwargs)
+        def open_stream():
+            self._rate_limiter().acquire(estimate_tokens(prompt))
+            return super(RateLimitedGemini, self).stream_complete(prompt, formatted=formatted, **kwargs)
+        return self._metered(retry_stream(open_stream, "stream_complete"))
 
-    @retry_gemini_api_call
     async def astream_complete(
         self, prompt: str, formatted: bool = False, **kwargs: Any
     ) -> CompletionResponseAsyncGen:
-        # Note: Retrying a generator might restart the entire generation.
-        # This is a limitation of applying retry at this level.
-        return await super().astream_complete(prompt, formatted=formatted, **kwargs)
+        async def open_stream():
+            await self._rate_limiter().aacquire(estimate_tokens(prompt))
+            return await super(RateLimitedGemini, self).astream_complete(prompt, formatted=formatted, **kwargs)
+        return self._ametered(aretry_stream(open_stream, "astream_complete"))
 
-    @retry_gemini_api_call
     def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
-        return super().chat(messages, **kwargs)
+        key = self._chat_cache_key(messages, kwargs)
+        cached = self._response_cache.get(key) if key else None
+        if cached is not None:
+            return self._chat_from_cache(cached)
+        response = self._chat_uncached(messages, **kwargs)
+        if key:
+            self._response_cache.put(key, self._chat_to_cache(response))
+        return response
 
-    @retry_gemini_api_call
     async def achat(
         self, messages: Sequence[ChatMessage], **kwargs: Any
     ) -> ChatResponse:
-        return await super().achat(messages, **kwargs)
+        key = self._chat_cache_key(messages, kwargs)
+        cached = await asyncio.to_thread(self._response_cache.get, key) if key else None
+        if cached is not None:
+            return self._chat_from_cache(cached)
+        response = await self._achat_uncached(messages, **kwargs)
+        if key:
+            await asyncio.to_thread(self._response_cache.put, key, self._chat_to_cache(response))
+        return response
 
     @retry_gemini_api_call
+    def _chat_uncached(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        self._rate_limiter().acquire(_messages_tokens(messages))
+        response = self._chat_with_prefix("chat", messages, kwargs)
+        self._rate_limiter().record_usage(estimate_tokens(_response_text(response)))
+        return response
+
+    @retry_gemini_api_call
+    async def _achat_uncached(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponse:
+        await self._rate_limiter().aacquire(_messages_tokens(messages))
+        response = await self._achat_with_prefix("achat", messages, kwargs, hedged=True)
+        self._rate_limiter().record_usage(estimate_tokens(_response_text(response)))
+        return response
+
     def stream_chat(
         self, messages: Sequence[ChatMessage], **kwargs: Any
     ) -> ChatResponseGen:
-        # Note: Retrying a generator might restart the entire generation.
-        # This is a limitation of applying retry at this level.
-        return super().stream_chat(messages, **kwargs)
+        def open_stream():
+            self._rate_limiter().acquire(_messages_tokens(messages))
+            return self._stream_with_prefix("stream_chat", messages, kwargs)
+        return self._metered(retry_stream(open_stream, "stream_chat"))
 
-    @retry_gemini_api_call
     async def astream_chat(
         self, messages: Sequence[ChatMessage], **kwargs: Any
     ) -> ChatResponseAsyncGen:
-        return await super().astream_chat(messages, **kwargs)
+        async def open_stream():
+            await self._rate_limiter().aacquire(_messages_tokens(messages))
+            return await self._astream_with_prefix("astream_chat", messages, kwargs, hedged=True)
+        return self._ametered(aretry_stream(open_stream, "astream_chat"))
+
+    def __init__(self, *args, response_cache: Optional[LLMCache] = None, cache_nonzero_temperature: bool = False,
+                 context_cache: Optional[ContextCacheManager] = None, hedge_requests: Optional[bool] = None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.generation_config = kwargs.get("generation_config")
+        self.safety_settings = kwargs.get("safety_settings")
+        self._response_cache = response_cache or get_llm_cache()
+        self._cache_nonzero_temperature = cache_nonzero_temperature
+        self._context_cache = context_cache or get_context_cache_manager()
+        self._hedge_requests = HEDGE_REQUESTS if hedge_requests is None else hedge_requests
+
+
+class RateLimitedGeminiEmbedding(GeminiEmbedding):
+    """
+    GeminiEmbedding that acquires from the process-wide rate limiter of its model before every
+    request, so indexing bursts share the embedding quota instead of tripping it.
+    """
+
+    def _rate_limiter(self) -> RateLimiter:
+        return get_rate_limiter(self.model_name, DEFAULT_EMBED_REQUESTS_PER_MINUTE, DEFAULT_EMBED_TOKENS_PER_MINUTE)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self._rate_limiter().acquire(estimate_tokens(query))
+        return super()._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        self._rate_limiter().acquire(estimate_tokens(text))
+        return super()._get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._rate_limiter().acquire(sum(estimate_tokens(text) for text in texts))
+        return super()._get_text_embeddings(texts)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        await self._rate_limiter().aacquire(estimate_tokens(query))
+        return await super()._aget_query_embedding(query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        await self._rate_limiter().aacquire(estimate_tokens(text))
+        return await super()._aget_text_embedding(text)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
\ No newline at end of file
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        await self._rate_limiter().aacquire(sum(estimate_tokens(text) for text in texts))
+        return await super()._aget_text_embeddings(texts)
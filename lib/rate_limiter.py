@@ -0,0 +1,142 @@
+import asyncio
+import os
+import threading
+import time
+
+# Process-wide defaults; override with environment variables or configure_rate_limit().
+DEFAULT_LLM_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_RPM", "10"))
+DEFAULT_LLM_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TPM", "250000"))
+DEFAULT_EMBED_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_EMBED_RPM", "100"))
+DEFAULT_EMBED_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_EMBED_TPM", "30000"))
+# Fraction of each quota actually spent, to stay just under the limit the API enforces.
+QUOTA_HEADROOM = float(os.getenv("GEMINI_QUOTA_HEADROOM", "0.9"))
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str | None) -> int:
+    """Cheap token estimate used for budgeting before the real count is known."""
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket holding at most `capacity` units, refilled continuously at `rate` units per second.
+    `reserve` always succeeds but may leave the bucket in debt; the returned delay is how long the caller
+    must wait before its reservation is covered. Reserving in arrival order keeps callers FIFO-fair.
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self._level = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # A single request larger than the bucket would otherwise never fit.
+            self._level -= min(amount, self.capacity)
+            return 0.0 if self._level >= 0 else -self._level / self.rate
+
+    def debit(self, amount: float):
+        """Charges usage discovered after the fact (e.g. output tokens) without waiting."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level -= amount
+
+    def level(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._level
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budget shared by every client of one quota.
+    Callers acquire before each API call (blocking with `acquire`, or without blocking the event
+    loop with `aacquire`) and report output tokens afterwards with `record_usage`.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, headroom: float = QUOTA_HEADROOM):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        rpm = max(1.0, requests_per_minute * headroom)
+        tpm = max(1.0, tokens_per_minute * headroom)
+        self._requests = TokenBucket(capacity=rpm, rate=rpm / 60.0)
+        self._tokens = TokenBucket(capacity=tpm, rate=tpm / 60.0)
+        self._stats_lock = threading.Lock()
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait_seconds = 0.0
+
+    def _reserve(self, tokens: int) -> float:
+        delay = max(self._requests.reserve(1), self._tokens.reserve(tokens))
+        with self._stats_lock:
+            self.acquired += 1
+            if delay > 0:
+                self.throttled += 1
+                self.total_wait_seconds += delay
+        return delay
+
+    def acquire(self, tokens: int = 0):
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens: int = 0):
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def record_usage(self, tokens: int):
+        if tokens > 0:
+            self._tokens.debit(tokens)
+
+    def stats(self) -> dict:
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "total_wait_seconds": round(self.total_wait_seconds, 3),
+            "available_requests": round(self._requests.level(), 2),
+            "available_tokens": round(self._tokens.level()),
+        }
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_rate_limit(quota_key: str, requests_per_minute: int, tokens_per_minute: int) -> RateLimiter:
+    """Sets (or replaces) the budget for one quota, e.g. a model name."""
+    with _limiters_lock:
+        _limiters[quota_key] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _limiters[quota_key]
+
+
+def get_rate_limiter(quota_key: str, requests_per_minute: int = DEFAULT_LLM_REQUESTS_PER_MINUTE,
+                     tokens_per_minute: int = DEFAULT_LLM_TOKENS_PER_MINUTE) -> RateLimiter:
+    """
+    Returns the process-wide limiter for `quota_key`, creating it with the given budget on first use.
+    Gemini quotas are per model, so every client of the same model shares one limiter.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(quota_key)
+        if limiter is None:
+            limiter = _limiters[quota_key] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return limiter
+
+
+def rate_limiter_stats() -> dict:
+    with _limiters_lock:
+        return {key: limiter.stats() for key, limiter in _limiters.items()}
@@ -0,0 +1,220 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from pydantic import Field, PrivateAttr
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
+
+# Tokens of the most recent turns kept verbatim; older turns are folded into the running summary.
+DEFAULT_RECENT_TOKEN_LIMIT = int(os.getenv("AGENT_MEMORY_RECENT_TOKENS", "24000"))
+# Cheaper model used for the summaries, off the request path.
+SUMMARY_LLM_MODEL = os.getenv("AGENT_SUMMARY_MODEL", "gemini-2.0-flash-lite")
+# Longest message text sent to the summarizer (tool outputs can be huge).
+SUMMARY_MAX_MESSAGE_CHARS = 4000
+STEP_HISTORY_LENGTH = 200
+
+SUMMARY_PREFIX = "Summary of the earlier part of this conversation (older turns are not shown verbatim):\n"
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant that uses tools.\n"
+    "Update the summary with the new messages below. Keep every fact, decision, file path, item id, "
+    "sub-agent name and open task the assistant may still need; drop pleasantries and repetition. "
+    "Write at most 400 words of plain text.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New messages:\n{messages}\n\n"
+    "Updated summary:"
+)
+
+# One background thread is enough: summaries are small, infrequent, and must not compete with requests.
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+_summary_llm = None
+_summary_llm_lock = threading.Lock()
+
+
+def get_summary_llm():
+    global _summary_llm
+    with _summary_llm_lock:
+        if _summary_llm is None:
+            from .rate_limited_gemini import RateLimitedGemini
+            _summary_llm = RateLimitedGemini(model=SUMMARY_LLM_MODEL, api_key=os.getenv("GeminiKey"), temperature=0.0)
+        return _summary_llm
+
+
+class RollingSummaryMemory(ChatMemoryBuffer):
+    """
+    Chat memory that keeps the most recent turns verbatim within `recent_token_limit` and replaces
+    everything older with a running summary. When turns fall out of the recent window they are
+    summarized on a background thread by a cheaper model. Until that summary lands, they are still sent
+    verbatim (trimmed to `token_limit` if needed), so a step never waits for summarization.
+
+    The recent window always starts at a user message, so tool calls are never separated from their
+    results. Every get() (one per agent step) records the prompt token count it produced.
+    """
+
+    recent_token_limit: int = Field(default=DEFAULT_RECENT_TOKEN_LIMIT, gt=0)
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _summary: str = PrivateAttr(default="")
+    _summarized_count: int = PrivateAttr(default=0)
+    _summarizing: bool = PrivateAttr(default=False)
+    _generation: int = PrivateAttr(default=0)
+    _token_counts: list = PrivateAttr(default_factory=list)
+    _step_prompt_tokens: Any = PrivateAttr(default_factory=lambda: deque(maxlen=STEP_HISTORY_LENGTH))
+    _run_prompt_tokens: list = PrivateAttr(default_factory=list)
+    _summarizations: int = PrivateAttr(default=0)
+    _summary_failures: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RollingSummaryMemory"
+
+    # --- Token accounting ---
+    def _message_tokens(self, messages: List[ChatMessage]) -> list[int]:
+        """Token count of each message; counts are cached since the history only grows."""
+        with self._lock:
+            counts = self._token_counts
+            if len(counts) > len(messages):
+                counts.clear()
+            missing = messages[len(counts):]
+        new_counts = [len(self.tokenizer_fn(str(message.content or ""))) for message in missing]
+        with self._lock:
+            if len(self._token_counts) + len(new_counts) == len(messages):
+                self._token_counts.extend(new_counts)
+                return list(self._token_counts)
+        return [len(self.tokenizer_fn(str(message.content or ""))) for message in messages]
+
+    def _recent_window_start(self, messages: List[ChatMessage], counts: list[int], start: int) -> int:
+        """Index of the earliest user message after `start` whose turns fit in recent_token_limit."""
+        window_start = None
+        tokens = 0
+        for index in range(len(messages) - 1, start - 1, -1):
+            tokens += counts[index]
+            if messages[index].role != MessageRole.USER:
+                continue
+            if tokens > self.recent_token_limit and window_start is not None:
+                break
+            # The latest user turn is always kept whole, even when it alone exceeds the budget.
+            window_start = index
+        return window_start if window_start is not None else start
+
+    # --- BaseMemory ---
+    def get(self, input: Optional[str] = None, initial_token_count: int = 0, **kwargs: Any) -> List[ChatMessage]:
+        messages = self.get_all()
+        counts = self._message_tokens(messages)
+        with self._lock:
+            summary, start = self._summary, min(self._summarized_count, len(messages))
+        window_start = self._recent_window_start(messages, counts, start)
+        if window_start > start:
+            self._schedule_summary(window_start)
+
+        header = [ChatMessage(role=MessageRole.SYSTEM, content=SUMMARY_PREFIX + summary)] if summary else []
+        header_tokens = len(self.tokenizer_fn(header[0].content)) if header else 0
+        # Turns awaiting summarization are sent verbatim, oldest dropped first if over the hard limit.
+        first = start
+        total = initial_token_count + header_tokens + sum(counts[first:])
+        while first < window_start and total > self.token_limit:
+            total -= counts[first]
+            first += 1
+        while first < window_start and messages[first].role != MessageRole.USER:
+            total -= counts[first]
+            first += 1
+
+        with self._lock:
+            self._step_prompt_tokens.append(total)
+            self._run_prompt_tokens.append(total)
+        return header + messages[first:]
+
+    def set(self, messages: List[ChatMessage]) -> None:
+        super().set(messages)
+        self._clear_summary()
+
+    def reset(self) -> None:
+        super().reset()
+        self._clear_summary()
+
+    def _clear_summary(self):
+        with self._lock:
+            self._summary = ""
+            self._summarized_count = 0
+            self._generation += 1
+            self._token_counts.clear()
+
+    # --- Background summarization ---
+    def _schedule_summary(self, upto: int):
+        with self._lock:
+            if self._summarizing:
+                return
+            self._summarizing = True
+            generation = self._generation
+        _summary_executor.submit(self._summarize, upto, generation)
+
+    def _summarize(self, upto: int, generation: int):
+        try:
+            with self._lock:
+                if generation != self._generation:
+                    return
+                previous, start = self._summary, self._summarized_count
+            lines = []
+            for message in self.get_all()[start:upto]:
+                content = str(message.content or "")
+                if len(content) > SUMMARY_MAX_MESSAGE_CHARS:
+                    content = content[:SUMMARY_MAX_MESSAGE_CHARS] + " [...]"
+                tool_calls = message.additional_kwargs.get("tool_calls")
+                if tool_calls and not content:
+                    content = f"[tool calls: {tool_calls}]"
+                lines.append(f"{message.role.value}: {content}")
+            prompt = SUMMARY_PROMPT.format(summary=previous or "(none yet)", messages="\n".join(lines))
+            summary = str(get_summary_llm().complete(prompt)).strip()
+            with self._lock:
+                if generation == self._generation and self._summarized_count == start:
+                    self._summary = summary
+                    self._summarized_count = upto
+                    self._summarizations += 1
+        except Exception as e:
+            with self._lock:
+                self._summary_failures += 1
+            print(f"Warning: conversation summarization failed ({type(e).__name__}: {e}); older turns stay verbatim.")
+        finally:
+            with self._lock:
+                self._summarizing = False
+
+    # --- Checkpointing ---
+    def summary_state(self) -> dict:
+        """The running summary and how many messages it covers (see restore_summary_state)."""
+        with self._lock:
+            return {"summary": self._summary, "summarized_count": self._summarized_count}
+
+    def restore_summary_state(self, state: dict):
+        """Reinstates a summary_state() after the same messages have been set() again."""
+        with self._lock:
+            self._summary = state.get("summary", "")
+            self._summarized_count = min(int(state.get("summarized_count", 0)), len(self.get_all()))
+
+    # --- Reporting ---
+    def begin_run(self):
+        """Starts a new per-run list of step prompt token counts (see run_prompt_tokens)."""
+        with self._lock:
+            self._run_prompt_tokens = []
+
+    @property
+    def run_prompt_tokens(self) -> list[int]:
+        """Prompt tokens (estimated with the tokenizer) of each step since begin_run()."""
+        with self._lock:
+            return list(self._run_prompt_tokens)
+
+    def stats(self) -> dict:
+        with self._lock:
+            steps = list(self._step_prompt_tokens)
+            return {
+                "recent_token_limit": self.recent_token_limit,
+                "token_limit": self.token_limit,
+                "summarized_messages": self._summarized_count,
+                "summary_tokens": len(self.tokenizer_fn(self._summary)) if self._summary else 0,
+                "summarizations": self._summarizations,
+                "summary_failures": self._summary_failures,
+                "summarizing": self._summarizing,
+                "last_step_prompt_tokens": steps[-1] if steps else 0,
+                "step_prompt_tokens": steps,
+            }
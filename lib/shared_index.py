@@ -0,0 +1,163 @@
+import os
+import threading
+from pathlib import Path
+from typing import Sequence
+
+from llama_index.core import VectorStoreIndex, load_index_from_storage
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores import MetadataFilter, MetadataFilters, FilterCondition
+
+from .numpy_vector_store import load_storage_context, new_storage_context, VECTORS_FILE_NAME, META_FILE_NAME
+
+# Opt-in: keep every item's nodes in one consolidated index instead of one index per item.
+USE_SHARED_VECTOR_STORE = os.getenv("AGENT_SHARED_VECTOR_STORE", "0").lower() in ("1", "true", "yes")
+SHARED_INDEX_DIR_NAME = "_shared_index"
+# Metadata keys used for filtering; they are kept out of the embedded and LLM-visible text.
+ITEM_ID_KEY = "item_id"
+SOURCE_TYPE_KEY = "source_type"
+_PER_ITEM_INDEX_FILES = ("docstore.json", "index_store.json", "default__vector_store.json",
+                         "graph_store.json", "image__vector_store.json", VECTORS_FILE_NAME, META_FILE_NAME)
+
+
+def tag_nodes(nodes: Sequence[BaseNode], item_id: str, source_type: str):
+    """Marks nodes with their item and source type without changing what gets embedded."""
+    for node in nodes:
+        node.metadata[ITEM_ID_KEY] = item_id
+        node.metadata[SOURCE_TYPE_KEY] = source_type
+        for excluded in (node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys):
+            for key in (ITEM_ID_KEY, SOURCE_TYPE_KEY):
+                if key not in excluded:
+                    excluded.append(key)
+
+
+class SharedItemIndex:
+    """
+    One VectorStoreIndex holding the nodes of every loaded item and URL, tagged with `item_id` and
+    `source_type` metadata. A query engine can be restricted to one item, to several items, or span
+    all of them in a single retrieval pass.
+    """
+
+    def __init__(self, persist_base_dir: Path):
+        self.persist_base_dir = persist_base_dir
+        self.persist_dir = persist_base_dir / SHARED_INDEX_DIR_NAME
+        self._lock = threading.RLock()
+        # item_id -> its node ids, and item_id -> source type; kept in step with every insert and delete
+        # so lookups never walk the whole docstore.
+        self._item_nodes: dict[str, set[str]] = {}
+        self._item_types: dict[str, str] = {}
+        if (self.persist_dir / "docstore.json").exists():
+            storage_context = load_storage_context(str(self.persist_dir))
+            self.index = load_index_from_storage(storage_context)
+            for node_id, node in self.index.docstore.docs.items():
+                if ITEM_ID_KEY in node.metadata:
+                    self._track(node.metadata[ITEM_ID_KEY], node.metadata.get(SOURCE_TYPE_KEY, ""), [node_id])
+        else:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+            self.index = VectorStoreIndex([], storage_context=new_storage_context())
+            self.persist()
+
+    def _track(self, item_id: str, source_type: str, node_ids: Sequence[str]):
+        self._item_nodes.setdefault(item_id, set()).update(node_ids)
+        self._item_types[item_id] = source_type
+
+    def _untrack(self, item_id: str, node_ids: Sequence[str]):
+        remaining = self._item_nodes.get(item_id)
+        if remaining is None:
+            return
+        remaining.difference_update(node_ids)
+        if not remaining:
+            del self._item_nodes[item_id]
+            self._item_types.pop(item_id, None)
+
+    def persist(self):
+        with self._lock:
+            self.index.storage_context.persist(persist_dir=str(self.persist_dir))
+
+    def items(self) -> dict[str, str]:
+        """item_id -> source_type of every item with nodes in the index."""
+        with self._lock:
+            return dict(self._item_types)
+
+    def has_item(self, item_id: str) -> bool:
+        with self._lock:
+            return item_id in self._item_nodes
+
+    def item_node_ids(self, item_id: str) -> list[str]:
+        with self._lock:
+            return list(self._item_nodes.get(item_id, ()))
+
+    def update_item(self, item_id: str, source_type: str, insert: Sequence[BaseNode], delete_node_ids: Sequence[str],
+                    replace: bool = False):
+        """
+        Applies one item's node changes and persists once. With `replace`, all of the item's current
+        nodes are deleted first. Inserted nodes should already carry embeddings.
+        """
+        with self._lock:
+            if replace:
+                delete_node_ids = self.item_node_ids(item_id)
+            if delete_node_ids:
+                self.index.delete_nodes(list(delete_node_ids), delete_from_docstore=True)
+                self._untrack(item_id, delete_node_ids)
+            if insert:
+                tag_nodes(insert, item_id, source_type)
+                self.index.insert_nodes(list(insert))
+                self._track(item_id, source_type, [node.node_id for node in insert])
+            self.persist()
+
+    def remove_item(self, item_id: str):
+        with self._lock:
+            if item_id in self._item_nodes:
+                self.update_item(item_id, "", [], [], replace=True)
+
+    def query_engine(self, item_ids: Sequence[str] | None = None, similarity_top_k: int = 4):
+        """Query engine over the given items (all items when `item_ids` is empty or None)."""
+        filters = None
+        if item_ids:
+            filters = MetadataFilters(
+                filters=[MetadataFilter(key=ITEM_ID_KEY, value=item_id) for item_id in item_ids],
+                condition=FilterCondition.OR,
+            )
+        return self.index.as_query_engine(similarity_top_k=similarity_top_k, filters=filters)
+
+    def migrate_per_item_indexes(self) -> list[str]:
+        """
+        Moves every per-item index under `persist_base_dir` into the shared index, reusing the stored
+        embeddings and node ids (so item manifests stay valid), then deletes the per-item index files.
+        Returns the migrated item ids.
+        """
+        migrated = []
+        for item_dir in sorted(self.persist_base_dir.iterdir()):
+            if item_dir == self.persist_dir or not (item_dir / "docstore.json").exists():
+                continue
+            item_id = item_dir.name
+            storage_context = load_storage_context(str(item_dir))
+            item_index = load_index_from_storage(storage_context)
+            nodes = list(item_index.docstore.docs.values())
+            for node in nodes:
+                node.embedding = item_index.vector_store.get(node.node_id)
+            # URL indexes are built from web pages, which carry no file_path metadata.
+            source_type = "file" if any("file_path" in node.metadata for node in nodes) else "url"
+            self.update_item(item_id, source_type, nodes, [], replace=True)
+            for file_name in _PER_ITEM_INDEX_FILES:
+                try:
+                    os.remove(item_dir / file_name)
+                except FileNotFoundError:
+                    pass
+            migrated.append(item_id)
+            print(f"Shared index: migrated {len(nodes)} node(s) of '{item_id}' ({source_type}).")
+        return migrated
+
+
+_shared_indexes: dict[str, SharedItemIndex] = {}
+_shared_indexes_lock = threading.Lock()
+
+
+def get_shared_item_index(persist_base_dir: Path) -> SharedItemIndex:
+    """Process-wide shared index for `persist_base_dir`; per-item indexes found there are migrated on first use."""
+    key = str(persist_base_dir.resolve())
+    with _shared_indexes_lock:
+        shared = _shared_indexes.get(key)
+        if shared is None:
+            shared = _shared_indexes[key] = SharedItemIndex(persist_base_dir)
+            shared.migrate_per_item_indexes()
+        return shared
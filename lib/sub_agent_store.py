@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+DEFAULT_SUB_AGENT_STORE_PATH = os.getenv("AGENT_SUB_AGENTS_PATH", "sub_agents.json")
+
+
+class SubAgentStore:
+    """
+    Persisted sub-agent definitions: full name ("Parent/Child") -> parent name and system prompt.
+    Agents rebuild their sub-agents from here on demand, so sub-agents created by the LLM survive
+    restarts and are visible to every pooled agent with the same parent name.
+    """
+
+    def __init__(self, path: str = DEFAULT_SUB_AGENT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._definitions: dict[str, dict] = self._load()
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Warning: could not read sub-agent definitions from '{self.path}': {e}. Starting empty.")
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._definitions, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, name: str) -> dict | None:
+        with self._lock:
+            definition = self._definitions.get(name)
+            return dict(definition) if definition is not None else None
+
+    def children(self, parent: str) -> dict[str, str]:
+        """name -> system prompt of the sub-agents defined under `parent`."""
+        with self._lock:
+            return {name: definition["system_prompt"] for name, definition in self._definitions.items()
+                    if definition["parent"] == parent}
+
+    def put(self, name: str, parent: str, system_prompt: str):
+        with self._lock:
+            self._definitions[name] = {
+                "parent": parent,
+                "system_prompt": system_prompt,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            }
+            self._save()
+
+    def remove(self, name: str) -> bool:
+        """Removes a definition and those of its own sub-agents. Returns False if it did not exist."""
+        with self._lock:
+            if name not in self._definitions:
+                return False
+            for child in [child for child in self._definitions if child == name or child.startswith(name + "/")]:
+                del self._definitions[child]
+            self._save()
+            return True
+
+
+_stores: dict[str, SubAgentStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_sub_agent_store(path: str | None = None) -> SubAgentStore:
+    """Process-wide store at `path` (default: AGENT_SUB_AGENTS_PATH)."""
+    path = path or DEFAULT_SUB_AGENT_STORE_PATH
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = SubAgentStore(path)
+        return store
@@ -0,0 +1,23 @@
+import asyncio
+from datetime import datetime, timezone
+
+from ..Server.async_task_store import AsyncTaskStore
+from ..Server.task_store import SqliteTaskStore
+
+
+def test_full_batch_does_not_wait_for_the_commit_delay(tmp_path):
+    asyncio.run(_full_batch_does_not_wait_for_the_commit_delay(tmp_path))
+
+
+async def _full_batch_does_not_wait_for_the_commit_delay(tmp_path):
+    store = SqliteTaskStore(str(tmp_path / "tasks.db"))
+    store.initialize()
+    tasks = AsyncTaskStore(store, commit_delay=60, max_batch_size=2)
+    now = datetime.now(timezone.utc)
+    first = asyncio.create_task(tasks.add_task("t1", "first", now))
+    await asyncio.sleep(0)
+    # The second write fills the batch, so both commit now instead of after the 60s delay.
+    await asyncio.wait_for(asyncio.gather(first, tasks.add_task("t2", "second", now)), timeout=5)
+    assert tasks.batches_committed == 1 and tasks.writes_committed == 2
+    assert store.get_task("t2")['prompt'] == "second"
+    store.close()
@@ -0,0 +1,103 @@
+from ..lib.context_cache import ContextCacheManager, FakeContextCacheBackend
+
+MODEL = "models/gemini-2.0-flash"
+SYSTEM_PROMPT = "You are a helpful assistant that answers questions about loaded documents. " * 100
+TOOLS_FINGERPRINT = '[{"name": "load_url"}, {"name": "query_item_document"}]'
+TTL_SECONDS = 3600.0
+REFRESH_MARGIN_SECONDS = 300.0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def new_manager(min_prefix_tokens: int = 1024):
+    clock = FakeClock()
+    backend = FakeContextCacheBackend(clock)
+    manager = ContextCacheManager(backend, ttl_seconds=TTL_SECONDS, refresh_margin_seconds=REFRESH_MARGIN_SECONDS,
+                                  min_prefix_tokens=min_prefix_tokens, clock=clock)
+    return clock, backend, manager
+
+
+def test_created_once_and_reused():
+    clock, backend, manager = new_manager()
+    first = manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT)
+    for _ in range(9):
+        clock.now += 60
+        assert manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT) is first
+    stats = manager.stats()
+    assert backend.created == 1 and stats["creates"] == 1 and stats["hits"] == 10, stats
+    assert stats["cached_tokens_reused"] == 10 * first.token_count, stats
+
+
+def test_refreshed_before_expiry():
+    clock, backend, manager = new_manager()
+    prefix = manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT)
+    clock.now = prefix.expires_at - REFRESH_MARGIN_SECONDS / 2
+    assert manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT) is prefix
+    assert backend.refreshed == 1 and backend.created == 1
+    assert prefix.expires_at == clock.now + TTL_SECONDS and backend.is_live(prefix.name)
+
+
+def test_recreated_after_expiry():
+    clock, backend, manager = new_manager()
+    prefix = manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT)
+    clock.now = prefix.expires_at + 1
+    renewed = manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT)
+    assert renewed.name != prefix.name and backend.created == 2 and backend.refreshed == 0
+    assert backend.is_live(renewed.name)
+
+
+def test_new_prompt_version_gets_new_cache():
+    clock, backend, manager = new_manager()
+    v1 = manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT)
+    v2 = manager.acquire(MODEL, SYSTEM_PROMPT + " Be concise.", tools_fingerprint=TOOLS_FINGERPRINT)
+    v3 = manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT + "x")
+    assert len({v1.name, v2.name, v3.name}) == 3 and backend.created == 3
+    assert manager.stats()["live_prefixes"] == 3
+
+
+def test_small_prefix_falls_back():
+    clock, backend, manager = new_manager()
+    assert manager.acquire(MODEL, "Short prompt.", tools_fingerprint="[]") is None
+    assert manager.acquire(MODEL, "Short prompt.", tools_fingerprint="[]") is None
+    assert backend.created == 0 and manager.stats()["fallbacks"] == 2
+
+
+def test_large_tools_make_a_small_prompt_cacheable():
+    clock, backend, manager = new_manager()
+    tools = [{"name": f"tool_{i}", "description": "Looks something up in the loaded documents. " * 10}
+             for i in range(20)]
+    # The fingerprint is a short hash; the size check must count the tool declarations themselves.
+    prefix = manager.acquire(MODEL, "Short prompt.", tools=tools, tools_fingerprint="3f2a9c")
+    assert prefix is not None and backend.created == 1
+    assert prefix.token_count >= manager.min_prefix_tokens
+
+
+def test_failed_create_falls_back():
+    clock, backend, manager = new_manager()
+
+    def refuse(*args):
+        raise ValueError("cached content is too small")
+
+    backend.create = refuse
+    assert manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT) is None
+    assert manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT) is None
+    stats = manager.stats()
+    assert stats["failures"] == 1 and stats["fallbacks"] == 1, stats
+
+
+def test_invalidate_and_close():
+    clock, backend, manager = new_manager()
+    prefix = manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT)
+    manager.invalidate(prefix)
+    renewed = manager.acquire(MODEL, SYSTEM_PROMPT, tools_fingerprint=TOOLS_FINGERPRINT)
+    assert renewed is not prefix and manager.stats()["invalidations"] == 1
+    manager.close()
+    assert backend.deleted == 1 and not backend.is_live(renewed.name)
+    assert manager.stats()["live_prefixes"] == 0
+
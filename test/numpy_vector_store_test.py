@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from llama_index.core import MockEmbedding, StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import MetadataFilter, MetadataFilters, VectorStoreQuery
+
+from ..lib.numpy_vector_store import (
+    LEGACY_VECTOR_STORE_FILE_NAME,
+    META_FILE_NAME,
+    VECTORS_FILE_NAME,
+    NumpyVectorStore,
+    load_storage_context,
+)
+
+DIMENSIONS = 16
+# The nodes carry their embeddings, so the model is never asked to embed anything.
+EMBED_MODEL = MockEmbedding(embed_dim=DIMENSIONS)
+
+
+@pytest.fixture
+def nodes():
+    rng = np.random.default_rng(7)
+    return [TextNode(id_=f"node-{i}", text=f"chunk {i}", embedding=rng.normal(size=DIMENSIONS).tolist(),
+                     metadata={"page": i % 4, "file_path": "report.pdf"})
+            for i in range(40)]
+
+
+@pytest.fixture
+def legacy_dir(tmp_path, nodes):
+    """An index persisted the way older versions did, with the default JSON vector store."""
+    storage_context = StorageContext.from_defaults()
+    VectorStoreIndex(nodes, storage_context=storage_context, embed_model=EMBED_MODEL)
+    storage_context.persist(persist_dir=str(tmp_path))
+    return tmp_path
+
+
+def query(store, embedding, filters=None, top_k=5):
+    result = store.query(VectorStoreQuery(query_embedding=embedding, similarity_top_k=top_k, filters=filters))
+    return result.ids, result.similarities
+
+
+def test_legacy_index_is_converted_once(legacy_dir):
+    assert (legacy_dir / LEGACY_VECTOR_STORE_FILE_NAME).exists()
+    assert isinstance(load_storage_context(legacy_dir).vector_store, NumpyVectorStore)
+    assert not (legacy_dir / LEGACY_VECTOR_STORE_FILE_NAME).exists()
+    assert (legacy_dir / META_FILE_NAME).exists()
+
+    matrix = np.load(legacy_dir / VECTORS_FILE_NAME)
+    assert matrix.shape == (40, DIMENSIONS) and matrix.dtype == np.float32
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0, atol=1e-5)
+
+    # A second load memory-maps the converted matrix without rewriting it.
+    mtime = (legacy_dir / VECTORS_FILE_NAME).stat().st_mtime
+    assert isinstance(load_storage_context(legacy_dir).vector_store._vectors, np.memmap)
+    assert (legacy_dir / VECTORS_FILE_NAME).stat().st_mtime == mtime
+
+
+def test_converted_store_answers_like_the_legacy_one(legacy_dir):
+    legacy_store = StorageContext.from_defaults(persist_dir=str(legacy_dir)).vector_store
+    converted = load_storage_context(legacy_dir).vector_store
+    page_two = MetadataFilters(filters=[MetadataFilter(key="page", value=2)])
+    for probe in np.random.default_rng(11).normal(size=(5, DIMENSIONS)).tolist():
+        ids, similarities = query(legacy_store, probe)
+        got_ids, got_similarities = query(converted, probe)
+        assert got_ids == ids
+        assert np.allclose(got_similarities, similarities, atol=1e-5)
+        assert query(converted, probe, filters=page_two)[0] == query(legacy_store, probe, filters=page_two)[0]
+
+
+def test_converted_index_loads_from_storage(legacy_dir, nodes):
+    index = load_index_from_storage(load_storage_context(legacy_dir), embed_model=EMBED_MODEL)
+    assert query(index.vector_store, nodes[3].embedding, top_k=1)[0] == ["node-3"]
+    assert index.docstore.get_node("node-3").text == "chunk 3"
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ..Server.recurrence import CronExpression, next_fire_time, validate_recurrence
+from ..Server.task_store import SqliteTaskStore, to_utc_iso
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def fires(expression, after, count):
+    cron, moments = CronExpression(expression), []
+    for _ in range(count):
+        after = cron.next_after(after)
+        moments.append(after)
+    return moments
+
+
+def test_steps_ranges_and_lists():
+    cron = CronExpression("*/15 9-17/4 1,15 * *")
+    assert cron.minutes == {0, 15, 30, 45}
+    assert cron.hours == {9, 13, 17}
+    assert cron.days_of_month == {1, 15}
+    # "start/step" runs from start to the end of the field.
+    assert CronExpression("5/20 * * * *").minutes == {5, 25, 45}
+    assert CronExpression("0 0 * * 1-5,0").days_of_week == {0, 1, 2, 3, 4, 5}
+    assert fires("*/15 9-17/4 1,15 * *", utc(2025, 3, 1, 17, 40), 3) == [
+        utc(2025, 3, 1, 17, 45), utc(2025, 3, 15, 9, 0), utc(2025, 3, 15, 9, 15)]
+
+
+def test_sunday_is_zero_or_seven():
+    assert CronExpression("0 0 * * 7").days_of_week == {0}
+    # 2025-03-02 is a Sunday.
+    assert CronExpression("0 12 * * 7").next_after(utc(2025, 3, 1)) == utc(2025, 3, 2, 12, 0)
+
+
+def test_day_of_month_or_day_of_week():
+    # 2025-06-06 and 2025-06-13 are Fridays.
+    after = utc(2025, 6, 1)
+    assert fires("0 0 13 * *", after, 2) == [utc(2025, 6, 13), utc(2025, 7, 13)]
+    assert fires("0 0 * * 5", after, 2) == [utc(2025, 6, 6), utc(2025, 6, 13)]
+    # Both restricted: either one matching is enough, as in cron, not "Friday the 13th".
+    assert fires("0 0 13 * 5", after, 4) == [utc(2025, 6, 6), utc(2025, 6, 13), utc(2025, 6, 20), utc(2025, 6, 27)]
+    # A stepped '*' is not a restriction: Mondays that are also odd days, not every odd day or Monday.
+    assert fires("0 9 */2 * 1", after, 3) == [utc(2025, 6, 9, 9, 0), utc(2025, 6, 23, 9, 0), utc(2025, 7, 7, 9, 0)]
+
+
+def test_month_rollover_and_never_firing():
+    assert CronExpression("30 6 31 * *").next_after(utc(2025, 4, 1)) == utc(2025, 5, 31, 6, 30)
+    assert CronExpression("0 0 29 2 *").next_after(utc(2025, 3, 1)) == utc(2028, 2, 29)
+    with pytest.raises(ValueError):
+        CronExpression("0 0 31 2 *").next_after(utc(2025, 1, 1))
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* 24 * * *", "0 0 0 * *",
+                                        "*/0 * * * *", "5-1 * * * *", "a * * * *"])
+def test_invalid_cron_expression(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
+
+
+@pytest.mark.parametrize("cron_expression, interval_seconds", [(None, None), ("* * * * *", 60), (None, 0)])
+def test_exactly_one_valid_rule_required(cron_expression, interval_seconds):
+    with pytest.raises(ValueError):
+        validate_recurrence(cron_expression, interval_seconds)
+
+
+def test_interval_skips_missed_runs_without_drift():
+    previous = utc(2025, 1, 1, 0, 0)
+    assert next_fire_time(None, 600, previous, previous + timedelta(seconds=5)) == utc(2025, 1, 1, 0, 10)
+    # Down for 35 minutes: the missed runs are skipped and the grid stays anchored on the previous fire.
+    assert next_fire_time(None, 600, previous, utc(2025, 1, 1, 0, 35)) == utc(2025, 1, 1, 0, 40)
+    assert next_fire_time(None, 600, previous, utc(2025, 1, 1, 0, 40)) == utc(2025, 1, 1, 0, 50)
+
+
+def test_cron_skips_missed_runs():
+    previous = utc(2025, 1, 1, 9, 0)
+    assert next_fire_time("0 9 * * *", None, previous, utc(2025, 1, 4, 12, 0)) == utc(2025, 1, 5, 9, 0)
+    assert next_fire_time("0 9 * * *", None, previous, previous) == utc(2025, 1, 2, 9, 0)
+
+
+def test_store_fires_a_late_schedule_once(tmp_path):
+    store = SqliteTaskStore(str(tmp_path / "tasks.db"))
+    store.initialize()
+    store.add_schedule("every-10-min", "report", utc(2025, 1, 1, 0, 0), interval_seconds=600)
+    # Down for an hour: one execution for the oldest missed slot, then back on the grid.
+    created = store.materialize_due_schedules(utc(2025, 1, 1, 1, 5))
+    assert len(created) == 1
+    assert created[0]["next_fire_iso"] == to_utc_iso(utc(2025, 1, 1, 1, 10))
+    assert store.materialize_due_schedules(utc(2025, 1, 1, 1, 6)) == []
+    store.close()
@@ -0,0 +1,102 @@
+import os
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from ..Server.result_store import ResultStore
+from ..Server.task_store import SqliteTaskStore
+
+
+@pytest.fixture
+def results(tmp_path):
+    return ResultStore(str(tmp_path / "results"))
+
+
+def test_identical_results_share_one_blob(results):
+    text = "The quarterly report is ready. " * 1000
+    first_hash, size = results.put(text)
+    path = results._path(first_hash)
+    # Storing the same text again refreshes the blob's age instead of writing a copy.
+    os.utime(path, (time.time() - 3600, time.time() - 3600))
+    second_hash, _ = results.put(text)
+    assert first_hash == second_hash
+    assert len(results._blobs()) == 1
+    assert os.path.getmtime(path) > time.time() - 60
+    assert size == len(text.encode("utf-8")) and os.path.getsize(path) < size
+    assert results.get(first_hash) == text
+
+    assert results.put(text + "!")[0] != first_hash
+    assert len(results._blobs()) == 2
+
+
+def test_streamed_chunks_rebuild_the_result(results):
+    # Chunk boundaries fall inside multi-byte characters; the byte stream still joins back exactly.
+    text = "".join(f"line {i}: résumé ✓\n" for i in range(5000))
+    result_hash, size = results.put(text)
+    chunks = list(results.iter_chunks(result_hash, chunk_size=1000))
+    assert len(chunks) > 1 and max(len(chunk) for chunk in chunks) <= 1000
+    assert b"".join(chunks).decode("utf-8") == text and len(b"".join(chunks)) == size
+
+
+def test_missing_result(results):
+    assert results.get("0" * 64) is None
+    assert not results.exists("0" * 64)
+
+
+@pytest.mark.parametrize("bad_hash", ["../../etc/passwd", "ABC", "g" * 64])
+def test_malformed_hash_rejected(results, bad_hash):
+    with pytest.raises(ValueError):
+        results.get(bad_hash)
+
+
+def test_evicts_expired_then_oldest_over_budget(results):
+    results.max_age_seconds = 600
+    now = time.time()
+    hashes = [results.put(f"result {i} " + os.urandom(2000).hex())[0] for i in range(4)]
+    for age, result_hash in zip((7200, 300, 200, 100), hashes):
+        os.utime(results._path(result_hash), (now - age, now - age))
+    assert results.evict() == 1
+    assert not results.exists(hashes[0])
+
+    results.max_total_bytes = sum(os.path.getsize(results._path(h)) for h in hashes[2:])
+    assert results.evict() == 1
+    assert not results.exists(hashes[1])
+    assert all(results.exists(h) for h in hashes[2:])
+    assert results.stats()["evicted"] == 2
+
+
+def test_task_row_keeps_only_the_reference(tmp_path, results):
+    tasks = SqliteTaskStore(str(tmp_path / "tasks.db"))
+    tasks.initialize()
+    assert tasks.supports_result_refs
+    result_hash, size = results.put("long answer " * 10000)
+    for task_id in ("t1", "t2"):
+        tasks.add_task(task_id, "same prompt", datetime.now(timezone.utc))
+        tasks.update_final_status(task_id, "COMPLETED", result_hash=result_hash, result_size=size)
+    for task_id in ("t1", "t2"):
+        task = tasks.get_task(task_id)
+        assert (task['result'], task['result_hash'], task['result_size']) == ("", result_hash, size)
+    assert len(results._blobs()) == 1
+    tasks.close()
+
+
+def test_listing_with_results_resolves_stored_text(tmp_path, results):
+    tasks = SqliteTaskStore(str(tmp_path / "tasks.db"))
+    tasks.initialize()
+    now = datetime.now(timezone.utc)
+    tasks.add_task("done", "summarize", now)
+    tasks.add_task("evicted", "summarize again", now)
+    tasks.add_task("pending", "later", now)
+    # What the server records when a task completes: no inline text, only the reference.
+    for task_id, text in (("done", "the summary"), ("evicted", "an old summary")):
+        result_hash, size = results.put(text)
+        tasks.update_final_status(task_id, "COMPLETED", result_hash=result_hash, result_size=size)
+    os.remove(results._path(tasks.get_task("evicted")['result_hash']))
+
+    page, _ = tasks.query_tasks(include_result=True)
+    by_id = {task['id']: task for task in results.fill_results(page)}
+    assert by_id["done"]['result'] == "the summary"
+    assert by_id["evicted"]['result'] == ""
+    assert by_id["pending"]['result'] == ""
+    tasks.close()
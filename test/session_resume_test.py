@@ -0,0 +1,129 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from llama_index.core.base.llms.types import ChatMessage
+
+from ..Server.agent_pool import AgentSessionPool
+from ..Server.session_checkpoints import SessionCheckpointStore
+from ..Server.task_store import SqliteTaskStore
+
+
+class FakeAgent:
+    """Stands in for Agent: the pool only binds sessions to it."""
+
+    def __init__(self):
+        self.session = None
+
+    def _ensure_pdf_settings_configured(self):
+        pass
+
+
+def suspend(session, seconds: int = 600):
+    session.resume_after_seconds = seconds
+    session.resume_at = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+
+def test_suspend_and_resume(tmp_path):
+    asyncio.run(_suspend_and_resume(tmp_path))
+
+
+async def _suspend_and_resume(tmp_path):
+    checkpoints = SessionCheckpointStore(str(tmp_path / "checkpoints"))
+    pool = AgentSessionPool(FakeAgent, size=1, checkpoint_store=checkpoints)
+    async with pool.acquire("s1") as agent:
+        assert agent.session.suspendable
+        agent.session.memory.put(ChatMessage(role="user", content="wait ten minutes, then report"))
+        agent.session.set_plan("1. wait\n2. report")
+        suspend(agent.session)
+    # Checkpointed and dropped from memory while waiting.
+    assert pool.stats()["sessions"] == 0 and pool.stats()["suspended_sessions"] == 1
+    assert checkpoints.stats()["stored"] == 1
+
+    async with pool.acquire("s1") as agent:
+        assert agent.session.resume_at is not None
+        assert agent.session.memory.get_all()[0].content == "wait ten minutes, then report"
+        assert agent.session.parsed_plan_steps == ["wait", "report"]
+        agent.session.resume_at = None  # What the server does for a resume task.
+    # Resumed without a new wait: the checkpoint is obsolete.
+    assert checkpoints.stats()["stored"] == 0 and pool.stats()["sessions"] == 1
+
+
+def test_not_evicted_while_requests_wait(tmp_path):
+    asyncio.run(_not_evicted_while_requests_wait(tmp_path))
+
+
+async def _not_evicted_while_requests_wait(tmp_path):
+    checkpoints = SessionCheckpointStore(str(tmp_path / "checkpoints-busy"))
+    pool = AgentSessionPool(FakeAgent, size=2, checkpoint_store=checkpoints)
+    first_entered = asyncio.Event()
+    release_first = asyncio.Event()
+
+    async def first():
+        async with pool.acquire("s2") as agent:
+            first_entered.set()
+            await release_first.wait()
+            agent.session.memory.put(ChatMessage(role="user", content="first"))
+            suspend(agent.session)
+
+    async def second():
+        await first_entered.wait()
+        async with pool.acquire("s2") as agent:
+            # Same in-memory session, not a stale copy loaded from disk.
+            return [message.content for message in agent.session.memory.get_all()]
+
+    first_task = asyncio.create_task(first())
+    second_task = asyncio.create_task(second())
+    await first_entered.wait()
+    await asyncio.sleep(0.01)
+    release_first.set()
+    await first_task
+    assert await second_task == ["first"]
+    # Still waiting for its resume, so it stays checkpointed.
+    assert checkpoints.stats()["stored"] == 1
+
+
+def test_ephemeral_session_resumes_by_id(tmp_path):
+    asyncio.run(_ephemeral_session_resumes_by_id(tmp_path))
+
+
+async def _ephemeral_session_resumes_by_id(tmp_path):
+    checkpoints = SessionCheckpointStore(str(tmp_path / "checkpoints-ephemeral"))
+    pool = AgentSessionPool(FakeAgent, size=1, checkpoint_store=checkpoints)
+    async with pool.acquire(None) as agent:
+        session_id = agent.session.session_id
+        agent.session.memory.put(ChatMessage(role="user", content="one-off"))
+        suspend(agent.session)
+    async with pool.acquire(session_id) as agent:
+        assert agent.session.memory.get_all()[0].content == "one-off"
+
+
+def test_sub_agent_sessions_follow_the_conversation(tmp_path):
+    asyncio.run(_sub_agent_sessions_follow_the_conversation(tmp_path))
+
+
+async def _sub_agent_sessions_follow_the_conversation(tmp_path):
+    checkpoints = SessionCheckpointStore(str(tmp_path / "checkpoints-sub-agents"))
+    pool = AgentSessionPool(FakeAgent, size=1, checkpoint_store=checkpoints)
+    async with pool.acquire("user-a") as agent:
+        agent.session.sub_agent_session("Main_Agent/Researcher").memory.put(ChatMessage(role="user", content="a's task"))
+        suspend(agent.session)
+    async with pool.acquire("user-b") as agent:
+        # The same pooled agent serves another conversation: its sub-agent starts empty.
+        assert agent.session.sub_agent_session("Main_Agent/Researcher").memory.get_all() == []
+    async with pool.acquire("user-a") as agent:
+        # Restored from the checkpoint together with the parent session.
+        sub_messages = agent.session.sub_agent_session("Main_Agent/Researcher").memory.get_all()
+        assert [message.content for message in sub_messages] == ["a's task"]
+
+
+def test_resume_task_keeps_session_id(tmp_path):
+    store = SqliteTaskStore(str(tmp_path / "tasks.db"))
+    store.initialize()
+    task_id = str(uuid.uuid4())
+    store.add_task(task_id, "resume", datetime.now(timezone.utc) - timedelta(seconds=1), session_id="s1")
+    store.add_task(str(uuid.uuid4()), "plain", datetime.now(timezone.utc) - timedelta(seconds=1))
+    claimed = {task['prompt']: task for task in store.claim_due_tasks(datetime.now(timezone.utc), worker_id="w")}
+    assert claimed["resume"]["session_id"] == "s1" and claimed["plain"]["session_id"] == ""
+    store.close()
+
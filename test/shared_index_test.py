@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from llama_index.core import MockEmbedding, Settings
+from llama_index.core.schema import TextNode
+
+from ..lib.shared_index import SharedItemIndex
+
+DIMENSIONS = 8
+
+
+@pytest.fixture(autouse=True)
+def offline_embed_model(monkeypatch):
+    # The nodes carry their embeddings; this only keeps llama_index from resolving a remote default.
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=DIMENSIONS))
+
+
+def make_nodes(prefix, count):
+    rng = np.random.default_rng(len(prefix) + count)
+    return [TextNode(id_=f"{prefix}-{i}", text=f"{prefix} chunk {i}", embedding=rng.normal(size=DIMENSIONS).tolist())
+            for i in range(count)]
+
+
+def test_item_lookups_follow_inserts_and_deletes(tmp_path):
+    shared = SharedItemIndex(tmp_path)
+    shared.update_item("report", "file", make_nodes("report", 3), [])
+    shared.update_item("site", "url", make_nodes("site", 2), [])
+    assert shared.items() == {"report": "file", "site": "url"}
+    assert sorted(shared.item_node_ids("report")) == ["report-0", "report-1", "report-2"]
+
+    shared.update_item("report", "file", [], ["report-0"])
+    assert sorted(shared.item_node_ids("report")) == ["report-1", "report-2"]
+    shared.remove_item("site")
+    assert not shared.has_item("site") and shared.items() == {"report": "file"}
+    assert shared.item_node_ids("site") == []
+
+
+def test_replace_persists_once(tmp_path, monkeypatch):
+    shared = SharedItemIndex(tmp_path)
+    shared.update_item("report", "file", make_nodes("old", 3), [])
+    persists = []
+    monkeypatch.setattr(shared, "persist", lambda: persists.append(1))
+    shared.update_item("report", "file", make_nodes("new", 2), [], replace=True)
+    assert len(persists) == 1
+    assert sorted(shared.item_node_ids("report")) == ["new-0", "new-1"]
+    assert sorted(shared.index.docstore.docs) == ["new-0", "new-1"]
+
+
+def test_lookups_rebuilt_on_reload(tmp_path):
+    shared = SharedItemIndex(tmp_path)
+    shared.update_item("report", "file", make_nodes("report", 3), [])
+    shared.update_item("site", "url", make_nodes("site", 1), [])
+    reloaded = SharedItemIndex(tmp_path)
+    assert reloaded.items() == {"report": "file", "site": "url"}
+    assert sorted(reloaded.item_node_ids("report")) == ["report-0", "report-1", "report-2"]
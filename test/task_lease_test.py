@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ..Server.task_store import SqliteTaskStore
+
+NOW = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+LEASE_SECONDS = 60
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteTaskStore(str(tmp_path / "tasks.db"))
+    store.initialize()
+    yield store
+    store.close()
+
+
+def claim(store, worker_id, now, max_attempts=3):
+    tasks = store.claim_due_tasks(now, worker_id=worker_id, lease_seconds=LEASE_SECONDS, max_attempts=max_attempts)
+    return [task['id'] for task in tasks]
+
+
+def test_claimed_once_and_renewed_only_by_its_owner(store):
+    store.add_task("t1", "due", NOW - timedelta(seconds=1))
+    store.add_task("t2", "later", NOW + timedelta(hours=1))
+    assert claim(store, "a", NOW) == ["t1"]
+    assert claim(store, "b", NOW + timedelta(seconds=30)) == []
+    task = store.get_task("t1")
+    assert (task['status'], task['worker_id'], task['attempts']) == ("RUNNING", "a", 1)
+
+    assert store.renew_leases("b", ["t1"], NOW + timedelta(seconds=30), lease_seconds=LEASE_SECONDS) == []
+    assert store.renew_leases("a", ["t1"], NOW + timedelta(seconds=30), lease_seconds=LEASE_SECONDS) == ["t1"]
+    # Renewed at +30s, so the lease still holds at +80s.
+    assert claim(store, "b", NOW + timedelta(seconds=80)) == []
+
+
+def test_expired_lease_is_reclaimed_and_the_stale_result_discarded(store):
+    store.add_task("t1", "due", NOW)
+    assert claim(store, "a", NOW) == ["t1"]
+    assert claim(store, "b", NOW + timedelta(seconds=LEASE_SECONDS + 1)) == ["t1"]
+    task = store.get_task("t1")
+    assert (task['worker_id'], task['attempts']) == ("b", 2)
+
+    assert store.renew_leases("a", ["t1"], NOW + timedelta(seconds=90), lease_seconds=LEASE_SECONDS) == []
+    store.update_final_status("t1", "COMPLETED", result="from a", worker_id="a")
+    assert store.get_task("t1")['status'] == "RUNNING"
+    store.update_final_status("t1", "COMPLETED", result="from b", worker_id="b")
+    task = store.get_task("t1")
+    assert (task['status'], task['result']) == ("COMPLETED", "from b")
+
+
+def test_expired_lease_past_the_attempt_budget_fails_the_task(store):
+    store.add_task("t1", "crashes its worker", NOW)
+    now = NOW
+    for worker_id in ("a", "b"):
+        assert claim(store, worker_id, now, max_attempts=2) == ["t1"]
+        now += timedelta(seconds=LEASE_SECONDS + 1)
+    assert claim(store, "c", now, max_attempts=2) == []
+    task = store.get_task("t1")
+    assert task['status'] == "FAILED"
+    assert "2 attempt(s)" in task['error_message']
+
+
+def test_next_scheduled_time_ignores_the_callers_own_leases(store):
+    store.add_task("t1", "due", NOW)
+    store.add_task("t2", "later", NOW + timedelta(hours=1))
+    assert claim(store, "a", NOW) == ["t1"]
+    lease_expiry = NOW + timedelta(seconds=LEASE_SECONDS)
+    assert store.next_scheduled_time(worker_id="a") == NOW + timedelta(hours=1)
+    assert store.next_scheduled_time(worker_id="b") == lease_expiry
+    assert store.next_scheduled_time() == lease_expiry
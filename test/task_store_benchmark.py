@@ -0,0 +1,103 @@
+# task_store_benchmark.py
+# Measures how task-store writes affect the latency of concurrent requests on the event loop.
+# Run as a module from the directory above the project, e.g.:
+#   python -m Backend.test.task_store_benchmark
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from ..Server.task_store import SqliteTaskStore
+from ..Server.async_task_store import AsyncTaskStore
+from ..lib.metrics import LatencyRecorder
+
+WRITERS = 50  # Concurrent clients calling /schedule_task
+WRITES_PER_WRITER = 40
+READ_INTERVAL_SECONDS = 0.002  # A dashboard-style GET /tasks issued this often during the run
+PROBE_INTERVAL_SECONDS = 0.001  # A no-op request; its extra delay is what every in-flight request pays
+PRELOADED_TASKS = 20000  # History already in the table
+
+
+def preload(store: SqliteTaskStore):
+    now = datetime.now(timezone.utc)
+    store.apply_writes([
+        ("add_task", (str(uuid.uuid4()), "historical prompt", now - timedelta(minutes=i)), {})
+        for i in range(PRELOADED_TASKS)
+    ])
+
+
+async def run_scenario(name: str, use_async_store: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sync_store = SqliteTaskStore(os.path.join(tmp_dir, "bench.db"))
+        sync_store.initialize()
+        preload(sync_store)
+        async_store = AsyncTaskStore(sync_store) if use_async_store else None
+        read_latency = LatencyRecorder(window=100000)
+        loop_stall = LatencyRecorder(window=100000)
+        writes_done = asyncio.Event()
+
+        # Old behaviour: blocking calls made directly inside async endpoints.
+        async def schedule(task_id: str, when: datetime):
+            if async_store:
+                await async_store.add_task(task_id, "benchmark prompt", when)
+                await async_store.update_final_status(task_id, "COMPLETED", result="ok")
+            else:
+                sync_store.add_task(task_id, "benchmark prompt", when)
+                sync_store.update_final_status(task_id, "COMPLETED", result="ok")
+
+        async def writer():
+            for _ in range(WRITES_PER_WRITER):
+                await schedule(str(uuid.uuid4()), datetime.now(timezone.utc) + timedelta(hours=1))
+                await asyncio.sleep(0)
+
+        async def reader():
+            while not writes_done.is_set():
+                started = time.perf_counter()
+                if async_store:
+                    await async_store.query_tasks(status="PENDING", limit=50)
+                else:
+                    sync_store.query_tasks(status="PENDING", limit=50)
+                read_latency.record(time.perf_counter() - started)
+                await asyncio.sleep(READ_INTERVAL_SECONDS)
+
+        async def probe():
+            while not writes_done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+                loop_stall.record(max(0.0, time.perf_counter() - started - PROBE_INTERVAL_SECONDS))
+
+        started = time.perf_counter()
+        background = [asyncio.create_task(reader()), asyncio.create_task(probe())]
+        await asyncio.gather(*(writer() for _ in range(WRITERS)))
+        elapsed = time.perf_counter() - started
+        writes_done.set()
+        await asyncio.gather(*background)
+        if async_store:
+            print(f"[{name}] group commit: {async_store.stats()}")
+            await async_store.close()
+        else:
+            sync_store.close()
+
+    total_writes = WRITERS * WRITES_PER_WRITER * 2
+    print(f"[{name}] {total_writes} writes in {elapsed:.2f}s ({total_writes / elapsed:.0f} writes/s)")
+    for label, recorder in (("GET /tasks latency", read_latency), ("event-loop stall per request", loop_stall)):
+        snapshot = recorder.snapshot()
+        print(f"[{name}] {label} over {snapshot['count']} samples: "
+              f"p50={snapshot['p50_seconds'] * 1000:.2f}ms p99={snapshot['p99_seconds'] * 1000:.2f}ms "
+              f"max={snapshot['max_seconds'] * 1000:.2f}ms")
+    return loop_stall.snapshot()
+
+
+async def main():
+    print("=== Task store benchmark ===")
+    print(f"{WRITERS} concurrent writers x {WRITES_PER_WRITER} schedule+complete pairs, "
+          f"{PRELOADED_TASKS} historical tasks.\n")
+    await run_scenario("blocking store on event loop", use_async_store=False)
+    print()
+    await run_scenario("AsyncTaskStore (I/O thread + group commit)", use_async_store=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,24 @@
+import asyncio
+
+from ..Server.worker_pool import AgentWorkerPool
+
+
+def test_idle_capacity_counts_busy_workers_and_queued_jobs():
+    async def scenario():
+        pool = AgentWorkerPool(max_concurrency=2, max_queue_size=10)
+        await pool.start()
+        release = asyncio.Event()
+        assert pool.idle_capacity() == 2
+
+        futures = [pool.submit(release.wait) for _ in range(3)]
+        await asyncio.sleep(0)
+        # Both workers busy and one job waiting: nothing would start now, though the queue has room.
+        assert pool.idle_capacity() == 0
+        assert pool.available_capacity() == 9
+
+        release.set()
+        await asyncio.gather(*futures)
+        assert pool.idle_capacity() == 2
+        await pool.stop()
+
+    asyncio.run(scenario())